@@ -1,20 +1,113 @@
+import argparse
 import paho.mqtt.client as mqtt
 import time
 from typing import List, Dict, Any, Optional, Callable, Union
+import signal
 import sys
 import threading
-from uuid import uuid4
-
-# Global variables to track message receipt
-received_messages: Dict[str, List[str]] = {
-    "task4": [],
-    "task5_single": [],
-    "task5_multi": [],
-    "task6": [],
-    "task7": [],
-    "task8": []
+
+from mqtt_broker import EmbeddedBroker
+from mqtt_bulk_publisher import BulkPublisher
+from mqtt_aliases import enable_topic_aliases
+from mqtt_batch import batched, unbatching
+from mqtt_clients import connect_client, connect_options, create_client
+from mqtt_codec import CODECS, PayloadCodec, get_codec
+from mqtt_dedupe import FILTERS, make_deduplicator
+from mqtt_journal import JournalWriter
+from mqtt_lastvalue import LastValueCache
+from mqtt_pool import ClientPool, PoolKey
+import mqtt_output as out
+import mqtt_profiling as profiling
+from mqtt_reconnect import ReconnectManager
+import mqtt_wire as wire
+from mqtt_scenarios import RunScope, ScenarioRunner, print_scenario_report
+from mqtt_store import ReceiveStore
+from mqtt_topics import TopicDispatcher, TopicTrie, expected_recipients
+from mqtt_waiters import CompletionTracker, print_wait_report, scaled_timeout, session_present
+
+# Broker address used by every task (overridden by command line options)
+BROKER_HOST = "localhost"
+BROKER_PORT = 1883
+
+# Protocol of the task1 clients and the task6-task8 publishers; MQTT 5
+# publishers send hot topics as topic aliases
+MQTT_PROTOCOL = mqtt.MQTTv311
+
+# Receive Maximum the task1 subscriber asks for under MQTT 5 (None: broker default)
+RECEIVE_MAXIMUM: Optional[int] = None
+
+# Number of messages published while the subscriber is offline in task6-task8
+MESSAGE_COUNT = 20
+
+# Encoding of the Sensor/Temp readings in task6-task8 (see mqtt_codec)
+PAYLOAD_CODEC: PayloadCodec = CODECS["text"]
+
+# Readings packed into one batch payload by the task6-task8 publishers (None:
+# one PUBLISH per reading), optionally zlib compressed; the subscribers unpack
+# batches transparently either way
+BATCH_SIZE: Optional[int] = None
+BATCH_COMPRESS = False
+
+# Duplicate suppression in front of task6's on_message: None, "lru" or "bloom",
+# keyed by the readings' "sequence" number or a hash of their "content"
+DEDUPE_FILTER: Optional[str] = None
+DEDUPE_KEY = "sequence"
+
+# Namespace for the topics of task3-task8 and the fixed client IDs of task6-task8
+RUN_SCOPE = RunScope()
+
+# Most recent messages kept per task; older ones are evicted, counts are not
+RECEIVE_CAPACITY = 10_000
+
+# Connected publishers lent to task6-task8 (see create_pooled_publisher below)
+CLIENT_POOL = ClientPool(factory=lambda key: create_pooled_publisher(key))
+
+# Reconnects the task6-task8 subscribers in place and records each reconnect
+RECONNECTS = ReconnectManager()
+
+# Global store of received messages, one bounded ring per task
+received_messages = ReceiveStore(
+    ["task4", "task5_single", "task5_multi", "task6", "task7", "task8"],
+    capacity=RECEIVE_CAPACITY,
+)
+
+# Latest payload per topic seen by the task5 subscribers, queryable by topic filter
+last_values = LastValueCache()
+
+# Completion trackers signalled alongside each received_messages ring
+message_trackers: Dict[str, CompletionTracker] = {
+    key: CompletionTracker(key) for key in received_messages
 }
 
+def instrument(client: mqtt.Client, scenario: str) -> mqtt.Client:
+    """Attach the enabled wire and callback instrumentation to a task's client."""
+    return profiling.instrument(wire.instrument(client, scenario), scenario)
+
+
+def set_scenario(client: mqtt.Client, scenario: str) -> None:
+    """Attribute a shared client's further traffic and callbacks to `scenario`."""
+    wire.set_scenario(client, scenario)
+    profiling.set_scenario(client, scenario)
+
+
+def create_publisher(role: str,
+                     client_id: Optional[str] = None,
+                     clean_session: bool = True,
+                     protocol: Optional[int] = None) -> mqtt.Client:
+    """A publisher in `protocol` (MQTT_PROTOCOL by default), using topic aliases under MQTT 5."""
+    protocol = MQTT_PROTOCOL if protocol is None else protocol
+    publisher = create_client(role, clean_session=clean_session, client_id=client_id, protocol=protocol)
+    if protocol == mqtt.MQTTv5:
+        enable_topic_aliases(publisher)
+    return publisher
+
+
+def create_pooled_publisher(key: PoolKey) -> mqtt.Client:
+    """Client factory of CLIENT_POOL; handshakes are counted under the "pool" scenario."""
+    publisher = create_publisher("publisher", clean_session=key.clean_session, protocol=key.protocol)
+    return instrument(publisher, "pool")
+
+
 def task1() -> tuple[mqtt.Client, mqtt.Client]:
     """
     Task 1: Create two MQTT clients - publisher and subscriber.
@@ -22,22 +115,16 @@ def task1() -> tuple[mqtt.Client, mqtt.Client]:
     Returns:
         tuple: (publisher_client, subscriber_client)
     """
-    print("\n--- Task 1: Creating MQTT Clients ---")
-    
-    # Create publisher
-    publisher = mqtt.Client(
-        client_id=f"publisher-{uuid4().hex[:8]}",  # Generate unique ID
-        clean_session=True                         # New session each time
-    )
+    out.info("\n--- Task 1: Creating MQTT Clients ---")
     
-    # Create subscriber
-    subscriber = mqtt.Client(
-        client_id=f"subscriber-{uuid4().hex[:8]}",  # Generate unique ID
-        clean_session=True                          # New session each time
-    )
+    # Create publisher and subscriber with unique IDs and a new session each time
+    publisher = instrument(create_publisher("publisher"), "task1")
+    subscriber = instrument(create_client("subscriber", clean_session=True,
+                                          protocol=MQTT_PROTOCOL,
+                                          receive_maximum=RECEIVE_MAXIMUM), "task1")
     
-    print(f"Publisher client created with ID: {publisher._client_id.decode()}")
-    print(f"Subscriber client created with ID: {subscriber._client_id.decode()}")
+    out.info(f"Publisher client created with ID: {publisher._client_id.decode()}")
+    out.info(f"Subscriber client created with ID: {subscriber._client_id.decode()}")
     
     return publisher, subscriber
 
@@ -49,31 +136,37 @@ def task2(publisher: mqtt.Client) -> None:
     Args:
         publisher: MQTT publisher client
     """
-    print("\n--- Task 2: Connect Publisher to Broker ---")
+    out.info("\n--- Task 2: Connect Publisher to Broker ---")
+    set_scenario(publisher, "task2")
+    
+    tracker = CompletionTracker("task2")
     
     # Define the on_connect callback function
     def on_connect(client: mqtt.Client, 
                   userdata: Any, 
                   flags: Dict[str, bool], 
-                  rc: int) -> None:
-        """Callback when client connects to broker."""
+                  rc: int,
+                  properties: Any = None) -> None:
+        """Callback when client connects to broker (MQTT 5 adds the CONNACK properties)."""
         if rc == 0:
-            print(f"Connected to broker with result code {rc}")
-            session_present = flags.get('session_present', False)
-            print(f"Session present flag: {session_present}")
+            out.info(f"Connected to broker with result code {rc}")
+            out.info(f"Session present flag: {session_present(flags)}")
         else:
-            print(f"Failed to connect: {rc}")
+            out.error(f"Failed to connect: {rc}")
+        tracker.connack_received(rc, flags)
     
     # Set the callback
     publisher.on_connect = on_connect
     
     # Connect to broker with error handling
     try:
-        publisher.connect(host="localhost", port=1883, keepalive=60)
-        publisher.loop_start()
-        time.sleep(1)  # Give time for connection to establish
+        # Returns as soon as CONNACK arrives
+        if not connect_client(publisher, tracker, BROKER_HOST, BROKER_PORT, keepalive=60):
+            raise RuntimeError("no CONNACK from the broker")
     except Exception as e:
-        print(f"Error connecting to broker: {e}")
+        out.error(f"Error connecting to broker: {e}")
+        # Fail the scenario so the runner skips its dependents
+        raise
 
 
 def task3(subscriber: mqtt.Client) -> None:
@@ -83,54 +176,69 @@ def task3(subscriber: mqtt.Client) -> None:
     Args:
         subscriber: MQTT subscriber client
     """
-    print("\n--- Task 3: Connect Subscriber and Make Subscription ---")
+    out.info("\n--- Task 3: Connect Subscriber and Make Subscription ---")
+    set_scenario(subscriber, "task3")
+    
+    tracker = CompletionTracker("task3")
     
     # Define on_connect callback
     def on_connect(client: mqtt.Client, 
                   userdata: Any, 
                   flags: Dict[str, bool], 
-                  rc: int) -> None:
-        """Callback when client connects to broker."""
+                  rc: int,
+                  properties: Any = None) -> None:
+        """Callback when client connects to broker (MQTT 5 adds the CONNACK properties)."""
         if rc == 0:
-            print(f"Subscriber connected to broker with result code {rc}")
-            session_present = flags.get('session_present', False)
-            print(f"Session present flag: {session_present}")
+            out.info(f"Subscriber connected to broker with result code {rc}")
+            out.info(f"Session present flag: {session_present(flags)}")
             
             # Subscribe to the topic after successful connection
-            client.subscribe("CyberSec/IKT520", qos=1)
+            client.subscribe(RUN_SCOPE.topic("CyberSec/IKT520"), qos=1)
         else:
-            print(f"Subscriber failed to connect: {rc}")
+            out.error(f"Subscriber failed to connect: {rc}")
+        tracker.connack_received(rc, flags)
     
     # Define on_subscribe callback
     def on_subscribe(client: mqtt.Client, 
                     userdata: Any, 
                     mid: int, 
-                    granted_qos: List[int]) -> None:
-        """Callback when broker confirms subscription."""
-        print(f"Subscribed with message ID {mid}, granted QoS: {granted_qos}")
+                    granted_qos: List[int],
+                    properties: Any = None) -> None:
+        """Callback when broker confirms subscription (MQTT 5: reason codes and properties)."""
+        out.info(f"Subscribed with message ID {mid}, granted QoS: {granted_qos}")
+        tracker.suback_received()
     
     # Define on_message callback
     def on_message(client: mqtt.Client, 
                   userdata: Any, 
                   msg: mqtt.MQTTMessage) -> None:
         """Callback when message is received."""
-        print(f"Received message: '{msg.payload.decode()}' on topic '{msg.topic}'")
-        # Add to appropriate tracking list
-        if msg.topic == "CyberSec/IKT520":
-            received_messages["task4"].append(msg.payload.decode())
+        # Only decode the payload when the line will actually be written
+        if out.enabled(out.MESSAGE):
+            out.message("Received message: '{}' on topic '{}'", msg.payload.decode(), msg.topic,
+                        topic=msg.topic)
+        # Add to the task 4 tracking list
+        received_messages["task4"].append(msg.topic, msg.payload, msg.qos)
+        message_trackers["task4"].message_received()
+    
+    # Route messages to handlers by topic filter
+    dispatcher = TopicDispatcher()
+    dispatcher.add(RUN_SCOPE.topic("CyberSec/IKT520"), on_message)
     
     # Set the callbacks
     subscriber.on_connect = on_connect
     subscriber.on_subscribe = on_subscribe
-    subscriber.on_message = on_message
+    subscriber.on_message = dispatcher
     
     # Connect to broker
     try:
-        subscriber.connect(host="localhost", port=1883, keepalive=60)
-        subscriber.loop_start()
-        time.sleep(2)  # Give time for connection and subscription
+        # Wait for the connection and the subscription to be acknowledged
+        if not connect_client(subscriber, tracker, BROKER_HOST, BROKER_PORT,
+                              keepalive=60, wait_suback=True):
+            raise RuntimeError("no CONNACK or SUBACK from the broker")
     except Exception as e:
-        print(f"Error connecting subscriber: {e}")
+        out.error(f"Error connecting subscriber: {e}")
+        raise
 
 
 def task4(publisher: mqtt.Client) -> None:
@@ -140,13 +248,15 @@ def task4(publisher: mqtt.Client) -> None:
     Args:
         publisher: MQTT publisher client
     """
-    print("\n--- Task 4: Publish Message ---")
+    out.info("\n--- Task 4: Publish Message ---")
+    set_scenario(publisher, "task4")
     
     # Define parameters
-    topic = "CyberSec/IKT520"
+    topic = RUN_SCOPE.topic("CyberSec/IKT520")
     payload = "Hello MQTT World!"
     qos = 1
     retain = False
+    tracker = message_trackers["task4"]
     
     # Publish the message
     try:
@@ -157,22 +267,23 @@ def task4(publisher: mqtt.Client) -> None:
             retain=retain
         )
         
-        # Wait for message to be sent
-        info.wait_for_publish()
+        # Wait for the PUBACK
+        tracker.wait_published([info])
         
-        print(f"Published message '{payload}' to topic '{topic}'")
+        out.info(f"Published message '{payload}' to topic '{topic}'")
         
-        # Wait to see if message is received
-        time.sleep(2)
+        # Wait until the subscriber has seen the message
+        tracker.wait_messages(1)
         
         if received_messages["task4"]:
-            print(f"Subscriber received {len(received_messages['task4'])} messages:")
+            out.info(f"Subscriber received {received_messages['task4'].total} messages:")
             for msg in received_messages["task4"]:
-                print(f"  - {msg}")
+                out.info(f"  - {msg.text()}")
         else:
-            print("No messages received by subscriber")
+            out.info("No messages received by subscriber")
     except Exception as e:
-        print(f"Error publishing message: {e}")
+        out.error(f"Error publishing message: {e}")
+        raise
 
 
 def task5(publisher: mqtt.Client) -> None:
@@ -182,67 +293,91 @@ def task5(publisher: mqtt.Client) -> None:
     Args:
         publisher: MQTT publisher client
     """
-    print("\n--- Task 5: Wildcard Subscriptions ---")
+    out.info("\n--- Task 5: Wildcard Subscriptions ---")
+    set_scenario(publisher, "task5")
     
     # Create two subscribers for wildcard topics
-    single_wildcard = mqtt.Client(client_id=f"single-wildcard-{uuid4().hex[:8]}")
-    multi_wildcard = mqtt.Client(client_id=f"multi-wildcard-{uuid4().hex[:8]}")
+    single_wildcard = instrument(create_client("single-wildcard", protocol=MQTT_PROTOCOL,
+                                               receive_maximum=RECEIVE_MAXIMUM), "task5")
+    multi_wildcard = instrument(create_client("multi-wildcard", protocol=MQTT_PROTOCOL,
+                                              receive_maximum=RECEIVE_MAXIMUM), "task5")
+    single_tracker = message_trackers["task5_single"]
+    multi_tracker = message_trackers["task5_multi"]
+    
+    # Each subscriber's filter, keyed by its received_messages ring; the trie
+    # tells which subscribers a published topic should reach
+    subscriptions = {
+        "task5_single": RUN_SCOPE.topic("Sensors/+/Temperature"),
+        "task5_multi": RUN_SCOPE.topic("Sensors/#"),
+    }
     
     # Define on_connect for single-level wildcard subscriber
     def on_connect_single(client: mqtt.Client, 
                          userdata: Any, 
                          flags: Dict[str, bool], 
-                         rc: int) -> None:
+                         rc: int,
+                         properties: Any = None) -> None:
+        single_tracker.connack_received(rc, flags)
         if rc == 0:
-            print("Single-level wildcard subscriber connected")
+            out.info("Single-level wildcard subscriber connected")
             # Subscribe with single-level wildcard (+)
-            client.subscribe("Sensors/+/Temperature", qos=1)
-            print("Subscribed to: Sensors/+/Temperature")
+            client.subscribe(subscriptions["task5_single"], qos=1)
+            out.info("Subscribed to: Sensors/+/Temperature")
         else:
-            print(f"Single-level wildcard subscriber failed to connect: {rc}")
+            out.error(f"Single-level wildcard subscriber failed to connect: {rc}")
     
     # Define on_connect for multi-level wildcard subscriber
     def on_connect_multi(client: mqtt.Client, 
                         userdata: Any, 
                         flags: Dict[str, bool], 
-                        rc: int) -> None:
+                        rc: int,
+                        properties: Any = None) -> None:
+        multi_tracker.connack_received(rc, flags)
         if rc == 0:
-            print("Multi-level wildcard subscriber connected")
+            out.info("Multi-level wildcard subscriber connected")
             # Subscribe with multi-level wildcard (#)
-            client.subscribe("Sensors/#", qos=1)
-            print("Subscribed to: Sensors/#")
+            client.subscribe(subscriptions["task5_multi"], qos=1)
+            out.info("Subscribed to: Sensors/#")
         else:
-            print(f"Multi-level wildcard subscriber failed to connect: {rc}")
+            out.error(f"Multi-level wildcard subscriber failed to connect: {rc}")
     
-    # Define on_message for single-level wildcard subscriber
-    def on_message_single(client: mqtt.Client, 
-                         userdata: Any, 
-                         msg: mqtt.MQTTMessage) -> None:
-        print(f"SINGLE-WILDCARD received: '{msg.payload.decode()}' on '{msg.topic}'")
-        received_messages["task5_single"].append(f"{msg.topic}: {msg.payload.decode()}")
+    recipients = TopicTrie()
+    for key, topic_filter in subscriptions.items():
+        recipients.add(topic_filter, key)
+    labels = {"task5_single": "SINGLE-WILDCARD", "task5_multi": "MULTI-WILDCARD"}
     
-    # Define on_message for multi-level wildcard subscriber
-    def on_message_multi(client: mqtt.Client, 
-                        userdata: Any, 
-                        msg: mqtt.MQTTMessage) -> None:
-        print(f"MULTI-WILDCARD received: '{msg.payload.decode()}' on '{msg.topic}'")
-        received_messages["task5_multi"].append(f"{msg.topic}: {msg.payload.decode()}")
+    # Shared on_message; userdata is the subscriber's received_messages key
+    def on_message(client: mqtt.Client, 
+                   userdata: str, 
+                   msg: mqtt.MQTTMessage) -> None:
+        if out.enabled(out.MESSAGE):
+            out.message("{} received: '{}' on '{}'", labels[userdata], msg.payload.decode(), msg.topic,
+                        topic=msg.topic)
+        received_messages[userdata].append(msg.topic, msg.payload, msg.qos)
+        last_values.update(msg.topic, msg.payload)
+        message_trackers[userdata].message_received()
     
     # Set callbacks
+    single_wildcard.user_data_set("task5_single")
     single_wildcard.on_connect = on_connect_single
-    single_wildcard.on_message = on_message_single
+    single_wildcard.on_subscribe = lambda *args: single_tracker.suback_received()
+    single_wildcard.on_message = on_message
+    multi_wildcard.user_data_set("task5_multi")
     multi_wildcard.on_connect = on_connect_multi
-    multi_wildcard.on_message = on_message_multi
+    multi_wildcard.on_subscribe = lambda *args: multi_tracker.suback_received()
+    multi_wildcard.on_message = on_message
     
     # Connect and start loops
     try:
-        single_wildcard.connect(host="localhost", port=1883)
-        multi_wildcard.connect(host="localhost", port=1883)
+        single_wildcard.connect(host=BROKER_HOST, port=BROKER_PORT, **connect_options(single_wildcard))
+        multi_wildcard.connect(host=BROKER_HOST, port=BROKER_PORT, **connect_options(multi_wildcard))
         single_wildcard.loop_start()
         multi_wildcard.loop_start()
         
-        # Wait for connections
-        time.sleep(2)
+        # Wait for both subscriptions to be acknowledged
+        for tracker in (single_tracker, multi_tracker):
+            if tracker.wait_connack():
+                tracker.wait_suback()
         
         # Publish messages to different topics
         test_topics = [
@@ -253,26 +388,48 @@ def task5(publisher: mqtt.Client) -> None:
             ("Sensors/Kitchen/Temperature/Indoor", "24C"),
             ("Weather/Outside/Temperature", "15C")
         ]
+        test_topics = [(RUN_SCOPE.topic(topic), payload) for topic, payload in test_topics]
         
+        infos = []
         for topic, payload in test_topics:
-            publisher.publish(topic=topic, payload=payload, qos=1)
-            print(f"Published '{payload}' to '{topic}'")
-            time.sleep(0.5)
+            infos.append(publisher.publish(topic=topic, payload=payload, qos=1))
+            out.info(f"Published '{payload}' to '{topic}'")
+        single_tracker.wait_published(infos)
         
-        # Wait for all messages to be received
-        time.sleep(2)
+        # Wait until each subscriber has received what its filter matches
+        expected = expected_recipients(recipients, (topic for topic, _ in test_topics))
+        for key in subscriptions:
+            message_trackers[key].wait_messages(len(expected.get(key, [])))
         
         # Print results
-        print("\nSingle-level wildcard (+) subscription results:")
+        out.info("\nSingle-level wildcard (+) subscription results:")
         for msg in received_messages["task5_single"]:
-            print(f"  - {msg}")
+            out.info(f"  - {msg.topic}: {msg.text()}")
         
-        print("\nMulti-level wildcard (#) subscription results:")
+        out.info("\nMulti-level wildcard (#) subscription results:")
         for msg in received_messages["task5_multi"]:
-            print(f"  - {msg}")
+            out.info(f"  - {msg.topic}: {msg.text()}")
+        
+        # Verify every subscriber got exactly the topics its filter matches
+        out.info("\nWildcard routing check:")
+        for key, topic_filter in subscriptions.items():
+            got = sorted(msg.topic for msg in received_messages[key])
+            want = sorted(expected.get(key, []))
+            status = "PASS" if got == want else "FAIL"
+            out.info(f"  {status} {topic_filter}: expected {len(want)}, received {len(got)}")
+            for topic in sorted(set(want) - set(got)):
+                out.info(f"    missing: {topic}")
+            for topic in sorted(set(got) - set(want)):
+                out.info(f"    unexpected: {topic}")
+        
+        # Latest reading per room, answered by the cache's topic index
+        out.info("\nLatest temperatures from the last-value cache (Sensors/+/Temperature):")
+        for value in sorted(last_values.query(subscriptions["task5_single"])):
+            out.info(f"  - {value.topic}: {value.payload.decode()}")
     
     except Exception as e:
-        print(f"Error in wildcard test: {e}")
+        out.error(f"Error in wildcard test: {e}")
+        raise
     finally:
         # Disconnect
         single_wildcard.disconnect()
@@ -288,94 +445,128 @@ def task6() -> None:
     Creates persistent session, disconnects subscriber, publishes messages,
     then reconnects to verify message delivery.
     """
-    print("\n--- Task 6: Persistent Session (QoS 1) ---")
+    out.info("\n--- Task 6: Persistent Session (QoS 1) ---")
+    scope = RUN_SCOPE.scenario("task6")
     
     # Use fixed client ID for persistence
-    client_id = "persistent-subscriber-task6"
+    client_id = scope.client_id("persistent-subscriber-task6")
     
     # Create subscriber with persistent session
-    subscriber = mqtt.Client(
+    subscriber = create_client(
+        "subscriber",
+        clean_session=False,  # Persistent session
         client_id=client_id,
-        clean_session=False  # Persistent session
+        protocol=MQTT_PROTOCOL,
+        receive_maximum=RECEIVE_MAXIMUM
     )
+    instrument(subscriber, "task6")
+    RECONNECTS.manage(subscriber)
+    
+    tracker = message_trackers["task6"]
     
     # Define on_connect handler
     def on_connect(client: mqtt.Client, 
                   userdata: Any, 
                   flags: Dict[str, bool], 
-                  rc: int) -> None:
-        session_present = flags.get('session_present', False)
-        print(f"Persistent subscriber connected, rc={rc}, session present={session_present}")
+                  rc: int,
+                  properties: Any = None) -> None:
+        tracker.connack_received(rc, flags)
+        present = session_present(flags)
+        out.info(f"Persistent subscriber connected, rc={rc}, session present={present}")
         
         # Subscribe only if session not present (first connect)
-        if not session_present:
-            print("No session present, creating new subscription")
-            client.subscribe("Sensor/Temp", qos=1)  # QoS 1 subscription
-            print("Subscribed to Sensor/Temp with QoS 1")
+        if not present:
+            out.info("No session present, creating new subscription")
+            client.subscribe(scope.topic("Sensor/Temp"), qos=1)  # QoS 1 subscription
+            out.info("Subscribed to Sensor/Temp with QoS 1")
         else:
-            print("Session present, using existing subscription")
+            out.info("Session present, using existing subscription")
     
     # Define on_message handler
     def on_message(client: mqtt.Client, 
                   userdata: Any, 
                   msg: mqtt.MQTTMessage) -> None:
-        print(f"Persistent subscriber received: '{msg.payload.decode()}' on '{msg.topic}'")
-        received_messages["task6"].append(msg.payload.decode())
+        if tracker.is_fence(msg.payload):
+            return  # Drain marker, not a reading
+        # Readings are only decoded and described when the line is written
+        if out.enabled(out.MESSAGE):
+            reading = PAYLOAD_CODEC.decode(msg.payload)
+            out.message("Persistent subscriber received: '{}' on '{}'", PAYLOAD_CODEC.describe(reading),
+                        msg.topic, topic=msg.topic)
+        received_messages["task6"].append(msg.topic, msg.payload, msg.qos)
+        tracker.message_received()
+    
+    # Optionally drop QoS 1 redeliveries before they are stored a second time
+    dedupe = make_deduplicator(DEDUPE_FILTER, DEDUPE_KEY, PAYLOAD_CODEC) if DEDUPE_FILTER else None
+    if dedupe is not None:
+        on_message = dedupe.wrap(on_message)
     
     # Set callbacks
     subscriber.on_connect = on_connect
-    subscriber.on_message = on_message
+    subscriber.on_subscribe = lambda *args: tracker.suback_received()
+    subscriber.on_message = unbatching(on_message)
     
+    publisher: Optional[mqtt.Client] = None
+    bulk: Optional[BulkPublisher] = None
     try:
         # Connect and subscribe
-        subscriber.connect(host="localhost", port=1883, keepalive=60)
+        subscriber.connect(host=BROKER_HOST, port=BROKER_PORT, keepalive=60, **connect_options(subscriber))
         subscriber.loop_start()
-        time.sleep(2)  # Give time to connect and subscribe
+        # Wait for the connection and, for a new session, the subscription
+        if tracker.wait_connack() and not tracker.session_present:
+            tracker.wait_suback()
         
         # Disconnect subscriber
-        print("Disconnecting subscriber...")
+        out.info("Disconnecting subscriber...")
         subscriber.disconnect()
         subscriber.loop_stop()
-        time.sleep(1)
         
-        # Create publisher and publish 20 messages
-        publisher = mqtt.Client(client_id="publisher-task6")
-        publisher.connect(host="localhost", port=1883)
-        publisher.loop_start()
+        # Borrow a connected publisher and publish the messages
+        publisher = CLIENT_POOL.borrow(BROKER_HOST, BROKER_PORT, MQTT_PROTOCOL)
+        set_scenario(publisher, "task6")
+        bulk = BulkPublisher(publisher, label="task6_pub")
         
-        print("Publishing 20 messages while subscriber is offline")
-        for i in range(1, 21):
-            publisher.publish("Sensor/Temp", f"Temperature reading {i}", qos=1)
-        time.sleep(1)
-        
-        publisher.disconnect()
-        publisher.loop_stop()
-        
-        # Reconnect subscriber with same client ID
-        print("Reconnecting subscriber with persistent session...")
-        subscriber = mqtt.Client(
-            client_id=client_id,  # Same client ID
-            clean_session=False   # Keep the session
+        out.info(f"Publishing {MESSAGE_COUNT} messages while subscriber is offline")
+        readings = (
+            (scope.topic("Sensor/Temp"), PAYLOAD_CODEC.encode(i, 20.0 + i / 10), 1)
+            for i in range(1, MESSAGE_COUNT + 1)
         )
-        subscriber.on_connect = on_connect
-        subscriber.on_message = on_message
-        
-        subscriber.connect(host="localhost", port=1883, keepalive=60)
-        subscriber.loop_start()
-        
-        # Wait for queued messages to be delivered
-        time.sleep(5)
+        # Returns once every PUBACK is in, with a bounded number in flight
+        if BATCH_SIZE:
+            readings = batched(readings, BATCH_SIZE, compress=BATCH_COMPRESS)
+        bulk.publish_all(readings, timeout=scaled_timeout(MESSAGE_COUNT))
         
-        print(f"\nReceived {len(received_messages['task6'])} messages after reconnection")
-        print("Observation: The subscriber received all messages published while it was disconnected.")
-        print("Explanation:")
-        print("  - clean_session=False creates a persistent session")
-        print("  - QoS 1 ensures messages are stored for offline clients")
-        print("  - When client reconnects with same ID, broker delivers stored messages")
+        # Reconnect subscriber with same client ID
+        out.info("Reconnecting subscriber with persistent session...")
+        # Same client object, ID and callbacks; only the connection is new
+        tracker.reset_connection()
+        RECONNECTS.reconnect(subscriber)
+        if tracker.wait_connack() and not tracker.session_present:
+            tracker.wait_suback()
+        
+        # Wait for the queued messages to be delivered
+        tracker.wait_messages(MESSAGE_COUNT, scaled_timeout(MESSAGE_COUNT))
+        
+        out.info(f"\nReceived {received_messages['task6'].total} messages after reconnection")
+        if dedupe is not None:
+            out.info(f"Duplicate suppression ({DEDUPE_FILTER} by {DEDUPE_KEY}): "
+                     f"{dedupe.hits} dropped, {dedupe.misses} passed, "
+                     f"{dedupe.dup_flagged} arrived with the DUP flag")
+        out.info("Observation: The subscriber received all messages published while it was disconnected.")
+        out.info("Explanation:")
+        out.info("  - clean_session=False creates a persistent session")
+        out.info("  - QoS 1 ensures messages are stored for offline clients")
+        out.info("  - When client reconnects with same ID, broker delivers stored messages")
     
     except Exception as e:
-        print(f"Error in persistent session test: {e}")
+        out.error(f"Error in persistent session test: {e}")
+        raise
     finally:
+        # Hand the pooled publisher back even if the task failed half-way
+        if bulk is not None:
+            bulk.close()
+        if publisher is not None:
+            CLIENT_POOL.release(publisher)
         subscriber.disconnect()
         subscriber.loop_stop()
 
@@ -387,90 +578,115 @@ def task7() -> None:
     Creates non-persistent session, disconnects subscriber, publishes messages,
     then reconnects to verify message delivery behavior.
     """
-    print("\n--- Task 7: Non-Persistent Session (QoS 1) ---")
+    out.info("\n--- Task 7: Non-Persistent Session (QoS 1) ---")
+    scope = RUN_SCOPE.scenario("task7")
     
     # Use fixed client ID
-    client_id = "non-persistent-subscriber-task7"
+    client_id = scope.client_id("non-persistent-subscriber-task7")
     
     # Create subscriber with clean session
-    subscriber = mqtt.Client(
+    subscriber = create_client(
+        "subscriber",
+        clean_session=True,  # Non-persistent session
         client_id=client_id,
-        clean_session=True  # Non-persistent session
+        protocol=MQTT_PROTOCOL,
+        receive_maximum=RECEIVE_MAXIMUM
     )
+    instrument(subscriber, "task7")
+    RECONNECTS.manage(subscriber)
+    
+    tracker = message_trackers["task7"]
     
     # Define on_connect handler
     def on_connect(client: mqtt.Client, 
                   userdata: Any, 
                   flags: Dict[str, bool], 
-                  rc: int) -> None:
-        session_present = flags.get('session_present', False)
-        print(f"Non-persistent subscriber connected, rc={rc}, session present={session_present}")
+                  rc: int,
+                  properties: Any = None) -> None:
+        tracker.connack_received(rc, flags)
+        present = session_present(flags)
+        out.info(f"Non-persistent subscriber connected, rc={rc}, session present={present}")
         
         # Always subscribe since it's a clean session
-        client.subscribe("Sensor/Temp", qos=1)  # QoS 1 subscription
-        print("Subscribed to Sensor/Temp with QoS 1")
+        client.subscribe(scope.topic("Sensor/Temp"), qos=1)  # QoS 1 subscription
+        out.info("Subscribed to Sensor/Temp with QoS 1")
     
     # Define on_message handler
     def on_message(client: mqtt.Client, 
                   userdata: Any, 
                   msg: mqtt.MQTTMessage) -> None:
-        print(f"Non-persistent subscriber received: '{msg.payload.decode()}' on '{msg.topic}'")
-        received_messages["task7"].append(msg.payload.decode())
+        if tracker.is_fence(msg.payload):
+            return  # Drain marker, not a reading
+        # Readings are only decoded and described when the line is written
+        if out.enabled(out.MESSAGE):
+            reading = PAYLOAD_CODEC.decode(msg.payload)
+            out.message("Non-persistent subscriber received: '{}' on '{}'", PAYLOAD_CODEC.describe(reading),
+                        msg.topic, topic=msg.topic)
+        received_messages["task7"].append(msg.topic, msg.payload, msg.qos)
+        tracker.message_received()
     
     # Set callbacks
     subscriber.on_connect = on_connect
-    subscriber.on_message = on_message
+    subscriber.on_subscribe = lambda *args: tracker.suback_received()
+    subscriber.on_message = unbatching(on_message)
     
+    publisher: Optional[mqtt.Client] = None
+    bulk: Optional[BulkPublisher] = None
     try:
         # Connect and subscribe
-        subscriber.connect(host="localhost", port=1883, keepalive=60)
+        subscriber.connect(host=BROKER_HOST, port=BROKER_PORT, keepalive=60, **connect_options(subscriber))
         subscriber.loop_start()
-        time.sleep(2)  # Give time to connect and subscribe
+        # Wait for the connection and, for a new session, the subscription
+        if tracker.wait_connack() and not tracker.session_present:
+            tracker.wait_suback()
         
         # Disconnect subscriber
-        print("Disconnecting subscriber...")
+        out.info("Disconnecting subscriber...")
         subscriber.disconnect()
         subscriber.loop_stop()
-        time.sleep(1)
         
-        # Create publisher and publish 20 messages
-        publisher = mqtt.Client(client_id="publisher-task7")
-        publisher.connect(host="localhost", port=1883)
-        publisher.loop_start()
+        # Borrow a connected publisher and publish the messages
+        publisher = CLIENT_POOL.borrow(BROKER_HOST, BROKER_PORT, MQTT_PROTOCOL)
+        set_scenario(publisher, "task7")
+        bulk = BulkPublisher(publisher, label="task7_pub")
         
-        print("Publishing 20 messages while subscriber is offline")
-        for i in range(1, 21):
-            publisher.publish("Sensor/Temp", f"Temperature reading {i}", qos=1)
-        time.sleep(1)
-        
-        publisher.disconnect()
-        publisher.loop_stop()
-        
-        # Reconnect subscriber with same client ID
-        print("Reconnecting subscriber with clean session...")
-        subscriber = mqtt.Client(
-            client_id=client_id,  # Same client ID
-            clean_session=True    # Clean session
+        out.info(f"Publishing {MESSAGE_COUNT} messages while subscriber is offline")
+        readings = (
+            (scope.topic("Sensor/Temp"), PAYLOAD_CODEC.encode(i, 20.0 + i / 10), 1)
+            for i in range(1, MESSAGE_COUNT + 1)
         )
-        subscriber.on_connect = on_connect
-        subscriber.on_message = on_message
-        
-        subscriber.connect(host="localhost", port=1883, keepalive=60)
-        subscriber.loop_start()
-        
-        # Wait for any messages
-        time.sleep(5)
+        # Returns once every PUBACK is in, with a bounded number in flight
+        if BATCH_SIZE:
+            readings = batched(readings, BATCH_SIZE, compress=BATCH_COMPRESS)
+        bulk.publish_all(readings, timeout=scaled_timeout(MESSAGE_COUNT))
         
-        print(f"\nReceived {len(received_messages['task7'])} messages after reconnection")
-        print("Observation: The subscriber did NOT receive any messages published while it was disconnected.")
-        print("Explanation:")
-        print("  - clean_session=True creates a new session each time")
-        print("  - All subscriptions and pending messages are deleted when client disconnects")
-        print("  - QoS 1 guarantees delivery only for active sessions")
+        # Reconnect subscriber with same client ID
+        out.info("Reconnecting subscriber with clean session...")
+        # Same client object, ID and callbacks; only the connection is new
+        tracker.reset_connection()
+        RECONNECTS.reconnect(subscriber)
+        if tracker.wait_connack() and not tracker.session_present:
+            tracker.wait_suback()
+        
+        # Wait until anything the broker kept for us has been delivered
+        tracker.drain(publisher, scope.topic("Sensor/Temp"), qos=1, timeout=scaled_timeout(MESSAGE_COUNT))
+        
+        out.info(f"\nReceived {received_messages['task7'].total} messages after reconnection")
+        out.info("Observation: The subscriber did NOT receive any messages published while it was disconnected.")
+        out.info("Explanation:")
+        out.info("  - clean_session=True creates a new session each time")
+        out.info("  - All subscriptions and pending messages are deleted when client disconnects")
+        out.info("  - QoS 1 guarantees delivery only for active sessions")
     
     except Exception as e:
-        print(f"Error in non-persistent session test: {e}")
+        out.error(f"Error in non-persistent session test: {e}")
+        raise
     finally:
+        # Hand the pooled publisher back even if the task failed half-way
+        if bulk is not None:
+            bulk.close()
+        if publisher is not None:
+            CLIENT_POOL.release(publisher)
         subscriber.disconnect()
         subscriber.loop_stop()
 
@@ -481,139 +697,279 @@ def task8() -> None:
     
     Tests message delivery with persistent session but QoS 0 subscription.
     """
-    print("\n--- Task 8: Persistent Session, QoS 0 Subscription, QoS 2 Publishing ---")
+    out.info("\n--- Task 8: Persistent Session, QoS 0 Subscription, QoS 2 Publishing ---")
+    scope = RUN_SCOPE.scenario("task8")
     
     # Use fixed client ID
-    client_id = "mixed-qos-subscriber-task8"
+    client_id = scope.client_id("mixed-qos-subscriber-task8")
     
     # Create subscriber with persistent session
-    subscriber = mqtt.Client(
+    subscriber = create_client(
+        "subscriber",
+        clean_session=False,  # Persistent session
         client_id=client_id,
-        clean_session=False  # Persistent session
+        protocol=MQTT_PROTOCOL,
+        receive_maximum=RECEIVE_MAXIMUM
     )
+    instrument(subscriber, "task8")
+    RECONNECTS.manage(subscriber)
+    
+    tracker = message_trackers["task8"]
     
     # Define on_connect handler
     def on_connect(client: mqtt.Client, 
                   userdata: Any, 
                   flags: Dict[str, bool], 
-                  rc: int) -> None:
-        session_present = flags.get('session_present', False)
-        print(f"Subscriber connected, rc={rc}, session present={session_present}")
+                  rc: int,
+                  properties: Any = None) -> None:
+        tracker.connack_received(rc, flags)
+        present = session_present(flags)
+        out.info(f"Subscriber connected, rc={rc}, session present={present}")
         
         # Subscribe only if session not present
-        if not session_present:
-            print("No session present, creating new subscription")
-            client.subscribe("Sensor/Temp", qos=0)  # QoS 0 subscription
-            print("Subscribed to Sensor/Temp with QoS 0")
+        if not present:
+            out.info("No session present, creating new subscription")
+            client.subscribe(scope.topic("Sensor/Temp"), qos=0)  # QoS 0 subscription
+            out.info("Subscribed to Sensor/Temp with QoS 0")
         else:
-            print("Session present, using existing subscription")
+            out.info("Session present, using existing subscription")
     
     # Define on_message handler
     def on_message(client: mqtt.Client, 
                   userdata: Any, 
                   msg: mqtt.MQTTMessage) -> None:
-        print(f"Subscriber received: '{msg.payload.decode()}' on '{msg.topic}'")
-        received_messages["task8"].append(msg.payload.decode())
+        if tracker.is_fence(msg.payload):
+            return  # Drain marker, not a reading
+        # Readings are only decoded and described when the line is written
+        if out.enabled(out.MESSAGE):
+            reading = PAYLOAD_CODEC.decode(msg.payload)
+            out.message("Subscriber received: '{}' on '{}'", PAYLOAD_CODEC.describe(reading),
+                        msg.topic, topic=msg.topic)
+        received_messages["task8"].append(msg.topic, msg.payload, msg.qos)
+        tracker.message_received()
     
     # Set callbacks
     subscriber.on_connect = on_connect
-    subscriber.on_message = on_message
+    subscriber.on_subscribe = lambda *args: tracker.suback_received()
+    subscriber.on_message = unbatching(on_message)
     
+    publisher: Optional[mqtt.Client] = None
+    bulk: Optional[BulkPublisher] = None
     try:
         # Connect and subscribe
-        subscriber.connect(host="localhost", port=1883, keepalive=60)
+        subscriber.connect(host=BROKER_HOST, port=BROKER_PORT, keepalive=60, **connect_options(subscriber))
         subscriber.loop_start()
-        time.sleep(2)  # Give time to connect and subscribe
+        # Wait for the connection and, for a new session, the subscription
+        if tracker.wait_connack() and not tracker.session_present:
+            tracker.wait_suback()
         
         # Disconnect subscriber
-        print("Disconnecting subscriber...")
+        out.info("Disconnecting subscriber...")
         subscriber.disconnect()
         subscriber.loop_stop()
-        time.sleep(1)
         
-        # Create publisher and publish 20 messages with QoS 2
-        publisher = mqtt.Client(client_id="publisher-task8")
-        publisher.connect(host="localhost", port=1883)
-        publisher.loop_start()
+        # Borrow a connected publisher and publish the messages with QoS 2
+        publisher = CLIENT_POOL.borrow(BROKER_HOST, BROKER_PORT, MQTT_PROTOCOL)
+        set_scenario(publisher, "task8")
+        bulk = BulkPublisher(publisher, label="task8_pub")
         
-        print("Publishing 20 messages with QoS 2 while subscriber is offline")
-        for i in range(1, 21):
-            publisher.publish("Sensor/Temp", f"Temperature reading {i}", qos=2)
-        time.sleep(1)
-        
-        publisher.disconnect()
-        publisher.loop_stop()
-        
-        # Reconnect subscriber with same client ID
-        print("Reconnecting subscriber with persistent session...")
-        subscriber = mqtt.Client(
-            client_id=client_id,  # Same client ID
-            clean_session=False   # Keep the session
+        out.info(f"Publishing {MESSAGE_COUNT} messages with QoS 2 while subscriber is offline")
+        readings = (
+            (scope.topic("Sensor/Temp"), PAYLOAD_CODEC.encode(i, 20.0 + i / 10), 2)
+            for i in range(1, MESSAGE_COUNT + 1)
         )
-        subscriber.on_connect = on_connect
-        subscriber.on_message = on_message
-        
-        subscriber.connect(host="localhost", port=1883, keepalive=60)
-        subscriber.loop_start()
-        
-        # Wait for any queued messages
-        time.sleep(5)
+        # Returns once every PUBCOMP is in, with a bounded number in flight
+        if BATCH_SIZE:
+            readings = batched(readings, BATCH_SIZE, compress=BATCH_COMPRESS)
+        bulk.publish_all(readings, timeout=scaled_timeout(MESSAGE_COUNT))
         
-        print(f"\nReceived {len(received_messages['task8'])} messages after reconnection")
-        print("Observation: The subscriber did NOT receive any messages published while it was disconnected.")
-        print("Explanation:")
-        print("  - Despite using clean_session=False (persistent session)")
-        print("  - QoS 0 subscription doesn't support message storage")
-        print("  - The subscription QoS level (0) determines storage behavior")
-        print("  - Even though messages were published with QoS 2, they weren't stored")
+        # Reconnect subscriber with same client ID
+        out.info("Reconnecting subscriber with persistent session...")
+        # Same client object, ID and callbacks; only the connection is new
+        tracker.reset_connection()
+        RECONNECTS.reconnect(subscriber)
+        if tracker.wait_connack() and not tracker.session_present:
+            tracker.wait_suback()
+        
+        # Wait until anything the broker kept for us has been delivered
+        tracker.drain(publisher, scope.topic("Sensor/Temp"), qos=2, timeout=scaled_timeout(MESSAGE_COUNT))
+        
+        out.info(f"\nReceived {received_messages['task8'].total} messages after reconnection")
+        out.info("Observation: The subscriber did NOT receive any messages published while it was disconnected.")
+        out.info("Explanation:")
+        out.info("  - Despite using clean_session=False (persistent session)")
+        out.info("  - QoS 0 subscription doesn't support message storage")
+        out.info("  - The subscription QoS level (0) determines storage behavior")
+        out.info("  - Even though messages were published with QoS 2, they weren't stored")
     
     except Exception as e:
-        print(f"Error in mixed QoS test: {e}")
+        out.error(f"Error in mixed QoS test: {e}")
+        raise
     finally:
+        # Hand the pooled publisher back even if the task failed half-way
+        if bulk is not None:
+            bulk.close()
+        if publisher is not None:
+            CLIENT_POOL.release(publisher)
         subscriber.disconnect()
         subscriber.loop_stop()
 
 
 def main() -> None:
     """
-    Main function to run all tasks sequentially.
+    Main function to run all tasks in dependency order.
     """
+    global BROKER_HOST, BROKER_PORT, MESSAGE_COUNT, PAYLOAD_CODEC, RUN_SCOPE
+    global DEDUPE_FILTER, DEDUPE_KEY, MQTT_PROTOCOL, RECEIVE_MAXIMUM, BATCH_SIZE, BATCH_COMPRESS
+    
+    parser = argparse.ArgumentParser(description="IKT520 MQTT assignment tasks")
+    parser.add_argument("--host", default=BROKER_HOST, help="MQTT broker host")
+    parser.add_argument("--port", type=int, default=BROKER_PORT, help="MQTT broker port")
+    parser.add_argument("--embedded-broker", action="store_true",
+                        help="Run against an in-process broker on an ephemeral port")
+    parser.add_argument("--mqtt5", action="store_true",
+                        help="Use MQTT 5 (callback API v2) for the task1 clients and the "
+                             "task6-task8 publishers, with topic aliases for hot topics")
+    parser.add_argument("--receive-maximum", type=int, default=RECEIVE_MAXIMUM, metavar="N",
+                        help="Receive Maximum of the MQTT 5 task1 subscriber")
+    parser.add_argument("--messages", type=int, default=MESSAGE_COUNT,
+                        help="Messages published while the subscriber is offline (task6-task8)")
+    parser.add_argument("--codec", choices=sorted(CODECS), default=PAYLOAD_CODEC.name,
+                        help="Payload encoding of the task6-task8 readings")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, metavar="N",
+                        help="Pack up to N task6-task8 readings into one batch PUBLISH")
+    parser.add_argument("--batch-zlib", action="store_true",
+                        help="zlib-compress the --batch payloads")
+    parser.add_argument("--dedupe", choices=sorted(FILTERS), default=DEDUPE_FILTER,
+                        help="Drop QoS 1 redeliveries in task6 with an LRU or Bloom filter")
+    parser.add_argument("--dedupe-key", choices=["sequence", "content"], default=DEDUPE_KEY,
+                        help="Identify duplicates by reading sequence number or payload hash")
+    parser.add_argument("--verbosity", choices=list(out.LEVELS), default="message",
+                        help="'info' drops the per-message lines, 'error' prints failures only")
+    parser.add_argument("--json-lines", action="store_true",
+                        help="Write output as JSON lines instead of text")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Scenarios run at once; task6-task8 are independent of the rest")
+    parser.add_argument("--run-prefix", default=None,
+                        help="Topic and client ID namespace (default: none, or a random "
+                             "one when --jobs > 1)")
+    parser.add_argument("--wire-stats", action="store_true",
+                        help="Count bytes and packets per MQTT packet type, client and task")
+    parser.add_argument("--wire-output", metavar="FILE",
+                        help="Also export the wire counts as JSON (implies --wire-stats)")
+    parser.add_argument("--journal", metavar="DIR",
+                        help="Append every received message to a replayable journal "
+                             "(see mqtt_journal.py)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Time every callback and report which handler dominates each task")
+    parser.add_argument("--profile-sample", type=int, default=0, metavar="N",
+                        help="Also run every Nth call of each handler under cProfile "
+                             "(implies --profile; SIGUSR1 toggles sampling while running)")
+    parser.add_argument("--profile-output", metavar="FILE",
+                        help="Dump the sampled cProfile data to FILE for pstats/snakeviz")
+    args = parser.parse_args()
+    out.configure(level=out.LEVELS[args.verbosity], json_lines=args.json_lines)
+    MESSAGE_COUNT = args.messages
+    MQTT_PROTOCOL = mqtt.MQTTv5 if args.mqtt5 else mqtt.MQTTv311
+    RECEIVE_MAXIMUM = args.receive_maximum
+    PAYLOAD_CODEC = get_codec(args.codec)
+    DEDUPE_FILTER, DEDUPE_KEY = args.dedupe, args.dedupe_key
+    BATCH_SIZE, BATCH_COMPRESS = args.batch, args.batch_zlib
+    wire.enable(args.wire_stats or args.wire_output is not None)
+    profiling.enable(args.profile or args.profile_sample > 0 or args.profile_output is not None)
+    profiling.set_sampling(args.profile_sample)
+    if profiling.is_enabled() and hasattr(signal, "SIGUSR1"):
+        # kill -USR1 <pid> switches cProfile sampling on (every Nth call, default 100) or off
+        sample_every = args.profile_sample or 100
+        signal.signal(signal.SIGUSR1, lambda *_: profiling.set_sampling(
+            0 if profiling.sampling() else sample_every))
+    if args.run_prefix is not None:
+        RUN_SCOPE = RunScope(args.run_prefix)
+    elif args.jobs > 1:
+        RUN_SCOPE = RunScope.unique()
+    
+    journal: Optional[JournalWriter] = None
+    if args.journal:
+        journal = JournalWriter(args.journal)
+        received_messages.set_sink(journal.append)
+    
+    runner = ScenarioRunner(jobs=args.jobs)
+    broker: Optional[EmbeddedBroker] = None
     try:
-        print("==== IKT520 MQTT Assignment Solution ====")
-        print("Make sure an MQTT broker is running at localhost:1883")
-        print("(e.g., using: docker run -d --name emqx -p 18083:18083 -p 1883:1883 emqx/emqx)")
-        
-        # Tasks with shared clients
-        publisher, subscriber = task1()
-        task2(publisher)
-        task3(subscriber)
-        task4(publisher)
-        task5(publisher)
-        
-        # Stop and clean up shared clients
-        subscriber.disconnect()
-        publisher.disconnect()
-        subscriber.loop_stop()
-        publisher.loop_stop()
-        
+        out.info("==== IKT520 MQTT Assignment Solution ====")
+        if args.embedded_broker:
+            broker = EmbeddedBroker()
+            BROKER_HOST, BROKER_PORT = broker.start()
+            out.info(f"Embedded broker listening on {BROKER_HOST}:{BROKER_PORT} "
+                     f"(started in {broker.startup_seconds * 1000:.1f} ms)")
+        else:
+            BROKER_HOST, BROKER_PORT = args.host, args.port
+            out.info(f"Make sure an MQTT broker is running at {BROKER_HOST}:{BROKER_PORT}")
+            out.info("(e.g., using: docker run -d --name emqx -p 18083:18083 -p 1883:1883 emqx/emqx)")
+            out.info("or pass --embedded-broker to use the in-process broker")
+        
+        if RUN_SCOPE.prefix:
+            out.info(f"Topics and client IDs prefixed with '{RUN_SCOPE.prefix}'")
+        
+        def clients() -> tuple[mqtt.Client, mqtt.Client]:
+            return runner.result("task1")
+        
+        def cleanup() -> None:
+            # Stop and clean up shared clients
+            publisher, subscriber = clients()
+            set_scenario(publisher, "cleanup")
+            set_scenario(subscriber, "cleanup")
+            subscriber.disconnect()
+            publisher.disconnect()
+            subscriber.loop_stop()
+            publisher.loop_stop()
+        
+        # Tasks 1-5 share one publisher and one subscriber
+        runner.add("task1", task1)
+        runner.add("task2", lambda: task2(clients()[0]), depends=["task1"])
+        runner.add("task3", lambda: task3(clients()[1]), depends=["task1"])
+        runner.add("task4", lambda: task4(clients()[0]), depends=["task2", "task3"])
+        runner.add("task5", lambda: task5(clients()[0]), depends=["task4"])
+        runner.add("cleanup", cleanup, depends=["task5"])
         # Tasks with their own clients
-        task6()
-        task7()
-        task8()
-        
-        print("\n==== Assignment Complete ====")
+        runner.add("task6", task6)
+        runner.add("task7", task7)
+        runner.add("task8", task8)
+        runner.run()
+        
+        print_wait_report()
+        RECONNECTS.print_report()
+        CLIENT_POOL.print_report()
+        print_scenario_report(runner.results)
+        wire.print_wire_report()
+        if args.wire_output:
+            wire.write_wire_report(args.wire_output)
+        profiling.print_profile_report()
+        if args.profile_output:
+            profiling.write_profile_stats(args.profile_output)
+        if broker is not None and broker.first_connack_ms() is not None:
+            out.info(f"Embedded broker: first CONNACK {broker.first_connack_ms():.1f} ms after startup")
+        out.info("\n==== Assignment Complete ====")
         
     except KeyboardInterrupt:
-        print("\nExiting due to user interrupt...")
+        out.info("\nExiting due to user interrupt...")
     except Exception as e:
-        print(f"\nError: {e}")
+        out.error(f"\nError: {e}")
     finally:
         # Ensure clients are disconnected
         try:
-            publisher.disconnect()
-            subscriber.disconnect()
+            for client in runner.result("task1"):
+                client.disconnect()
         except:
             pass
+        CLIENT_POOL.close()
+        if broker is not None:
+            broker.stop()
+        if journal is not None:
+            received_messages.set_sink(None)
+            journal.close()
+            out.info(f"Journaled {journal.records} messages to {args.journal}")
+        out.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,364 @@
+"""
+MQTT 5 topic aliases for publishers.
+
+Every PUBLISH normally carries its full topic name; for task 6's 20 readings
+on run-<id>/task6/Sensor/Temp that is most of each packet. MQTT 5 lets a
+client bind a topic to a two-byte alias once per connection and send an
+empty topic name from then on. enable_topic_aliases() gives a v5 client's
+publish() an alias table: a topic gets an alias from its `hot_after`-th
+publish on, up to the Topic Alias Maximum the broker announced in CONNACK,
+and the least recently used alias is rebound when they run out. The table
+starts over on every connect, as the spec requires.
+
+The benchmark runs the task 6 scenario (persistent subscriber offline,
+publisher sends N QoS 1 readings, subscriber reconnects and drains them)
+over MQTT 3.1.1, MQTT 5, and MQTT 5 with topic aliases, with the v5
+subscriber negotiating a Receive Maximum, and reports PUBLISH bytes on the
+publisher's wire and the publish and drain rates.
+
+Usage:
+    publisher = enable_topic_aliases(create_client("publisher", protocol=mqtt.MQTTv5))
+
+    python mqtt_aliases.py --embedded-broker --messages 20 1000 100000
+"""
+import argparse
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from mqtt_benchmark import add_broker_arguments, make_payload, run_metadata, start_broker, write_json
+from mqtt_bulk_publisher import BulkPublisher
+from mqtt_clients import (connect_client, create_client, disconnect_client, discard_session,
+                          require_paho, track_connection)
+from mqtt_packets import PROP_TOPIC_ALIAS_MAXIMUM, PUBLISH, decode_properties
+from mqtt_scenarios import RunScope
+from mqtt_waiters import CompletionTracker, scaled_timeout
+from mqtt_wire import WireMeter
+
+# The alias table hooks paho's private CONNACK handler and outgoing message queue
+require_paho(__name__)
+
+# Publishes of not yet aliased topics counted before the counts start over
+COUNT_LIMIT = 10_000
+
+# Bytes a Topic Alias property adds to a PUBLISH (identifier and two-byte value)
+ALIAS_PROPERTY_BYTES = 3
+
+# Protocol variants the benchmark compares
+MODES = ("3.1.1", "5", "5+aliases")
+
+
+class _AliasProperties(Properties):
+    """A Topic Alias property block that is packed once, not on every publish."""
+
+    def __init__(self, alias: int) -> None:
+        super().__init__(PacketTypes.PUBLISH)
+        self.TopicAlias = alias
+        # Properties only accepts property names as attributes
+        object.__setattr__(self, "_packed", super().pack())
+
+    def pack(self) -> bytes:
+        return self._packed
+
+
+class TopicAliasPublisher:
+    """Alias table behind one MQTT 5 client's publish()."""
+
+    def __init__(self, client: mqtt.Client, hot_after: int = 2,
+                 maximum: Optional[int] = None) -> None:
+        """
+        Args:
+            client: MQTT 5 client; see enable_topic_aliases()
+            hot_after: Publishes on a topic before it gets an alias
+            maximum: Aliases to use at most, below the broker's limit
+        """
+        self.client = client
+        self.hot_after = hot_after
+        self.limit = maximum
+        self.maximum = 0            # Aliases usable on the current connection
+        self.published = 0
+        self.aliased = 0            # Publishes sent with an empty topic name
+        self.rebound = 0            # Aliases moved to another topic
+        self.bytes_saved = 0        # Topic bytes not sent, less the alias properties
+        self._publish = client.publish
+        self._handle_connack = client._handle_connack
+        self._aliases: "OrderedDict[str, int]" = OrderedDict()   # Topic -> alias, LRU first
+        self._unbound: Set[str] = set()     # Aliased topics the broker has not seen yet
+        self._counts: Dict[str, int] = {}
+        self._properties: Dict[int, _AliasProperties] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, topic: str, payload: Any = None, qos: int = 0, retain: bool = False,
+                properties: Optional[Properties] = None) -> mqtt.MQTTMessageInfo:
+        """client.publish() that sends hot topics as aliases."""
+        if properties is not None:
+            return self._publish(topic, payload, qos, retain, properties)
+        with self._lock:
+            self.published += 1
+            alias = self._aliases.get(topic)
+            if alias is None:
+                alias = self._assign(topic)
+                if alias is None:
+                    return self._publish(topic, payload, qos, retain)
+            else:
+                self._aliases.move_to_end(topic)
+            alias_properties = self._properties[alias]
+            if topic not in self._unbound:
+                self.aliased += 1
+                self.bytes_saved += len(topic.encode("utf-8")) - ALIAS_PROPERTY_BYTES
+                return self._publish("", payload, qos, retain, alias_properties)
+            # Topic and alias together bind the alias
+            info = self._publish(topic, payload, qos, retain, alias_properties)
+            self.bytes_saved -= ALIAS_PROPERTY_BYTES
+            if self._written(info, qos):
+                self._unbound.discard(topic)
+            return info
+
+    def _assign(self, topic: str) -> Optional[int]:
+        """Give `topic` an alias once it is hot, rebinding the least recently used one."""
+        if not self.maximum:
+            return None
+        count = self._counts.get(topic, 0) + 1
+        if count < self.hot_after:
+            if len(self._counts) >= COUNT_LIMIT:
+                self._counts.clear()
+            self._counts[topic] = count
+            return None
+        self._counts.pop(topic, None)
+        if len(self._aliases) < self.maximum:
+            alias = len(self._aliases) + 1
+        else:
+            old_topic, alias = self._aliases.popitem(last=False)
+            self._unbound.discard(old_topic)
+            self.rebound += 1
+        self._aliases[topic] = alias
+        self._unbound.add(topic)
+        if alias not in self._properties:
+            self._properties[alias] = _AliasProperties(alias)
+        return alias
+
+    def _written(self, info: mqtt.MQTTMessageInfo, qos: int) -> bool:
+        """Whether paho wrote the PUBLISH now, rather than queueing it for later."""
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            return False
+        if not qos:
+            return True
+        message = self.client._out_messages.get(info.mid)
+        return message is None or message.state != mqtt.mqtt_ms_queued
+
+    def handle_connack(self) -> Any:
+        """Start a fresh alias table for the new connection, then let paho handle CONNACK."""
+        client = self.client
+        maximum = 0
+        if client._protocol == mqtt.MQTTv5:
+            try:
+                properties, _ = decode_properties(client._in_packet["packet"], 2)
+                maximum = properties.get(PROP_TOPIC_ALIAS_MAXIMUM, 0)
+            except (ValueError, IndexError):
+                pass
+        with self._lock:
+            self.maximum = min(maximum, self.limit) if self.limit is not None else maximum
+            topics = {alias: topic for topic, alias in self._aliases.items()}
+            self._aliases.clear()
+            self._unbound.clear()
+            # Aliases die with the old connection: paho resends unacknowledged
+            # messages from its own store, so give them back their topic names
+            with client._out_message_mutex:
+                for message in client._out_messages.values():
+                    alias = getattr(message.properties, "TopicAlias", None)
+                    if alias is not None and message.properties is self._properties.get(alias):
+                        if not message._topic:
+                            message._topic = topics.get(alias, "").encode("utf-8")
+                        message.properties = None
+        return self._handle_connack()
+
+    def counters(self) -> Dict[str, int]:
+        return {"published": self.published, "aliased": self.aliased, "rebound": self.rebound,
+                "bytes_saved": self.bytes_saved}
+
+
+def enable_topic_aliases(client: mqtt.Client, hot_after: int = 2,
+                         maximum: Optional[int] = None) -> mqtt.Client:
+    """
+    Make an MQTT 5 client publish its hot topics as topic aliases.
+
+    Call before connecting. The alias table is reachable as
+    topic_aliases(client) for its counters.
+
+    Args:
+        client: Client created with protocol=mqtt.MQTTv5
+        hot_after: Publishes on a topic before it gets an alias
+        maximum: Aliases to use at most, below the broker's Topic Alias Maximum
+    """
+    if client._protocol != mqtt.MQTTv5:
+        raise ValueError("Topic aliases need an MQTT 5 client")
+    aliases = TopicAliasPublisher(client, hot_after, maximum)
+    # paho has no hook for the CONNACK properties before it resends queued
+    # messages; like mqtt_wire, override the per-instance methods
+    client.publish = aliases.publish
+    client._handle_connack = aliases.handle_connack
+    client._topic_aliases = aliases
+    return client
+
+
+def topic_aliases(client: mqtt.Client) -> Optional[TopicAliasPublisher]:
+    """The alias table installed by enable_topic_aliases(), if any."""
+    return getattr(client, "_topic_aliases", None)
+
+
+def run_alias_point(host: str,
+                    port: int,
+                    mode: str,
+                    messages: int,
+                    payload_size: int,
+                    receive_maximum: int,
+                    topic: str) -> Dict[str, Any]:
+    """
+    Run the task 6 scenario once over one protocol variant.
+
+    Args:
+        host: Broker host
+        port: Broker port
+        mode: One of MODES
+        messages: Readings published while the subscriber is offline
+        payload_size: Payload size in bytes
+        receive_maximum: Receive Maximum of the MQTT 5 subscriber
+        topic: Topic of the readings
+
+    Returns:
+        dict: One result row
+    """
+    protocol = mqtt.MQTTv311 if mode == "3.1.1" else mqtt.MQTTv5
+    timeout = scaled_timeout(messages)
+    client_id = f"alias-subscriber-{mode}-{messages}"
+    tracker = CompletionTracker(f"aliases-{mode}")
+
+    def subscriber_client() -> mqtt.Client:
+        subscriber = create_client("alias-subscriber", clean_session=False, client_id=client_id,
+                                   protocol=protocol, receive_maximum=receive_maximum)
+        track_connection(subscriber, tracker, [(topic, 1)])
+        subscriber.on_message = lambda client, userdata, msg: tracker.message_received()
+        return subscriber
+
+    discard_session(host, port, client_id)
+    subscriber = subscriber_client()
+    if not connect_client(subscriber, tracker, host, port, wait_suback=True):
+        raise RuntimeError(f"{mode} subscriber could not connect")
+    disconnect_client(subscriber)
+
+    publisher = create_client("alias-publisher", protocol=protocol)
+    if mode == "5+aliases":
+        enable_topic_aliases(publisher)
+    meter = WireMeter(publisher._client_id.decode(), mode)
+    meter.attach(publisher)
+    publisher_tracker = CompletionTracker(f"aliases-{mode}-pub")
+    track_connection(publisher, publisher_tracker)
+    bulk = BulkPublisher(publisher, label=f"aliases-{mode}")
+    try:
+        if not connect_client(publisher, publisher_tracker, host, port):
+            raise RuntimeError(f"{mode} publisher could not connect")
+        begin = time.perf_counter()
+        bulk.publish_all(((topic, make_payload(i, payload_size), 1) for i in range(messages)),
+                         timeout)
+        publish_seconds = time.perf_counter() - begin
+    finally:
+        disconnect_client(publisher)
+
+    tracker.reset_connection()
+    subscriber = subscriber_client()
+    begin = time.perf_counter()
+    try:
+        connect_client(subscriber, tracker, host, port)
+        complete = tracker.wait_messages(messages, timeout)
+        drain_seconds = time.perf_counter() - begin
+    finally:
+        disconnect_client(subscriber)
+        discard_session(host, port, client_id)
+
+    sent = meter.counts[mode][0]
+    aliases = topic_aliases(publisher)
+    return {
+        "mode": mode,
+        "messages": messages,
+        "payload_size": payload_size,
+        "topic_bytes": len(topic.encode("utf-8")),
+        "received": tracker.received,
+        "complete": complete,
+        "publish_bytes": sent.bytes[PUBLISH],
+        "publish_bytes_per_message": sent.bytes[PUBLISH] / messages if messages else 0.0,
+        "wire_bytes_sent": sent.total_bytes,
+        "publish_msgs_per_sec": messages / publish_seconds if publish_seconds else 0.0,
+        "drain_msgs_per_sec": messages / drain_seconds if drain_seconds else 0.0,
+        "aliases": aliases.counters() if aliases is not None else None,
+    }
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    """Print bytes and rates per workload, relative to MQTT 3.1.1."""
+    print(f"{'Messages':>9} {'Mode':<10} {'PUBLISH B':>10} {'B/msg':>6} {'Saved':>7} "
+          f"{'Pub msg/s':>10} {'Gain':>7} {'Drain msg/s':>12}", file=sys.stderr)
+    baselines = {row["messages"]: row for row in results if row["mode"] == "3.1.1"}
+    for row in results:
+        base = baselines.get(row["messages"], row)
+        saved = 1 - row["publish_bytes"] / base["publish_bytes"] if base["publish_bytes"] else 0.0
+        gain = (row["publish_msgs_per_sec"] / base["publish_msgs_per_sec"] - 1
+                if base["publish_msgs_per_sec"] else 0.0)
+        print(f"{row['messages']:>9} {row['mode']:<10} {row['publish_bytes']:>10} "
+              f"{row['publish_bytes_per_message']:>6.1f} {saved:>6.1%} "
+              f"{row['publish_msgs_per_sec']:>10.0f} {gain:>+6.1%} "
+              f"{row['drain_msgs_per_sec']:>12.0f}", file=sys.stderr)
+
+
+def main() -> None:
+    """Compare the task 6 workload over MQTT 3.1.1, MQTT 5 and MQTT 5 with topic aliases."""
+    parser = argparse.ArgumentParser(description="MQTT 5 topic alias benchmark")
+    add_broker_arguments(parser)
+    parser.add_argument("--messages", type=int, nargs="+", default=[20, 1000, 100_000],
+                        help="Readings published per run (task 6 publishes 20)")
+    parser.add_argument("--payload-size", type=int, default=16, help="Payload size in bytes")
+    parser.add_argument("--receive-maximum", type=int, default=100,
+                        help="Receive Maximum of the MQTT 5 subscriber")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES),
+                        help="Protocol variants to compare")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per point; the run with the median publish rate is reported")
+    parser.add_argument("--topic", default=RunScope.unique().scenario("task6").topic("Sensor/Temp"),
+                        help="Topic of the readings (default: a task 6 style scoped topic)")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    broker = start_broker(args, separate_process=True)
+    try:
+        results = []
+        for messages in args.messages:
+            # Interleave the modes so drift in machine load hits them alike
+            runs: Dict[str, List[Dict[str, Any]]] = {mode: [] for mode in args.modes}
+            for _ in range(args.repeat):
+                for mode in args.modes:
+                    runs[mode].append(run_alias_point(args.host, args.port, mode, messages,
+                                                      args.payload_size, args.receive_maximum,
+                                                      args.topic))
+            for mode in args.modes:
+                ranked = sorted(runs[mode], key=lambda row: row["publish_msgs_per_sec"])
+                results.append(dict(ranked[len(ranked) // 2], repeats=len(ranked)))
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    print_results(results)
+    write_json({"benchmark": "aliases", "metadata": run_metadata(args),
+                "config": {"messages": args.messages, "payload_size": args.payload_size,
+                           "repeat": args.repeat,
+                           "receive_maximum": args.receive_maximum, "topic": args.topic,
+                           "modes": args.modes},
+                "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
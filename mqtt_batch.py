@@ -0,0 +1,512 @@
+"""
+Micro-batching of high-frequency sensor readings.
+
+Every reading on Sensor/Temp is its own PUBLISH: a fixed header, the topic
+and a packet id around a payload that may be only 24 bytes, plus a PUBACK
+coming back for QoS 1. A batch packs the readings of one topic into a
+single payload instead:
+
+    magic (2 bytes) | flags (1 byte) | count (varint) | (length (varint) | reading)*
+
+with everything after the flags optionally zlib compressed (FLAG_ZLIB).
+Lengths use MQTT's variable byte integer, so a small reading costs one byte
+of framing. unbatching() wraps a subscriber's on_message so its handler
+still sees one message per reading; payloads that are not batches pass
+through unchanged, so batched and plain publishers can share a topic.
+
+Two ways to batch:
+    batched()           regroups a known sequence of (topic, payload, qos)
+                        messages by size, e.g. for BulkPublisher.publish_all()
+    BatchingPublisher   buffers live readings per topic and flushes a batch
+                        when it reaches max_messages or max_bytes, or when
+                        its oldest reading has waited max_delay seconds
+
+The benchmark floods readings through a plain and a batched publisher for
+throughput and PUBLISH bytes per reading, then streams them at a fixed rate
+through BatchingPublisher for each time window to show the latency the
+window adds.
+
+Usage:
+    python mqtt_batch.py --embedded-broker --messages 20000 --windows 1 5 20
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+import zlib
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import paho.mqtt.client as mqtt
+
+from mqtt_benchmark import add_broker_arguments, latency_summary, run_metadata, start_broker, write_json
+from mqtt_bulk_publisher import BulkPublisher
+from mqtt_clients import connect_client, create_client, disconnect_client, track_connection
+from mqtt_codec import READING, BinaryCodec
+from mqtt_packets import PUBLISH, decode_varint, encode_remaining_length
+from mqtt_scenarios import RunScope
+from mqtt_waiters import CompletionTracker, scaled_timeout
+from mqtt_wire import WireMeter
+
+# First bytes of every batch payload; 0xB5 cannot start UTF-8 text
+BATCH_MAGIC = b"\xb5B"
+
+# Flag bits in the byte after the magic
+FLAG_ZLIB = 0x01
+
+DEFAULT_MAX_MESSAGES = 100
+DEFAULT_MAX_BYTES = 8192
+DEFAULT_MAX_DELAY = 0.005
+
+# Benchmark variants: one PUBLISH per reading, batches, zlib-compressed batches
+MODES = ("single", "batch", "batch+zlib")
+
+_HEADER_SIZE = len(BATCH_MAGIC) + 1
+
+
+def encode_batch(payloads: Sequence[bytes], compress: bool = False, level: int = 1) -> bytes:
+    """
+    Pack readings into one batch payload.
+
+    Args:
+        payloads: Reading payloads, in order
+        compress: zlib-compress everything after the header
+        level: zlib compression level (1 is fastest)
+    """
+    body = bytearray(encode_remaining_length(len(payloads)))
+    for payload in payloads:
+        body += encode_remaining_length(len(payload))
+        body += payload
+    if compress:
+        return BATCH_MAGIC + bytes((FLAG_ZLIB,)) + zlib.compress(body, level)
+    return BATCH_MAGIC + b"\x00" + bytes(body)
+
+
+def is_batch(payload: bytes) -> bool:
+    return payload[:len(BATCH_MAGIC)] == BATCH_MAGIC
+
+
+def decode_batch(payload: bytes) -> List[bytes]:
+    """
+    Unpack a batch payload into its readings.
+
+    Raises:
+        ValueError: If the payload is not a well-formed batch
+    """
+    if not is_batch(payload) or len(payload) < _HEADER_SIZE:
+        raise ValueError("Not a batch payload")
+    flags = payload[len(BATCH_MAGIC)]
+    body = memoryview(payload)[_HEADER_SIZE:]
+    if flags & FLAG_ZLIB:
+        try:
+            body = memoryview(zlib.decompress(body))
+        except zlib.error as e:
+            raise ValueError(f"Corrupt batch payload: {e}") from None
+    try:
+        count, pos = decode_varint(body, 0)
+        readings = []
+        for _ in range(count):
+            length, pos = decode_varint(body, pos)
+            readings.append(bytes(body[pos:pos + length]))
+            pos += length
+    except IndexError:
+        raise ValueError("Truncated batch payload") from None
+    if pos != len(body):
+        raise ValueError("Truncated batch payload")
+    return readings
+
+
+def unbatching(handler: Callable[..., None]) -> Callable[..., None]:
+    """
+    Wrap an on_message handler so it is called once per reading of a batch.
+
+    Each reading is handed over as an MQTTMessage with the batch's topic,
+    QoS and retain flag. Other payloads reach the handler unchanged.
+    """
+    def on_message(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        if not is_batch(msg.payload):
+            handler(client, userdata, msg)
+            return
+        topic = msg.topic.encode("utf-8")
+        for payload in decode_batch(msg.payload):
+            reading = mqtt.MQTTMessage(msg.mid, topic)
+            reading.payload = payload
+            reading.qos = msg.qos
+            reading.retain = msg.retain
+            reading.timestamp = msg.timestamp
+            handler(client, userdata, reading)
+
+    return on_message
+
+
+def batched(messages: Iterable[Tuple[str, bytes, int]],
+            max_messages: int = DEFAULT_MAX_MESSAGES,
+            max_bytes: int = DEFAULT_MAX_BYTES,
+            compress: bool = False) -> Iterator[Tuple[str, bytes, int]]:
+    """
+    Regroup (topic, payload, qos) messages into batches per topic and QoS.
+
+    A batch is emitted once it holds max_messages readings or max_bytes of
+    payload, and the rest at the end; readings of one topic keep their order.
+    """
+    pending: Dict[Tuple[str, int], Tuple[List[bytes], List[int]]] = {}
+    for topic, payload, qos in messages:
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        readings, size = pending.setdefault((topic, qos), ([], [0]))
+        readings.append(payload)
+        size[0] += len(payload)
+        if len(readings) >= max_messages or size[0] >= max_bytes:
+            yield topic, encode_batch(readings, compress), qos
+            del pending[(topic, qos)]
+    for (topic, qos), (readings, _) in pending.items():
+        yield topic, encode_batch(readings, compress), qos
+
+
+class BatchStats:
+    """Readings in and batch payloads out of a BatchingPublisher."""
+    __slots__ = ("readings", "batches", "reading_bytes", "batch_bytes")
+
+    def __init__(self) -> None:
+        self.readings = 0
+        self.batches = 0
+        self.reading_bytes = 0
+        self.batch_bytes = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "readings": self.readings,
+            "batches": self.batches,
+            "readings_per_batch": self.readings / self.batches if self.batches else 0.0,
+            "reading_bytes": self.reading_bytes,
+            "batch_bytes": self.batch_bytes,
+            "ratio": self.batch_bytes / self.reading_bytes if self.reading_bytes else 0.0,
+        }
+
+
+class _Pending:
+    __slots__ = ("readings", "size", "deadline")
+
+    def __init__(self, deadline: float) -> None:
+        self.readings: List[bytes] = []
+        self.size = 0
+        self.deadline = deadline
+
+
+class BatchingPublisher:
+    """
+    Buffers readings per topic and publishes them as batches.
+
+    publish() may be called from any thread; batches closed by the time
+    window are published from a background thread. A batch is sent under a
+    send lock taken before it leaves the pending table, so batches of one
+    topic go out in the order they were opened.
+    """
+
+    def __init__(self,
+                 client: mqtt.Client,
+                 max_messages: int = DEFAULT_MAX_MESSAGES,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_delay: float = DEFAULT_MAX_DELAY,
+                 compress: bool = False) -> None:
+        """
+        Args:
+            client: Connected client to publish the batches with
+            max_messages: Readings after which a topic's batch is sent
+            max_bytes: Payload bytes after which a topic's batch is sent
+            max_delay: Longest time a reading waits for its batch, in seconds
+            compress: zlib-compress the batches
+        """
+        self.client = client
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.compress = compress
+        self.stats = BatchStats()
+        self._pending: Dict[Tuple[str, int], _Pending] = {}
+        self._condition = threading.Condition()
+        # Taken before _condition whenever both are held
+        self._send_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="mqtt-batcher", daemon=True)
+        self._thread.start()
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0) -> None:
+        """Add a reading to its topic's batch."""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._send_lock:
+            with self._condition:
+                if self._closed:
+                    raise RuntimeError("BatchingPublisher is closed")
+                key = (topic, qos)
+                batch = self._pending.get(key)
+                if batch is None:
+                    batch = self._pending[key] = _Pending(time.monotonic() + self.max_delay)
+                    # A new, earlier deadline may need the flusher to wake up sooner
+                    self._condition.notify()
+                batch.readings.append(payload)
+                batch.size += len(payload)
+                if len(batch.readings) < self.max_messages and batch.size < self.max_bytes:
+                    return
+                del self._pending[key]
+            self._send(key, batch)
+
+    def flush(self) -> None:
+        """Publish every open batch now."""
+        with self._send_lock:
+            with self._condition:
+                pending, self._pending = self._pending, {}
+            for key, batch in pending.items():
+                self._send(key, batch)
+
+    def close(self) -> None:
+        """Publish the open batches and stop the flusher thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+
+    def _send(self, key: Tuple[str, int], batch: _Pending) -> None:
+        payload = encode_batch(batch.readings, self.compress)
+        with self._condition:
+            self.stats.readings += len(batch.readings)
+            self.stats.batches += 1
+            self.stats.reading_bytes += batch.size
+            self.stats.batch_bytes += len(payload)
+        self.client.publish(key[0], payload, qos=key[1])
+
+    def _run(self) -> None:
+        """Publish batches whose oldest reading has waited max_delay."""
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+                now = time.monotonic()
+                deadline = min((batch.deadline for batch in self._pending.values()), default=None)
+                if deadline is None or deadline > now:
+                    self._condition.wait(None if deadline is None else deadline - now)
+                    continue
+            # Held from before the due batches leave _pending until they are
+            # published, so publish() can't send a newer batch of the same topic first
+            with self._send_lock:
+                with self._condition:
+                    now = time.monotonic()
+                    due = [(key, batch) for key, batch in self._pending.items()
+                           if batch.deadline <= now]
+                    for key, _ in due:
+                        del self._pending[key]
+                for key, batch in due:
+                    self._send(key, batch)
+
+
+def _readings(count: int, topics: Sequence[str], qos: int, rng: random.Random) -> Iterator[Tuple[str, bytes, int]]:
+    """Binary temperature readings (sequence, send time, value) spread over `topics`."""
+    codec = BinaryCodec()
+    value = 20.0
+    for sequence in range(count):
+        value += rng.uniform(-0.05, 0.05)
+        yield topics[sequence % len(topics)], codec.encode(sequence, round(value, 2)), qos
+
+
+def _open_pair(host: str,
+               port: int,
+               topic_filter: str,
+               qos: int,
+               on_reading: Callable[[bytes], None]) -> Tuple[mqtt.Client, mqtt.Client, WireMeter, CompletionTracker]:
+    """Connect an unbatching subscriber and a metered publisher."""
+    tracker = CompletionTracker("batch")
+    subscriber = create_client("batch-subscriber")
+    track_connection(subscriber, tracker, [(topic_filter, qos)])
+
+    def handler(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        on_reading(msg.payload)
+        tracker.message_received()
+
+    subscriber.on_message = unbatching(handler)
+    if not connect_client(subscriber, tracker, host, port, wait_suback=True):
+        raise RuntimeError("Subscriber could not connect and subscribe")
+    publisher = create_client("batch-publisher")
+    meter = WireMeter(publisher._client_id.decode(), "batch")
+    meter.attach(publisher)
+    publisher_tracker = CompletionTracker("batch-pub")
+    track_connection(publisher, publisher_tracker)
+    if not connect_client(publisher, publisher_tracker, host, port):
+        disconnect_client(subscriber)
+        raise RuntimeError("Publisher could not connect")
+    return subscriber, publisher, meter, tracker
+
+
+def run_flood(host: str,
+              port: int,
+              mode: str,
+              messages: int,
+              topics: Sequence[str],
+              topic_filter: str,
+              qos: int,
+              max_messages: int) -> Dict[str, Any]:
+    """
+    Publish `messages` readings as fast as acknowledgements allow.
+
+    Returns:
+        dict: One result row with end-to-end readings per second and PUBLISH bytes
+    """
+    timeout = scaled_timeout(messages)
+    subscriber, publisher, meter, tracker = _open_pair(host, port, topic_filter, qos, lambda payload: None)
+    bulk = BulkPublisher(publisher)
+    try:
+        readings = _readings(messages, topics, qos, random.Random(520))
+        if mode != "single":
+            readings = batched(readings, max_messages, compress=mode == "batch+zlib")
+        begin = time.perf_counter()
+        stats = bulk.publish_all(readings, timeout)
+        complete = tracker.wait_messages(messages, timeout)
+        elapsed = time.perf_counter() - begin
+    finally:
+        disconnect_client(publisher)
+        disconnect_client(subscriber)
+
+    sent = meter.counts["batch"][0]
+    return {
+        "phase": "flood",
+        "mode": mode,
+        "window_ms": None,
+        "readings": messages,
+        "received": tracker.received,
+        "complete": complete,
+        "publishes": stats.published,
+        "publish_bytes": sent.bytes[PUBLISH],
+        "bytes_per_reading": sent.bytes[PUBLISH] / messages if messages else 0.0,
+        "wire_bytes_sent": sent.total_bytes,
+        "readings_per_sec": tracker.received / elapsed if elapsed else 0.0,
+        "latency_ms": None,
+    }
+
+
+def run_paced(host: str,
+              port: int,
+              mode: str,
+              window: float,
+              rate: float,
+              seconds: float,
+              topics: Sequence[str],
+              topic_filter: str,
+              qos: int,
+              max_messages: int) -> Dict[str, Any]:
+    """
+    Stream readings at `rate` per second and measure their end-to-end latency.
+
+    Returns:
+        dict: One result row with latency percentiles and PUBLISH bytes
+    """
+    messages = int(rate * seconds)
+    latencies = array("q")
+
+    def on_reading(payload: bytes) -> None:
+        _, sent_ns, _ = READING.unpack_from(payload)
+        latencies.append(time.time_ns() - sent_ns)
+
+    subscriber, publisher, meter, tracker = _open_pair(host, port, topic_filter, qos, on_reading)
+    batcher = None
+    if mode != "single":
+        batcher = BatchingPublisher(publisher, max_messages, max_delay=window,
+                                    compress=mode == "batch+zlib")
+    publish = batcher.publish if batcher is not None else publisher.publish
+    try:
+        codec = BinaryCodec()
+        begin = time.perf_counter()
+        for sequence in range(messages):
+            delay = begin + sequence / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Encoded at send time, so the latency starts when the reading exists
+            publish(topics[sequence % len(topics)], codec.encode(sequence, 20.0), qos=qos)
+        if batcher is not None:
+            batcher.close()
+        complete = tracker.wait_messages(messages, scaled_timeout(messages))
+    finally:
+        disconnect_client(publisher)
+        disconnect_client(subscriber)
+
+    sent = meter.counts["batch"][0]
+    return {
+        "phase": "paced",
+        "mode": mode,
+        "window_ms": window * 1000 if batcher is not None else None,
+        "readings": messages,
+        "received": tracker.received,
+        "complete": complete,
+        "publishes": sent.packets[PUBLISH],
+        "publish_bytes": sent.bytes[PUBLISH],
+        "bytes_per_reading": sent.bytes[PUBLISH] / messages if messages else 0.0,
+        "wire_bytes_sent": sent.total_bytes,
+        "readings_per_sec": rate,
+        "latency_ms": latency_summary(latencies),
+        "batches": batcher.stats.as_dict() if batcher is not None else None,
+    }
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    """Print rate, bytes and latency per run, relative to one PUBLISH per reading."""
+    print(f"{'Phase':<6} {'Mode':<11} {'Window':>7} {'PUBLISHes':>9} {'B/reading':>9} {'Saved':>7} "
+          f"{'Readings/s':>10} {'Gain':>7} {'p50 ms':>7} {'p99 ms':>7}", file=sys.stderr)
+    baselines = {row["phase"]: row for row in results if row["mode"] == "single"}
+    for row in results:
+        base = baselines.get(row["phase"], row)
+        saved = 1 - row["bytes_per_reading"] / base["bytes_per_reading"] if base["bytes_per_reading"] else 0.0
+        gain = (row["readings_per_sec"] / base["readings_per_sec"] - 1
+                if base["readings_per_sec"] else 0.0)
+        window = f"{row['window_ms']:.0f} ms" if row["window_ms"] is not None else "-"
+        latency = row["latency_ms"]
+        p50, p99 = (f"{latency['p50']:>7.2f}", f"{latency['p99']:>7.2f}") if latency else ("-".rjust(7),) * 2
+        print(f"{row['phase']:<6} {row['mode']:<11} {window:>7} {row['publishes']:>9} "
+              f"{row['bytes_per_reading']:>9.1f} {saved:>6.1%} {row['readings_per_sec']:>10.0f} "
+              f"{gain:>+6.1%} {p50} {p99}", file=sys.stderr)
+
+
+def main() -> None:
+    """Compare single readings with batches for throughput, bytes and latency."""
+    parser = argparse.ArgumentParser(description="Sensor reading micro-batching benchmark")
+    add_broker_arguments(parser)
+    parser.add_argument("--messages", type=int, default=20_000, help="Readings in the flood phase")
+    parser.add_argument("--topics", type=int, default=10, help="Sensor topics the readings are spread over")
+    parser.add_argument("--qos", type=int, default=1, choices=[0, 1, 2], help="QoS level")
+    parser.add_argument("--max-messages", type=int, default=DEFAULT_MAX_MESSAGES,
+                        help="Readings per batch at most")
+    parser.add_argument("--windows", type=float, nargs="+", default=[1.0, 5.0, 20.0],
+                        help="BatchingPublisher time windows for the paced phase, in milliseconds")
+    parser.add_argument("--rate", type=float, default=2000.0, help="Readings per second in the paced phase")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Duration of each paced run")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES),
+                        help="Variants to compare")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    scope = RunScope.unique().scenario("batch")
+    topics = [scope.topic(f"Sensors/Room{index}/Temperature") for index in range(args.topics)]
+    topic_filter = scope.topic("Sensors/+/Temperature")
+    broker = start_broker(args, separate_process=True)
+    try:
+        results = [run_flood(args.host, args.port, mode, args.messages, topics, topic_filter,
+                             args.qos, args.max_messages) for mode in args.modes]
+        for mode in args.modes:
+            for window in ([0.0] if mode == "single" else args.windows):
+                results.append(run_paced(args.host, args.port, mode, window / 1000, args.rate,
+                                         args.seconds, topics, topic_filter, args.qos,
+                                         args.max_messages))
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    print_results(results)
+    write_json({"benchmark": "batch", "metadata": run_metadata(args),
+                "config": {"messages": args.messages, "topics": args.topics, "qos": args.qos,
+                           "max_messages": args.max_messages, "windows_ms": args.windows,
+                           "rate": args.rate, "seconds": args.seconds, "modes": args.modes},
+                "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Publish throughput benchmark.
+
+Pushes N messages through a publisher/subscriber pair set up like task 2 and
+task 3, for every combination of QoS level and payload size. Each payload
+starts with a sequence number and the send timestamp, so the subscriber can
+compute end-to-end latency. Results are emitted as JSON to allow comparing
+runs for regressions.
+
+Usage:
+    python mqtt_benchmark.py --embedded-broker --messages 100000 --qos 0 1 2
+    python mqtt_benchmark.py --host localhost --port 1883 --output results.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import struct
+import sys
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import paho.mqtt
+import paho.mqtt.client as mqtt
+
+from mqtt_broker import BrokerProcess, EmbeddedBroker
+from mqtt_bulk_publisher import DEFAULT_WINDOW, BulkPublisher
+from mqtt_clients import connect_client, create_client, disconnect_client, track_connection
+from mqtt_waiters import CompletionTracker
+
+# Sequence number and send time (ns since the epoch) at the start of each payload
+PAYLOAD_HEADER = struct.Struct("!QQ")
+
+PERCENTILES = (("p50", 50.0), ("p95", 95.0), ("p99", 99.0), ("p999", 99.9))
+
+
+def make_payload(sequence: int, size: int) -> bytes:
+    """Build a payload of `size` bytes carrying `sequence` and the current time."""
+    header = PAYLOAD_HEADER.pack(sequence, time.time_ns())
+    return header + b"\x00" * (size - PAYLOAD_HEADER.size)
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    # The smallest value with at least pct% of the values at or below it; the
+    # tolerance keeps float error (99.9 / 100 * 1000 = 999.0000000000001)
+    # from pushing an exact rank one place up
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values) - 1e-9) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def latency_summary(latencies_ns: Sequence[int]) -> Dict[str, float]:
+    """Summarise latencies in nanoseconds as milliseconds."""
+    values = sorted(latencies_ns)
+    summary = {name: percentile(values, pct) / 1e6 for name, pct in PERCENTILES}
+    summary["max"] = values[-1] / 1e6 if values else 0.0
+    summary["mean"] = sum(values) / len(values) / 1e6 if values else 0.0
+    return summary
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process in bytes (peak RSS if /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_publish_benchmark(host: str,
+                          port: int,
+                          messages: int,
+                          qos: int,
+                          payload_size: int,
+                          topic: str = "Benchmark/Publish",
+                          timeout: float = 60.0,
+                          window: int = DEFAULT_WINDOW) -> Dict[str, Any]:
+    """
+    Publish `messages` messages and measure rate and end-to-end latency.
+
+    Args:
+        host: Broker host
+        port: Broker port
+        messages: Number of messages to publish
+        qos: QoS used for both the publish and the subscription
+        payload_size: Payload size in bytes (at least the header size)
+        topic: Topic to publish on
+        timeout: Upper bound for publishing and for delivery
+        window: Maximum number of unacknowledged messages
+
+    Returns:
+        dict: One result row
+    """
+    payload_size = max(payload_size, PAYLOAD_HEADER.size)
+    latencies = array("q")
+    subscriber_tracker = CompletionTracker(f"bench-q{qos}")
+    publisher_tracker = CompletionTracker(f"bench-q{qos}-pub")
+
+    def on_message(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        _, sent_ns = PAYLOAD_HEADER.unpack_from(msg.payload)
+        latencies.append(time.time_ns() - sent_ns)
+        subscriber_tracker.message_received()
+
+    # Task 3 style subscriber and task 2 style publisher
+    subscriber = create_client("bench-subscriber")
+    track_connection(subscriber, subscriber_tracker, [(topic, qos)])
+    subscriber.on_message = on_message
+    publisher = create_client("bench-publisher")
+    track_connection(publisher, publisher_tracker)
+    bulk = BulkPublisher(publisher, window)
+
+    try:
+        if not connect_client(subscriber, subscriber_tracker, host, port, wait_suback=True):
+            raise RuntimeError("Subscriber could not connect and subscribe")
+        if not connect_client(publisher, publisher_tracker, host, port):
+            raise RuntimeError("Publisher could not connect")
+
+        # Payloads are built as window slots free up, so each one carries its
+        # send time rather than the time the whole batch was queued
+        start = time.perf_counter()
+        stats = bulk.publish_all(((topic, make_payload(i, payload_size), qos)
+                                  for i in range(messages)), timeout)
+        publish_seconds = time.perf_counter() - start
+        subscriber_tracker.wait_messages(messages, timeout)
+        elapsed = time.perf_counter() - start
+    finally:
+        bulk.close()
+        disconnect_client(publisher)
+        disconnect_client(subscriber)
+
+    delivered = len(latencies)
+    return {
+        "qos": qos,
+        "payload_size": payload_size,
+        "messages": messages,
+        "window": window,
+        "published": stats.published,
+        "delivered": delivered,
+        "publish_seconds": publish_seconds,
+        "elapsed_seconds": elapsed,
+        "publish_msgs_per_sec": stats.published / publish_seconds if publish_seconds else 0.0,
+        "msgs_per_sec": delivered / elapsed if elapsed else 0.0,
+        "bytes_per_sec": delivered * payload_size / elapsed if elapsed else 0.0,
+        "latency_ms": latency_summary(latencies),
+    }
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    """Print a human readable summary table to stderr."""
+    print(f"{'QoS':>3} {'Size':>7} {'Delivered':>10} {'msgs/s':>10} {'MB/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'p999 ms':>8}", file=sys.stderr)
+    for row in results:
+        latency = row["latency_ms"]
+        print(f"{row['qos']:>3} {row['payload_size']:>7} {row['delivered']:>10} "
+              f"{row['msgs_per_sec']:>10.0f} {row['bytes_per_sec'] / 1e6:>8.2f} "
+              f"{latency['p50']:>8.2f} {latency['p95']:>8.2f} "
+              f"{latency['p99']:>8.2f} {latency['p999']:>8.2f}", file=sys.stderr)
+
+
+def add_broker_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the --host/--port/--embedded-broker options shared by the benchmarks."""
+    parser.add_argument("--host", default="localhost", help="MQTT broker host")
+    parser.add_argument("--port", type=int, default=1883, help="MQTT broker port")
+    parser.add_argument("--embedded-broker", action="store_true",
+                        help="Run against an in-process broker on an ephemeral port")
+
+
+def start_broker(args: argparse.Namespace,
+                 separate_process: bool = False) -> Optional[Union[EmbeddedBroker, BrokerProcess]]:
+    """
+    Start the embedded broker if requested and point args at it.
+
+    Args:
+        args: Parsed options from add_broker_arguments()
+        separate_process: Run the broker in a child process instead of a thread
+    """
+    if not args.embedded_broker:
+        return None
+    broker = BrokerProcess() if separate_process else EmbeddedBroker()
+    args.host, args.port = broker.start()
+    return broker
+
+
+def run_metadata(args: argparse.Namespace) -> Dict[str, Any]:
+    """Describe the environment a result set was produced in."""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "paho_mqtt": paho.mqtt.__version__,
+        "platform": platform.platform(),
+        "broker": "embedded" if args.embedded_broker else f"{args.host}:{args.port}",
+    }
+
+
+def write_json(document: Dict[str, Any], output: Optional[str]) -> None:
+    """Write a JSON document to `output`, or stdout if not given."""
+    text = json.dumps(document, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def main() -> None:
+    """Run the publish benchmark matrix and emit JSON."""
+    parser = argparse.ArgumentParser(description="MQTT publish throughput benchmark")
+    add_broker_arguments(parser)
+    parser.add_argument("--messages", type=int, default=10_000,
+                        help="Messages per run (10^3 - 10^6)")
+    parser.add_argument("--qos", type=int, nargs="+", default=[0, 1, 2], choices=[0, 1, 2],
+                        help="QoS levels to benchmark")
+    parser.add_argument("--payload-size", type=int, nargs="+", default=[64],
+                        help="Payload sizes in bytes")
+    parser.add_argument("--timeout", type=float, default=120.0,
+                        help="Timeout in seconds for each run")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                        help="Maximum number of unacknowledged publishes")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    broker = start_broker(args)
+    try:
+        results = []
+        for qos in args.qos:
+            for size in args.payload_size:
+                results.append(run_publish_benchmark(
+                    args.host, args.port, args.messages, qos, size, timeout=args.timeout,
+                    window=args.window))
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    print_results(results)
+    write_json({"benchmark": "publish", "metadata": run_metadata(args),
+                "config": {"messages": args.messages, "qos": args.qos,
+                           "payload_size": args.payload_size, "window": args.window},
+                "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,811 @@
+"""
+Lightweight in-process MQTT 3.1.1 / 5.0 broker.
+
+A stand-in for the EMQX container the assignment normally runs against. It
+runs on an asyncio event loop (optionally in a background thread) and listens
+on an ephemeral port, so the tasks and benchmarks can run hermetically.
+
+Supported:
+    - CONNECT with clean_session, client takeover and last will
+    - Persistent sessions with offline queues for QoS 1/2 messages
+    - PUBLISH at QoS 0/1/2 in both directions, with in-flight resend on reconnect
+    - SUBSCRIBE/UNSUBSCRIBE with + and # wildcards
+    - MQTT 5 framing (properties, reason codes, session expiry) and shared
+      subscriptions ($share/<group>/<filter>, round-robin over online members)
+    - MQTT 5 topic aliases from publishers and the subscriber's Receive Maximum
+    - Retained messages
+    - Keepalive enforcement and PINGREQ/PINGRESP
+
+Usage:
+    with EmbeddedBroker() as broker:
+        client.connect(broker.host, broker.port)
+
+    python mqtt_broker.py --port 1883
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+import mqtt_packets as mp
+from mqtt_topics import topic_matches
+
+# Outgoing QoS 1/2 messages that may be unacknowledged per session
+DEFAULT_MAX_INFLIGHT = 1000
+
+# Topic aliases each MQTT 5 client may set up (CONNACK Topic Alias Maximum)
+DEFAULT_TOPIC_ALIAS_MAXIMUM = 64
+
+# Pending connections the listening socket accepts (connection storms)
+LISTEN_BACKLOG = 4096
+
+# Write buffer size above which publishers feeding a connection are paused
+WRITE_HIGH_WATER = 4 * 1024 * 1024
+
+# Outgoing in-flight states
+_AWAIT_ACK = 0      # PUBLISH sent, waiting for PUBACK (QoS 1) or PUBREC (QoS 2)
+_AWAIT_COMP = 1     # PUBREL sent, waiting for PUBCOMP
+
+
+class Message:
+    """An application message as routed by the broker."""
+    __slots__ = ("topic", "topic_bytes", "payload", "qos", "retain")
+
+    def __init__(self, topic: str, payload: bytes, qos: int, retain: bool = False) -> None:
+        self.topic = topic
+        self.topic_bytes = topic.encode("utf-8")
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+class Session:
+    """Broker-side state for one client ID."""
+
+    def __init__(self, client_id: str, clean: bool, max_queued: Optional[int]) -> None:
+        self.client_id = client_id
+        self.clean = clean
+        self.subscriptions: Dict[str, int] = {}
+        # Shared subscriptions: $share/<group>/<filter> -> qos (routed via MQTTBroker.shared)
+        self.shared: Dict[str, int] = {}
+        # (message, delivery qos) waiting to be sent
+        self.queue: Deque[Tuple[Message, int]] = deque(maxlen=max_queued)
+        # mid -> (message, delivery qos, state); insertion order is send order
+        self.inflight: Dict[int, Tuple[Message, int, int]] = {}
+        # QoS 2 packet ids received from the client and not yet released
+        self.incoming_qos2: Set[int] = set()
+        self.connection: Optional["BrokerConnection"] = None
+        self._last_mid = 0
+
+    def next_mid(self) -> int:
+        """Allocate a packet identifier that is not currently in flight."""
+        mid = self._last_mid
+        while True:
+            mid = mid % 65535 + 1
+            if mid not in self.inflight:
+                self._last_mid = mid
+                return mid
+
+    def granted_qos(self, topic: str) -> int:
+        """Highest QoS of all subscriptions matching `topic`, or -1."""
+        best = -1
+        for topic_filter, qos in self.subscriptions.items():
+            if qos > best and topic_matches(topic_filter, topic):
+                best = qos
+        return best
+
+
+class SharedGroup:
+    """The members of one $share/<group>/<filter> subscription."""
+    __slots__ = ("topic_filter", "members", "_next")
+
+    def __init__(self, topic_filter: str) -> None:
+        self.topic_filter = topic_filter
+        # Session -> granted QoS, in subscription order
+        self.members: Dict[Session, int] = {}
+        self._next = 0
+
+    def pick(self) -> Optional[Tuple[Session, int]]:
+        """Next member in round-robin order, skipping members that are offline."""
+        members = list(self.members.items())
+        if not members:
+            return None
+        start = self._next % len(members)
+        for offset in range(len(members)):
+            session, qos = members[(start + offset) % len(members)]
+            if session.connection is not None:
+                self._next = start + offset + 1
+                return session, qos
+        # Nobody online: queue for the next one in line (if its session is persistent)
+        self._next = start + 1
+        return members[start]
+
+
+class BrokerConnection(asyncio.Protocol):
+    """One client network connection."""
+
+    def __init__(self, broker: "MQTTBroker") -> None:
+        self.broker = broker
+        self.transport: Optional[asyncio.Transport] = None
+        self.session: Optional[Session] = None
+        self.will: Optional[Message] = None
+        self.keepalive = 0
+        self.protocol = mp.MQTT_V311
+        # Property block appended to outgoing PUBLISH variable headers (MQTT 5 only)
+        self.publish_properties: Optional[bytes] = None
+        # Unacknowledged QoS 1/2 deliveries allowed (lowered by MQTT 5 Receive Maximum)
+        self.receive_maximum = broker.max_inflight
+        # Topic alias -> topic name set up by the client's PUBLISHes (MQTT 5)
+        self.topic_aliases: Dict[int, str] = {}
+        self.last_received = time.monotonic()
+        self.closed = False
+        self._buffer = bytearray()
+        self._write_paused = False
+        self._blocked_sources: Set["BrokerConnection"] = set()
+        self._keepalive_handle: Optional[asyncio.TimerHandle] = None
+
+    # --- asyncio.Protocol ---
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+        transport.set_write_buffer_limits(high=WRITE_HIGH_WATER)
+
+    def data_received(self, data: bytes) -> None:
+        self.last_received = time.monotonic()
+        self.broker.bytes_in += len(data)
+        buffer = self._buffer
+        buffer += data
+        pos = 0
+        try:
+            while not self.closed:
+                header = mp.decode_fixed_header(buffer, pos)
+                if header is None:
+                    break
+                first, length, start = header
+                end = start + length
+                if end > len(buffer):
+                    break
+                self._handle(first, bytes(buffer[start:end]))
+                pos = end
+        except (ValueError, IndexError, UnicodeDecodeError):
+            # Malformed packet: the spec requires closing the connection
+            self.abort()
+            return
+        del buffer[:pos]
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.closed = True
+        if self._keepalive_handle is not None:
+            self._keepalive_handle.cancel()
+        self._resume_sources()
+        session = self.session
+        if session is not None and session.connection is self:
+            session.connection = None
+            if session.clean:
+                self.broker.discard_session(session)
+        if self.will is not None:
+            will, self.will = self.will, None
+            self.broker.route(will, None)
+
+    def pause_writing(self) -> None:
+        self._write_paused = True
+
+    def resume_writing(self) -> None:
+        self._write_paused = False
+        self._resume_sources()
+
+    # --- Helpers ---
+
+    def write(self, data: bytes, source: Optional["BrokerConnection"] = None) -> None:
+        """Send bytes, applying backpressure to `source` if we are congested."""
+        self.transport.write(data)
+        self.broker.bytes_out += len(data)
+        if self._write_paused and source is not None and source is not self:
+            if source not in self._blocked_sources:
+                source.transport.pause_reading()
+                self._blocked_sources.add(source)
+
+    def send_publish(self,
+                     message: "Message",
+                     qos: int,
+                     mid: Optional[int] = None,
+                     source: Optional["BrokerConnection"] = None,
+                     dup: bool = False) -> None:
+        """Write a PUBLISH in this connection's protocol version."""
+        self.write(mp.publish_packet(message.topic_bytes, message.payload, qos, mid,
+                                     message.retain, dup, self.publish_properties), source)
+
+    def _resume_sources(self) -> None:
+        for source in self._blocked_sources:
+            if not source.closed:
+                source.transport.resume_reading()
+        self._blocked_sources.clear()
+
+    def abort(self) -> None:
+        """Drop the connection without a DISCONNECT (the will is published)."""
+        if not self.closed:
+            self.closed = True
+            self.transport.abort()
+
+    def _check_keepalive(self) -> None:
+        if self.closed:
+            return
+        idle = time.monotonic() - self.last_received
+        if idle > self.keepalive * 1.5:
+            self.abort()
+            return
+        self._keepalive_handle = self.broker.loop.call_later(
+            self.keepalive * 1.5 - idle, self._check_keepalive)
+
+    # --- Packet handling ---
+
+    def _handle(self, first: int, body: bytes) -> None:
+        packet_type = first >> 4
+        if self.session is None and packet_type != mp.CONNECT:
+            self.abort()
+            return
+        if packet_type == mp.PUBLISH:
+            self._on_publish(first, body)
+        elif packet_type == mp.PUBACK:
+            self.broker.acknowledge(self.session, int.from_bytes(body[:2], "big"))
+        elif packet_type == mp.PUBREC:
+            self._on_pubrec(int.from_bytes(body[:2], "big"))
+        elif packet_type == mp.PUBREL:
+            mid = int.from_bytes(body[:2], "big")
+            self.session.incoming_qos2.discard(mid)
+            self.write(mp.ack_packet(mp.PUBCOMP, mid))
+        elif packet_type == mp.PUBCOMP:
+            self.broker.acknowledge(self.session, int.from_bytes(body[:2], "big"))
+        elif packet_type == mp.SUBSCRIBE:
+            self._on_subscribe(body)
+        elif packet_type == mp.UNSUBSCRIBE:
+            self._on_unsubscribe(body)
+        elif packet_type == mp.PINGREQ:
+            self.write(bytes((mp.PINGRESP << 4, 0)))
+        elif packet_type == mp.DISCONNECT:
+            # MQTT 5 can ask for the will to be published anyway (on connection_lost)
+            if not (body and body[0] == mp.REASON_DISCONNECT_WITH_WILL):
+                self.will = None
+            self.closed = True
+            self.transport.close()
+        elif packet_type == mp.CONNECT:
+            if self.session is not None:
+                self.abort()  # A second CONNECT is a protocol violation
+            else:
+                self._on_connect(body)
+        else:
+            self.abort()
+
+    def _on_connect(self, body: bytes) -> None:
+        protocol_name, pos = mp.decode_string(body, 0)
+        level = body[pos]
+        flags = body[pos + 1]
+        self.keepalive = int.from_bytes(body[pos + 2:pos + 4], "big")
+        pos += 4
+        if (protocol_name, level) not in (("MQTT", mp.MQTT_V311), ("MQTT", mp.MQTT_V5),
+                                          ("MQIsdp", mp.MQTT_V31)):
+            self.write(mp.packet(mp.CONNACK << 4,
+                                 bytes((0, mp.CONNACK_REFUSED_PROTOCOL_VERSION))))
+            self.transport.close()
+            return
+        self.protocol = level
+        v5 = level == mp.MQTT_V5
+        properties: dict = {}
+        if v5:
+            properties, pos = mp.decode_properties(body, pos)
+            self.publish_properties = mp.encode_properties()
+            receive_maximum = properties.get(mp.PROP_RECEIVE_MAXIMUM, 65535)
+            if not receive_maximum:
+                self.abort()  # Zero is a protocol error
+                return
+            self.receive_maximum = min(receive_maximum, self.broker.max_inflight)
+
+        clean = bool(flags & 0x02)
+        # MQTT 5 separates "start clean" from "keep after disconnect"
+        keep = properties.get(mp.PROP_SESSION_EXPIRY_INTERVAL, 0) > 0 if v5 else not clean
+        client_id, pos = mp.decode_string(body, pos)
+        if flags & 0x04:
+            if v5:
+                _, pos = mp.decode_properties(body, pos)
+            will_topic, pos = mp.decode_string(body, pos)
+            will_payload, pos = mp.decode_binary(body, pos)
+            self.will = Message(will_topic, will_payload,
+                                (flags >> 3) & 0x03, bool(flags & 0x20))
+        connack_properties = {}
+        if not client_id:
+            if not clean and not v5:
+                self.write(mp.packet(mp.CONNACK << 4,
+                                     bytes((0, mp.CONNACK_REFUSED_IDENTIFIER_REJECTED))))
+                self.transport.close()
+                return
+            client_id = f"auto-{uuid4().hex}"
+            connack_properties[mp.PROP_ASSIGNED_CLIENT_IDENTIFIER] = client_id
+        if v5 and self.broker.topic_alias_maximum:
+            connack_properties[mp.PROP_TOPIC_ALIAS_MAXIMUM] = self.broker.topic_alias_maximum
+
+        session, present = self.broker.attach_session(self, client_id, clean, keep)
+        self.session = session
+        connack = bytes((1 if present else 0, mp.CONNACK_ACCEPTED))
+        if v5:
+            connack += mp.encode_properties(connack_properties)
+        self.write(mp.packet(mp.CONNACK << 4, connack))
+        self.broker.connack_sent()
+        if self.keepalive:
+            self._keepalive_handle = self.broker.loop.call_later(
+                self.keepalive * 1.5, self._check_keepalive)
+        if present:
+            self.broker.resume_session(session)
+
+    def _on_publish(self, first: int, body: bytes) -> None:
+        qos = (first >> 1) & 0x03
+        retain = bool(first & 0x01)
+        topic, pos = mp.decode_string(body, 0)
+        if qos == 3 or "+" in topic or "#" in topic:
+            self.abort()
+            return
+        mid = 0
+        if qos:
+            mid = int.from_bytes(body[pos:pos + 2], "big")
+            pos += 2
+        if self.protocol == mp.MQTT_V5:
+            properties, pos = mp.decode_properties(body, pos)
+            alias = properties.get(mp.PROP_TOPIC_ALIAS)
+            if alias is not None:
+                # A topic name (re)binds the alias, an empty one uses it
+                if not 0 < alias <= self.broker.topic_alias_maximum:
+                    self.abort()
+                    return
+                if topic:
+                    self.topic_aliases[alias] = topic
+                else:
+                    topic = self.topic_aliases.get(alias, "")
+        if not topic:
+            self.abort()
+            return
+        message = Message(topic, body[pos:], qos, retain)
+        if qos == 0:
+            self.broker.route(message, self)
+            return
+        if qos == 1:
+            self.broker.route(message, self)
+            self.write(mp.ack_packet(mp.PUBACK, mid))
+        else:
+            # Deliver on first receipt; duplicates are ignored until PUBREL
+            if mid not in self.session.incoming_qos2:
+                self.session.incoming_qos2.add(mid)
+                self.broker.route(message, self)
+            self.write(mp.ack_packet(mp.PUBREC, mid))
+
+    def _on_pubrec(self, mid: int) -> None:
+        entry = self.session.inflight.get(mid)
+        if entry is not None:
+            self.session.inflight[mid] = (entry[0], entry[1], _AWAIT_COMP)
+        self.write(mp.ack_packet(mp.PUBREL, mid))
+
+    def _on_subscribe(self, body: bytes) -> None:
+        mid = body[:2]
+        pos = 2
+        v5 = self.protocol == mp.MQTT_V5
+        if v5:
+            _, pos = mp.decode_properties(body, pos)
+        granted = bytearray()
+        new_filters: List[Tuple[str, int]] = []
+        while pos < len(body):
+            topic_filter, pos = mp.decode_string(body, pos)
+            # MQTT 5 puts No Local / Retain As Published / Retain Handling in the
+            # upper bits; only the QoS is honoured
+            qos = min(body[pos] & 0x03, 2)
+            pos += 1
+            try:
+                shared = mp.split_shared(topic_filter)
+            except ValueError:
+                granted.append(mp.REASON_TOPIC_FILTER_INVALID if v5 else 0x80)
+                continue
+            if shared is not None:
+                self.broker.add_shared(self.session, topic_filter, shared[1], qos)
+            else:
+                self.session.subscriptions[topic_filter] = qos
+                new_filters.append((topic_filter, qos))
+            granted.append(qos)
+        properties = mp.encode_properties() if v5 else b""
+        self.write(mp.packet(mp.SUBACK << 4, mid + properties + bytes(granted)))
+        self.broker.send_retained(self.session, new_filters)
+
+    def _on_unsubscribe(self, body: bytes) -> None:
+        pos = 2
+        v5 = self.protocol == mp.MQTT_V5
+        if v5:
+            _, pos = mp.decode_properties(body, pos)
+        reasons = bytearray()
+        while pos < len(body):
+            topic_filter, pos = mp.decode_string(body, pos)
+            if topic_filter in self.session.shared:
+                self.broker.remove_shared(self.session, topic_filter)
+                existed = True
+            else:
+                existed = self.session.subscriptions.pop(topic_filter, None) is not None
+            reasons.append(mp.REASON_SUCCESS if existed else mp.REASON_NO_SUBSCRIPTION_EXISTED)
+        if v5:
+            self.write(mp.packet(mp.UNSUBACK << 4,
+                                 body[:2] + mp.encode_properties() + bytes(reasons)))
+        else:
+            self.write(mp.packet(mp.UNSUBACK << 4, body[:2]))
+
+
+class MQTTBroker:
+    """The broker core: sessions, routing and retained messages."""
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 max_inflight: int = DEFAULT_MAX_INFLIGHT,
+                 max_queued: Optional[int] = None,
+                 topic_alias_maximum: int = DEFAULT_TOPIC_ALIAS_MAXIMUM) -> None:
+        """
+        Args:
+            host: Interface to listen on
+            port: TCP port, 0 for an ephemeral port
+            max_inflight: Unacknowledged QoS 1/2 deliveries per session; MQTT 5
+                          clients can ask for fewer with Receive Maximum
+            max_queued: Cap on each session's offline queue (oldest dropped), None for unbounded
+            topic_alias_maximum: Topic aliases per MQTT 5 connection, 0 to disable them
+        """
+        self.host = host
+        self.port = port
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.topic_alias_maximum = topic_alias_maximum
+        self.sessions: Dict[str, Session] = {}
+        self.retained: Dict[str, Message] = {}
+        # Shared subscription groups by $share/<group>/<filter>
+        self.shared: Dict[str, SharedGroup] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.messages_in = 0
+        self.messages_out = 0
+        # Wire bytes received from and written to clients
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.started_at: Optional[float] = None
+        self.first_connack_at: Optional[float] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> int:
+        """Start listening and return the bound port."""
+        self.loop = asyncio.get_running_loop()
+        self.started_at = time.perf_counter()
+        self._server = await self.loop.create_server(
+            lambda: BrokerConnection(self), self.host, self.port, backlog=LISTEN_BACKLOG)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def close(self) -> None:
+        """Stop listening and drop every client connection."""
+        if self._server is not None:
+            self._server.close()
+            for session in list(self.sessions.values()):
+                if session.connection is not None:
+                    session.connection.abort()
+            await self._server.wait_closed()
+            self._server = None
+
+    def connack_sent(self) -> None:
+        if self.first_connack_at is None:
+            self.first_connack_at = time.perf_counter()
+
+    # --- Sessions ---
+
+    def attach_session(self,
+                       connection: BrokerConnection,
+                       client_id: str,
+                       clean: bool,
+                       keep: Optional[bool] = None) -> Tuple[Session, bool]:
+        """
+        Bind a connection to the session for `client_id`.
+
+        Args:
+            connection: The connection that sent CONNECT
+            client_id: Client identifier
+            clean: Start with a new session
+            keep: Keep the session after disconnect; defaults to `not clean`
+                  (MQTT 3.1.1), MQTT 5 derives it from the session expiry
+
+        Returns:
+            tuple: (session, session_present)
+        """
+        session = self.sessions.get(client_id)
+        if session is not None and session.connection is not None:
+            # Client takeover: the older connection is closed
+            session.connection.abort()
+            session.connection = None
+        if clean or session is None:
+            if session is not None:
+                self.discard_session(session)
+            session = Session(client_id, clean, self.max_queued)
+            self.sessions[client_id] = session
+            present = False
+        else:
+            present = True
+        session.clean = not keep if keep is not None else clean
+        session.connection = connection
+        return session, present
+
+    def discard_session(self, session: Session) -> None:
+        """Forget a session and its shared subscription memberships."""
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+        for share in list(session.shared):
+            self.remove_shared(session, share)
+
+    def add_shared(self, session: Session, share: str, topic_filter: str, qos: int) -> None:
+        """Make `session` a member of the shared subscription `share`."""
+        group = self.shared.get(share)
+        if group is None:
+            group = self.shared[share] = SharedGroup(topic_filter)
+        group.members[session] = qos
+        session.shared[share] = qos
+
+    def remove_shared(self, session: Session, share: str) -> None:
+        session.shared.pop(share, None)
+        group = self.shared.get(share)
+        if group is not None:
+            group.members.pop(session, None)
+            if not group.members:
+                del self.shared[share]
+
+    def resume_session(self, session: Session) -> None:
+        """Resend unacknowledged deliveries, then flush the offline queue."""
+        connection = session.connection
+        for mid, (message, qos, state) in session.inflight.items():
+            if state == _AWAIT_ACK:
+                connection.send_publish(message, qos, mid, dup=True)
+            else:
+                connection.write(mp.ack_packet(mp.PUBREL, mid))
+        self._pump(session)
+
+    # --- Routing ---
+
+    def route(self, message: Message, source: Optional[BrokerConnection]) -> None:
+        """Deliver a published message to every matching session."""
+        self.messages_in += 1
+        if message.retain:
+            if message.payload:
+                self.retained[message.topic] = message
+            else:
+                self.retained.pop(message.topic, None)
+            # Normal deliveries carry retain=0
+            message = Message(message.topic, message.payload, message.qos)
+        for session in self.sessions.values():
+            granted = session.granted_qos(message.topic)
+            if granted >= 0:
+                self._deliver(session, message, min(message.qos, granted), source)
+        # Each matching shared subscription delivers to one of its members
+        for group in self.shared.values():
+            if topic_matches(group.topic_filter, message.topic):
+                member = group.pick()
+                if member is not None:
+                    self._deliver(member[0], message, min(message.qos, member[1]), source)
+
+    def send_retained(self, session: Session, filters: List[Tuple[str, int]]) -> None:
+        """Deliver retained messages matching newly subscribed filters."""
+        for message in list(self.retained.values()):
+            qos = -1
+            for topic_filter, granted in filters:
+                if granted > qos and topic_matches(topic_filter, message.topic):
+                    qos = granted
+            if qos >= 0:
+                self._deliver(session, message, min(message.qos, qos), None)
+
+    def _deliver(self,
+                 session: Session,
+                 message: Message,
+                 qos: int,
+                 source: Optional[BrokerConnection]) -> None:
+        connection = session.connection
+        if connection is None:
+            # Offline: persistent sessions keep QoS 1/2 messages only
+            if qos > 0 and not session.clean:
+                session.queue.append((message, qos))
+            return
+        if qos == 0:
+            self.messages_out += 1
+            connection.send_publish(message, 0, None, source)
+        elif session.queue or len(session.inflight) >= connection.receive_maximum:
+            session.queue.append((message, qos))
+        else:
+            self._send(session, message, qos, source)
+
+    def _send(self,
+              session: Session,
+              message: Message,
+              qos: int,
+              source: Optional[BrokerConnection] = None) -> None:
+        mid = session.next_mid()
+        session.inflight[mid] = (message, qos, _AWAIT_ACK)
+        self.messages_out += 1
+        session.connection.send_publish(message, qos, mid, source)
+
+    def _pump(self, session: Session) -> None:
+        """Move queued messages into the in-flight window."""
+        queue = session.queue
+        while queue and session.connection is not None \
+                and len(session.inflight) < session.connection.receive_maximum:
+            message, qos = queue.popleft()
+            if qos == 0:
+                self.messages_out += 1
+                session.connection.send_publish(message, 0)
+            else:
+                self._send(session, message, qos)
+
+    def acknowledge(self, session: Session, mid: int) -> None:
+        """Complete an outgoing QoS 1 (PUBACK) or QoS 2 (PUBCOMP) delivery."""
+        if session.inflight.pop(mid, None) is not None and session.queue:
+            self._pump(session)
+
+
+class EmbeddedBroker:
+    """
+    Runs an MQTTBroker on its own event loop in a daemon thread.
+
+    This is what the synchronous paho-based tasks use: start() returns once
+    the broker is listening, after which clients can connect to host/port.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **options) -> None:
+        """
+        Args:
+            host: Interface to listen on
+            port: TCP port, 0 for an ephemeral port
+            **options: Passed through to MQTTBroker
+        """
+        self.broker = MQTTBroker(host, port, **options)
+        self.startup_seconds: Optional[float] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self.broker.host
+
+    @property
+    def port(self) -> int:
+        return self.broker.port
+
+    def start(self) -> Tuple[str, int]:
+        """
+        Start the broker thread and wait until it is listening.
+
+        Returns:
+            tuple: (host, port)
+        """
+        start = time.perf_counter()
+        ready = threading.Event()
+        errors: List[BaseException] = []
+
+        def run() -> None:
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self.broker.start())
+            except BaseException as e:
+                errors.append(e)
+                ready.set()
+                return
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.broker.close())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="mqtt-broker", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        self.startup_seconds = time.perf_counter() - start
+        return self.host, self.port
+
+    def stop(self) -> None:
+        """Stop the event loop and wait for the broker thread to exit."""
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def first_connack_ms(self) -> Optional[float]:
+        """Milliseconds from start() to the first CONNACK sent, if any."""
+        if self.broker.first_connack_at is None or self.broker.started_at is None:
+            return None
+        return (self.broker.first_connack_at - self.broker.started_at) * 1000
+
+    def __enter__(self) -> "EmbeddedBroker":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+class BrokerProcess:
+    """
+    Runs the broker in a child Python process.
+
+    Keeps the broker's CPU time and memory out of measurements taken in the
+    calling process, and allows the broker to be killed and restarted.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        """
+        Args:
+            host: Interface to listen on
+            port: TCP port, 0 for an ephemeral port (kept across restarts)
+        """
+        self.host = host
+        self.port = port
+        self.startup_seconds: Optional[float] = None
+        self._process: Optional[subprocess.Popen] = None
+
+    def start(self) -> Tuple[str, int]:
+        """
+        Start the child process and wait until it is listening.
+
+        Returns:
+            tuple: (host, port)
+        """
+        start = time.perf_counter()
+        self._process = subprocess.Popen(
+            [sys.executable, __file__, "--host", self.host, "--port", str(self.port)],
+            stdout=subprocess.PIPE, text=True)
+        line = self._process.stdout.readline()
+        if not line.startswith("MQTT broker listening on"):
+            self.stop()
+            raise RuntimeError(f"Broker process failed to start: {line!r}")
+        self.port = int(line.rsplit(":", 1)[1])
+        self.startup_seconds = time.perf_counter() - start
+        return self.host, self.port
+
+    def stop(self) -> None:
+        """Terminate the child process."""
+        if self._process is None:
+            return
+        self._process.terminate()
+        self._process.wait()
+        self._process.stdout.close()
+        self._process = None
+
+    def __enter__(self) -> "BrokerProcess":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main() -> None:
+    """Run the broker in the foreground."""
+    parser = argparse.ArgumentParser(description="In-process MQTT 3.1.1 / 5.0 broker")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=1883, help="TCP port (0 = ephemeral)")
+    args = parser.parse_args()
+
+    async def serve() -> None:
+        broker = MQTTBroker(args.host, args.port)
+        port = await broker.start()
+        print(f"MQTT broker listening on {args.host}:{port}", flush=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await broker.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\nBroker stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Windowed, backpressure-aware bulk publishing.
+
+BulkPublisher pulls (topic, payload, qos) tuples from an iterator and keeps at
+most `window` of them unacknowledged at a time. It only returns once every
+message has completed its QoS flow (PUBACK for QoS 1, PUBCOMP for QoS 2,
+written to the socket for QoS 0), so a disconnect() right afterwards can no
+longer drop anything. Because the input is consumed lazily, the same code
+publishes 20 messages or a million.
+"""
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set, Tuple, Union
+
+import paho.mqtt.client as mqtt
+
+from mqtt_waiters import DEFAULT_TIMEOUT, record_wait
+
+# Default number of unacknowledged messages
+DEFAULT_WINDOW = 100
+
+Payload = Union[str, bytes]
+
+
+class PublishStats:
+    """Throughput counters for one publish_all() call."""
+    __slots__ = ("published", "acknowledged", "failed", "truncated", "payload_bytes",
+                 "max_in_flight", "started", "finished")
+
+    def __init__(self) -> None:
+        self.published = 0
+        self.acknowledged = 0
+        self.failed = 0
+        # Set when a window slot never freed up and the rest of the input was abandoned
+        self.truncated = False
+        self.payload_bytes = 0
+        self.max_in_flight = 0
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds from the first publish to the last acknowledgement."""
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.started
+
+    @property
+    def messages_per_second(self) -> float:
+        return self.acknowledged / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.payload_bytes / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def complete(self) -> bool:
+        """True if every message was published and acknowledged."""
+        return not self.truncated and self.failed == 0 and self.acknowledged == self.published
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "published": self.published,
+            "acknowledged": self.acknowledged,
+            "failed": self.failed,
+            "truncated": self.truncated,
+            "payload_bytes": self.payload_bytes,
+            "max_in_flight": self.max_in_flight,
+            "elapsed_seconds": self.elapsed,
+            "msgs_per_sec": self.messages_per_second,
+            "bytes_per_sec": self.bytes_per_second,
+        }
+
+
+class BulkPublisher:
+    """
+    Publishes an iterator of messages through one client with a bounded window.
+
+    The client's on_publish callback is wrapped (the previous one is still
+    called), and paho's own in-flight limit is raised to the window so
+    messages are never parked in paho's internal queue. The client should
+    not publish anything else while publish_all() runs.
+    """
+
+    def __init__(self,
+                 client: mqtt.Client,
+                 window: int = DEFAULT_WINDOW,
+                 label: Optional[str] = None) -> None:
+        """
+        Args:
+            client: Client to publish with; create the BulkPublisher before
+                    connecting so paho's in-flight limit can follow the window
+            window: Maximum number of unacknowledged messages
+            label: If given, the final acknowledgement wait is recorded
+                   under this task name in the wait report
+        """
+        self.client = client
+        self.window = window
+        self.label = label
+        self.stats = PublishStats()
+        self._slots = threading.Semaphore(window)
+        self._lock = threading.Lock()
+        self._pending: Set[int] = set()
+        # Acknowledgements that arrived before publish() returned their mid;
+        # only collected while publish_all() runs
+        self._early: Set[int] = set()
+        self._active = False
+        self._previous_on_publish = client.on_publish
+        try:
+            client.max_inflight_messages_set(window)
+        except (ValueError, RuntimeError):
+            # paho >= 2 only allows this before connecting; the excess then
+            # waits in paho's queue, still bounded by our window
+            pass
+        client.on_publish = self._on_publish
+
+    def _on_publish(self, client: mqtt.Client, userdata: Any, mid: int, *args: Any) -> None:
+        with self._lock:
+            if mid in self._pending:
+                self._pending.discard(mid)
+                self._complete()
+            elif self._active:
+                self._early.add(mid)
+        if self._previous_on_publish is not None:
+            self._previous_on_publish(client, userdata, mid, *args)
+
+    def _complete(self) -> None:
+        """Free one window slot; called with the lock held."""
+        self.stats.acknowledged += 1
+        self._slots.release()
+
+    def publish_all(self,
+                    messages: Iterable[Tuple[str, Payload, int]],
+                    timeout: float = DEFAULT_TIMEOUT) -> PublishStats:
+        """
+        Publish every message and wait for all acknowledgements.
+
+        Args:
+            messages: (topic, payload, qos) tuples, consumed lazily
+            timeout: Longest time to wait for a free window slot, and for the
+                     final acknowledgements
+
+        Returns:
+            PublishStats: Counters for this run; check `complete`
+        """
+        stats = self.stats = PublishStats()
+        with self._lock:
+            # Acknowledgements of earlier publishes (e.g. a drain fence) must not
+            # complete a message of this run that reuses their mid
+            self._early.clear()
+            self._active = True
+        for topic, payload, qos in messages:
+            if not self._slots.acquire(timeout=timeout):
+                stats.truncated = True
+                break
+            if isinstance(payload, str):
+                payload = payload.encode("utf-8")
+            info = self.client.publish(topic, payload, qos=qos)
+            # QoS 1/2 messages are queued by paho while disconnected, QoS 0 is dropped
+            if info.rc != mqtt.MQTT_ERR_SUCCESS and not (qos and info.rc == mqtt.MQTT_ERR_NO_CONN):
+                stats.failed += 1
+                self._slots.release()
+                continue
+            with self._lock:
+                stats.published += 1
+                stats.payload_bytes += len(payload)
+                if info.mid in self._early:
+                    self._early.discard(info.mid)
+                    self._complete()
+                else:
+                    self._pending.add(info.mid)
+                    stats.max_in_flight = max(stats.max_in_flight, len(self._pending))
+
+        # Every acknowledgement gives its slot back, so the window is drained
+        # once all slots can be taken
+        start = time.perf_counter()
+        deadline = start + timeout
+        acquired = 0
+        while acquired < self.window:
+            if not self._slots.acquire(timeout=max(deadline - time.perf_counter(), 0)):
+                break
+            acquired += 1
+        for _ in range(acquired):
+            self._slots.release()
+        with self._lock:
+            self._active = False
+            self._early.clear()
+        stats.finished = time.perf_counter()
+        if self.label is not None:
+            record_wait(self.label, f"{stats.published} publish ack(s)", start, stats.complete)
+        return stats
+
+    def close(self) -> None:
+        """Restore the client's original on_publish callback."""
+        self.client.on_publish = self._previous_on_publish
@@ -0,0 +1,164 @@
+"""
+Client setup shared by the assignment tasks and the benchmarks.
+
+These are the task1-task3 steps in reusable form: create a client with a
+unique ID, connect it and wait for CONNACK, and (for subscribers) subscribe
+on every connect and wait for SUBACK.
+"""
+import re
+from typing import Any, Dict, Optional, Sequence, Tuple
+from uuid import uuid4
+
+import paho.mqtt
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from mqtt_waiters import DEFAULT_TIMEOUT, CompletionTracker
+
+# Session expiry requested by persistent (clean_session=False) MQTT 5 clients, in seconds
+SESSION_EXPIRY = 3600
+
+# paho-mqtt releases (lowest included, highest excluded) whose private client
+# internals mqtt_aliases, mqtt_reconnect and mqtt_wire patch; keep requirements.txt in step
+SUPPORTED_PAHO = ((2, 1), (2, 2))
+
+
+def require_paho(module: str) -> None:
+    """
+    Refuse to load a module that patches paho internals under an untested paho.
+
+    Args:
+        module: Name of the patching module, for the error message
+
+    Raises:
+        ImportError: If the installed paho-mqtt is outside SUPPORTED_PAHO
+    """
+    version = tuple(int(part) for part in re.findall(r"\d+", paho.mqtt.__version__)[:2])
+    (low_major, low_minor), (high_major, high_minor) = SUPPORTED_PAHO
+    if not (low_major, low_minor) <= version < (high_major, high_minor):
+        raise ImportError(f"{module} patches paho-mqtt internals and supports paho-mqtt "
+                          f">={low_major}.{low_minor},<{high_major}.{high_minor}, "
+                          f"not {paho.mqtt.__version__}")
+
+
+def create_client(role: str,
+                  clean_session: bool = True,
+                  client_id: Optional[str] = None,
+                  protocol: int = mqtt.MQTTv311,
+                  receive_maximum: Optional[int] = None) -> mqtt.Client:
+    """
+    Create an MQTT client the way task 1 does.
+
+    MQTT 5 clients use paho's callback API v2 (on_connect gets ConnectFlags
+    and a ReasonCode plus the CONNACK properties). Their session settings
+    go out with every CONNECT made through connect_client(), or through
+    client.connect(**connect_options(client)).
+
+    Args:
+        role: Prefix for the generated client ID, e.g. "publisher"
+        clean_session: Whether the broker should discard the session on
+                       disconnect; for MQTT 5 this is clean start plus a
+                       session expiry of SESSION_EXPIRY when False
+        client_id: Fixed client ID (needed for persistent sessions)
+        protocol: mqtt.MQTTv311 or mqtt.MQTTv5 (shared subscriptions, topic aliases)
+        receive_maximum: MQTT 5 only: QoS 1/2 deliveries the broker may
+                         have unacknowledged at once (broker default if None)
+
+    Returns:
+        mqtt.Client: The new, unconnected client
+    """
+    client_id = client_id or f"{role}-{uuid4().hex[:8]}"  # Generate unique ID
+    if protocol != mqtt.MQTTv5:
+        return mqtt.Client(
+            client_id=client_id,
+            clean_session=clean_session
+        )
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, protocol=protocol)
+    properties = Properties(PacketTypes.CONNECT)
+    if not clean_session:
+        properties.SessionExpiryInterval = SESSION_EXPIRY
+    if receive_maximum:
+        properties.ReceiveMaximum = receive_maximum
+    client._connect_options = {"clean_start": clean_session, "properties": properties}
+    return client
+
+
+def connect_options(client: mqtt.Client) -> Dict[str, Any]:
+    """Keyword arguments for client.connect() carrying the client's MQTT 5 session settings."""
+    return getattr(client, "_connect_options", {})
+
+
+def track_connection(client: mqtt.Client,
+                     tracker: CompletionTracker,
+                     subscriptions: Sequence[Tuple[str, int]] = ()) -> None:
+    """
+    Install silent on_connect/on_subscribe callbacks that signal `tracker`.
+
+    Like task 3, the subscriptions are (re)made from on_connect so they
+    survive reconnects with a clean session.
+
+    Args:
+        client: Client to instrument
+        tracker: Receives CONNACK and SUBACK signals
+        subscriptions: (topic_filter, qos) pairs to subscribe to after CONNACK
+    """
+    def on_connect(client: mqtt.Client,
+                   userdata: Any,
+                   flags: Dict[str, bool],
+                   rc: int,
+                   *properties: Any) -> None:
+        # MQTT 5 clients also pass the CONNACK properties (callback API v2:
+        # ConnectFlags and a ReasonCode, which compares equal to its value)
+        if rc == 0 and subscriptions:
+            client.subscribe(list(subscriptions))
+        tracker.connack_received(rc, flags)
+
+    client.on_connect = on_connect
+    client.on_subscribe = lambda *args: tracker.suback_received()
+
+
+def connect_client(client: mqtt.Client,
+                   tracker: CompletionTracker,
+                   host: str,
+                   port: int,
+                   keepalive: int = 60,
+                   wait_suback: bool = False,
+                   timeout: float = DEFAULT_TIMEOUT) -> bool:
+    """
+    Connect, start the network loop and wait for the broker's answer (task 2/3).
+
+    Args:
+        client: Client whose callbacks already report into `tracker`
+        tracker: Tracker to wait on
+        host: Broker host
+        port: Broker port
+        keepalive: Keepalive interval in seconds
+        wait_suback: Also wait for the subscription made in on_connect
+        timeout: Timeout for each wait
+
+    Returns:
+        bool: True if every awaited acknowledgement arrived in time
+    """
+    client.connect(host=host, port=port, keepalive=keepalive, **connect_options(client))
+    client.loop_start()
+    if not tracker.wait_connack(timeout):
+        return False
+    if wait_suback:
+        return tracker.wait_suback(timeout)
+    return True
+
+
+def disconnect_client(client: mqtt.Client) -> None:
+    """Send DISCONNECT and stop the network loop."""
+    client.disconnect()
+    client.loop_stop()
+
+
+def discard_session(host: str, port: int, client_id: str) -> None:
+    """Drop a persistent session by connecting once with a clean session."""
+    tracker = CompletionTracker(f"discard-{client_id}")
+    client = create_client("discard", clean_session=True, client_id=client_id)
+    track_connection(client, tracker)
+    connect_client(client, tracker, host, port)
+    disconnect_client(client)
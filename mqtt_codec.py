@@ -0,0 +1,188 @@
+"""
+Pluggable payload codecs for sensor readings.
+
+A codec turns (sequence, value) into payload bytes on the publisher side and
+back into a reading on the subscriber side. TextCodec keeps the assignment's
+"Temperature reading {i}" strings; BinaryCodec packs the reading into a fixed
+24-byte struct (sequence number, send time in ns, value) that is unpacked
+straight from paho's payload bytes, without building any str on the way.
+
+Run this module to compare the per-message cost of both paths:
+    python mqtt_codec.py --messages 1000000
+"""
+import argparse
+import struct
+from abc import ABC, abstractmethod
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+# Sequence number, send time (ns since the epoch) and value
+READING = struct.Struct("!QQd")
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# (sequence, sent_ns, value); a plain tuple, as a NamedTuple would more than
+# double the decode cost
+Reading = Tuple[int, int, float]
+
+
+class PayloadCodec(ABC):
+    """
+    Interface shared by all payload codecs.
+
+    A codec missing one of the methods can't be instantiated, so it fails
+    when it is chosen rather than on a paho network thread at decode time.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def encode(self, sequence: int, value: float = 0.0, sent_ns: Optional[int] = None) -> bytes:
+        """Payload bytes of one reading."""
+
+    @abstractmethod
+    def decode(self, payload: Buffer) -> Any:
+        """Decoded form of a received payload."""
+
+    @abstractmethod
+    def sequence(self, decoded: Any) -> int:
+        """Sequence number of a decoded payload."""
+
+    @abstractmethod
+    def describe(self, decoded: Any) -> str:
+        """Human-readable form of a decoded payload, for printing."""
+
+
+class TextCodec(PayloadCodec):
+    """UTF-8 text payloads, as published by the original tasks."""
+
+    name = "text"
+
+    def __init__(self, template: str = "Temperature reading {sequence}") -> None:
+        """
+        Args:
+            template: str.format template; may use {sequence} and {value}.
+                The sequence number must be the last word.
+        """
+        self.template = template
+
+    def encode(self, sequence: int, value: float = 0.0, sent_ns: Optional[int] = None) -> bytes:
+        return self.template.format(sequence=sequence, value=value).encode()
+
+    def decode(self, payload: Buffer) -> str:
+        return bytes(payload).decode()
+
+    def sequence(self, decoded: str) -> int:
+        return int(decoded.rsplit(" ", 1)[1])
+
+    def describe(self, decoded: str) -> str:
+        return decoded
+
+
+class BinaryCodec(PayloadCodec):
+    """Fixed-layout binary readings, see READING."""
+
+    name = "binary"
+    size = READING.size
+
+    def encode(self, sequence: int, value: float = 0.0, sent_ns: Optional[int] = None) -> bytes:
+        return READING.pack(sequence, time.time_ns() if sent_ns is None else sent_ns, value)
+
+    def encode_into(self, buffer: Union[bytearray, memoryview], offset: int,
+                    sequence: int, value: float = 0.0, sent_ns: Optional[int] = None) -> None:
+        """Pack a reading into an existing buffer, e.g. a reused publish buffer."""
+        READING.pack_into(buffer, offset, sequence,
+                          time.time_ns() if sent_ns is None else sent_ns, value)
+
+    def decode(self, payload: Buffer) -> Reading:
+        # unpack_from reads the bytes in place; no slice or str is created
+        return READING.unpack_from(payload)
+
+    def sequence(self, decoded: Reading) -> int:
+        return decoded[0]
+
+    def describe(self, decoded: Reading) -> str:
+        return f"Temperature reading {decoded[0]} ({decoded[2]:.1f})"
+
+
+CODECS: Dict[str, PayloadCodec] = {codec.name: codec for codec in (TextCodec(), BinaryCodec())}
+
+
+def get_codec(name: str) -> PayloadCodec:
+    """Look up a codec by name ("text" or "binary")."""
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Unknown payload codec: {name!r}") from None
+
+
+def _measure(handler: Callable[[bytes], Any], payloads: List[bytes]) -> Dict[str, float]:
+    """CPU time and allocated bytes per message for one handler."""
+    start = time.process_time()
+    for payload in payloads:
+        handler(payload)
+    cpu_seconds = time.process_time() - start
+
+    # Keep every result alive so tracemalloc sees what each message allocates
+    tracemalloc.start()
+    results = [None] * len(payloads)
+    baseline = tracemalloc.get_traced_memory()[0]
+    for index, payload in enumerate(payloads):
+        results[index] = handler(payload)
+    allocated = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del results
+
+    return {
+        "ns_per_message": cpu_seconds / len(payloads) * 1e9,
+        "bytes_per_message": allocated / len(payloads),
+    }
+
+
+def run_benchmark(messages: int) -> Dict[str, Dict[str, float]]:
+    """
+    Time the on_message work of each payload path over `messages` payloads.
+
+    "text (original)" mirrors the original callbacks: the payload is decoded
+    once for printing and again for storing. "text + parse" decodes once and
+    parses the sequence number back out; "binary" unpacks all three fields.
+    """
+    text, binary = CODECS["text"], CODECS["binary"]
+    text_payloads = [text.encode(i) for i in range(messages)]
+    binary_payloads = [binary.encode(i, 21.5) for i in range(messages)]
+
+    def original(payload: bytes) -> Any:
+        line = f"received: '{payload.decode()}'"
+        return line, payload.decode()
+
+    def text_path(payload: bytes) -> Any:
+        return text.sequence(text.decode(payload))
+
+    def binary_path(payload: bytes) -> Any:
+        return binary.decode(payload)
+
+    return {
+        "text (original)": _measure(original, text_payloads),
+        "text + parse": _measure(text_path, text_payloads),
+        "binary": _measure(binary_path, binary_payloads),
+    }
+
+
+def main() -> None:
+    """Compare the text and binary payload paths."""
+    parser = argparse.ArgumentParser(description="Payload codec microbenchmark")
+    parser.add_argument("--messages", type=int, default=1_000_000, help="Payloads to decode")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.messages)
+    baseline = results["text (original)"]
+    print(f"{'Path':<16} {'CPU ns/msg':>11} {'Bytes/msg':>10} {'CPU vs original':>16}")
+    for name, result in results.items():
+        ratio = result["ns_per_message"] / baseline["ns_per_message"]
+        print(f"{name:<16} {result['ns_per_message']:>11.0f} "
+              f"{result['bytes_per_message']:>10.0f} {ratio:>15.2f}x")
+
+
+if __name__ == "__main__":
+    main()
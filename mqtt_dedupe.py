@@ -0,0 +1,279 @@
+"""
+Bounded duplicate suppression in front of on_message.
+
+A QoS 1 message can arrive twice: when the broker resends it after a
+reconnect (DUP flag set) before it saw our PUBACK, the first copy may
+already have been processed. Deduplicator wraps an on_message handler and
+drops messages whose key it has seen before. Keys come from the
+publisher's sequence number (via a payload codec) or from a hash of topic
+and payload. The set of seen keys is either an exact LRU of fixed size or a
+pair of rotating Bloom filters; both use constant memory, trading exactness
+for older keys (LRU forgets them, Bloom may report rare false duplicates).
+
+Run this module to measure the per-message overhead:
+    python mqtt_dedupe.py --messages 1000000 --duplicates 0.05
+"""
+import argparse
+import functools
+import hashlib
+import math
+import random
+import struct
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import paho.mqtt.client as mqtt
+
+from mqtt_codec import CODECS, PayloadCodec
+
+DEFAULT_CAPACITY = 65_536
+
+# Returns the dedupe key of a message, or None to let it through unchecked
+KeyFunction = Callable[[mqtt.MQTTMessage], Optional[bytes]]
+
+_SEQUENCE = struct.Struct("!Q")
+
+
+def sequence_key(codec: PayloadCodec) -> KeyFunction:
+    """Key messages by topic and the publisher's sequence number."""
+    def key(msg: mqtt.MQTTMessage) -> Optional[bytes]:
+        try:
+            sequence = codec.sequence(codec.decode(msg.payload))
+        except (ValueError, IndexError, struct.error):
+            return None     # Not a reading (e.g. a drain fence)
+        return _SEQUENCE.pack(sequence & 0xFFFFFFFFFFFFFFFF) + msg.topic.encode()
+
+    return key
+
+
+def content_key(msg: mqtt.MQTTMessage) -> bytes:
+    """Key messages by a 16-byte hash of topic and payload."""
+    digest = hashlib.blake2b(msg.payload, digest_size=16, key=msg.topic.encode()[:64])
+    return digest.digest()
+
+
+class LRUFilter:
+    """Exact set of the `capacity` most recently seen keys."""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        self.capacity = capacity
+        self._keys: "OrderedDict[bytes, None]" = OrderedDict()
+
+    def check_and_add(self, key: bytes) -> bool:
+        """Return True if `key` was seen before; remember it either way."""
+        keys = self._keys
+        if key in keys:
+            keys.move_to_end(key)
+            return True
+        keys[key] = None
+        if len(keys) > self.capacity:
+            keys.popitem(last=False)
+        return False
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class BloomFilter:
+    """
+    Approximate set of roughly the last `capacity` to 2 * `capacity` keys.
+
+    Two generations of `capacity` keys each: lookups check both, inserts go
+    to the current one, and when it is full the older generation is
+    dropped. Memory is fixed by `capacity` and `error_rate`, and the false
+    positive rate stays near `error_rate` however many keys go through.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = 1e-4) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._current = bytearray((self.bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+
+    def check_and_add(self, key: bytes) -> bool:
+        """Return True if `key` was (probably) seen before; remember it either way."""
+        # Double hashing over the two 32-bit halves of Python's (C, SipHash)
+        # bytes hash; it is salted per process, which is fine for an in-memory set
+        value = hash(key)
+        position, step = (value & 0xFFFFFFFF) % self.bits, ((value >> 32) & 0xFFFFFFFF) | 1
+        bits, current, previous = self.bits, self._current, self._previous
+        positions = []
+        in_current = in_previous = True
+        for _ in range(self.hashes):
+            positions.append(position)
+            mask = 1 << (position & 7)
+            if in_current and not current[position >> 3] & mask:
+                in_current = False
+            if in_previous and not previous[position >> 3] & mask:
+                in_previous = False
+            position = (position + step) % bits
+        if in_current:
+            return True
+        if self._count >= self.capacity:
+            self._previous, self._current = current, bytearray(len(current))
+            current = self._current
+            self._count = 0
+        for position in positions:
+            current[position >> 3] |= 1 << (position & 7)
+        self._count += 1
+        return in_previous
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._current) + len(self._previous)
+
+
+FILTERS = {"lru": LRUFilter, "bloom": BloomFilter}
+
+
+class Deduplicator:
+    """Drops messages whose key was seen before, counting hits and misses."""
+
+    def __init__(self, key: KeyFunction, seen: Any) -> None:
+        """
+        Args:
+            key: Key function, e.g. sequence_key(codec) or content_key
+            seen: LRUFilter or BloomFilter holding the seen keys
+        """
+        self.key = key
+        self.seen = seen
+        self.hits = 0           # Duplicates suppressed
+        self.misses = 0         # Messages passed on
+        self.unchecked = 0      # Messages without a key, passed on
+        self.dup_flagged = 0    # Messages that arrived with the DUP flag set
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, msg: mqtt.MQTTMessage) -> bool:
+        key = self.key(msg)
+        with self._lock:
+            if msg.dup:
+                self.dup_flagged += 1
+            if key is None:
+                self.unchecked += 1
+                return False
+            if self.seen.check_and_add(key):
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def wrap(self, handler: Callable[..., None]) -> Callable[..., None]:
+        """An on_message callback that calls `handler` for first deliveries only."""
+        @functools.wraps(handler)
+        def on_message(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+            if not self.is_duplicate(msg):
+                handler(client, userdata, msg)
+
+        return on_message
+
+    def counters(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "unchecked": self.unchecked,
+                "dup_flagged": self.dup_flagged}
+
+
+def make_deduplicator(kind: str, key: str, codec: PayloadCodec,
+                      capacity: int = DEFAULT_CAPACITY) -> Deduplicator:
+    """
+    Build a Deduplicator from option values.
+
+    Args:
+        kind: "lru" or "bloom"
+        key: "sequence" or "content"
+        codec: Payload codec used to read sequence numbers
+        capacity: Keys remembered
+    """
+    key_function = sequence_key(codec) if key == "sequence" else content_key
+    return Deduplicator(key_function, FILTERS[kind](capacity))
+
+
+def _messages(count: int, duplicates: float, codec: PayloadCodec,
+              seed: int = 520) -> List[mqtt.MQTTMessage]:
+    """`count` messages of which a `duplicates` fraction repeat a recent one."""
+    rng = random.Random(seed)
+    messages: List[mqtt.MQTTMessage] = []
+    sequence = 0
+    for _ in range(count):
+        if messages and rng.random() < duplicates:
+            original = messages[-rng.randint(1, min(len(messages), 100))]
+            msg = mqtt.MQTTMessage(original.mid, original._topic)
+            msg.payload, msg.qos, msg.dup = original.payload, 1, True
+        else:
+            msg = mqtt.MQTTMessage(sequence + 1, b"Sensor/Temp")
+            msg.payload, msg.qos = codec.encode(sequence, 21.5), 1
+            sequence += 1
+        messages.append(msg)
+    return messages
+
+
+def _measure(make: Callable[[], Optional[Deduplicator]],
+             messages: List[mqtt.MQTTMessage]) -> Dict[str, Any]:
+    """CPU time per message through the wrapped handler, then its peak memory."""
+    result: Dict[str, Any] = {}
+    for traced in (False, True):
+        delivered = [0]
+
+        def handler(client: Any, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+            delivered[0] += 1
+
+        # The timed pass runs without tracemalloc, which would slow every allocation;
+        # the traced pass starts it first so the filter's own arrays are counted
+        if traced:
+            tracemalloc.start()
+        deduplicator = make()
+        on_message = handler if deduplicator is None else deduplicator.wrap(handler)
+        start = time.process_time()
+        for msg in messages:
+            on_message(None, None, msg)
+        cpu_seconds = time.process_time() - start
+        if traced:
+            result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            result["ns_per_message"] = cpu_seconds / len(messages) * 1e9
+            result["delivered"] = delivered[0]
+            if deduplicator is not None:
+                result.update(deduplicator.counters())
+    return result
+
+
+def run_benchmark(messages: int, duplicates: float, capacity: int,
+                  codec: PayloadCodec) -> Dict[str, Dict[str, Any]]:
+    """Compare no dedupe with every filter and key combination."""
+    stream = _messages(messages, duplicates, codec)
+    results = {"none": _measure(lambda: None, stream)}
+    for kind in FILTERS:
+        for key in ("sequence", "content"):
+            results[f"{kind} / {key}"] = _measure(
+                lambda: make_deduplicator(kind, key, codec, capacity), stream)
+    return results
+
+
+def main() -> None:
+    """Measure the per-message cost of duplicate suppression."""
+    parser = argparse.ArgumentParser(description="Duplicate suppression microbenchmark")
+    parser.add_argument("--messages", type=int, default=1_000_000, help="Messages to filter")
+    parser.add_argument("--duplicates", type=float, default=0.05,
+                        help="Fraction of messages that repeat a recent one")
+    parser.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY, help="Keys remembered")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="binary",
+                        help="Payload encoding of the readings")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.messages, args.duplicates, args.capacity, CODECS[args.codec])
+    baseline = results["none"]["ns_per_message"]
+    print(f"{'Filter / key':<18} {'CPU ns/msg':>11} {'Overhead':>9} {'Delivered':>10} "
+          f"{'Hits':>8} {'Peak KiB':>9}")
+    for name, result in results.items():
+        print(f"{name:<18} {result['ns_per_message']:>11.0f} "
+              f"{result['ns_per_message'] - baseline:>9.0f} {result['delivered']:>10} "
+              f"{result.get('hits', 0):>8} {result['peak_bytes'] / 1024:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
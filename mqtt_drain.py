@@ -0,0 +1,193 @@
+"""
+Persistent-session drain benchmark.
+
+Follows task 6: a clean_session=False subscriber subscribes and disconnects,
+a publisher queues a backlog for it at QoS 1 or 2, and the subscriber
+reconnects with the same client ID. Instead of sleeping and counting, this
+measures the time from CONNACK to the last queued message, the drain rate and
+the memory growth of the receiving process, and checks every sequence number
+for completeness, duplicates and ordering.
+
+Usage:
+    python mqtt_drain.py --embedded-broker --backlog 10 1000 100000 --qos 1 2
+"""
+import argparse
+import sys
+import time
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+import paho.mqtt.client as mqtt
+
+from mqtt_benchmark import add_broker_arguments, rss_bytes, run_metadata, start_broker, write_json
+from mqtt_bulk_publisher import BulkPublisher
+from mqtt_clients import (connect_client, create_client, disconnect_client, discard_session,
+                          track_connection)
+from mqtt_codec import CODECS
+from mqtt_waiters import CompletionTracker, scaled_timeout
+
+# Sample RSS every this many received messages
+RSS_SAMPLE_INTERVAL = 4096
+
+
+def run_drain_benchmark(host: str,
+                        port: int,
+                        backlog: int,
+                        qos: int,
+                        topic: str = "Benchmark/Drain",
+                        timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Queue `backlog` messages for an offline persistent session and drain them.
+
+    Args:
+        host: Broker host
+        port: Broker port
+        backlog: Messages queued while the subscriber is offline
+        qos: QoS of the subscription and of the publishes (1 or 2)
+        topic: Topic to publish on
+        timeout: Upper bound for queueing and for draining (scaled to the backlog by default)
+
+    Returns:
+        dict: One result row
+    """
+    if qos not in (1, 2):
+        raise ValueError("Offline queueing needs QoS 1 or 2")
+    if timeout is None:
+        timeout = scaled_timeout(backlog)
+    codec = CODECS["binary"]
+    client_id = f"drain-subscriber-{uuid4().hex[:8]}"
+    tracker = CompletionTracker(f"drain-q{qos}")
+
+    # Create the persistent session, then leave
+    subscriber = create_client("drain-subscriber", clean_session=False, client_id=client_id)
+    track_connection(subscriber, tracker, [(topic, qos)])
+    if not connect_client(subscriber, tracker, host, port, wait_suback=True):
+        raise RuntimeError("Subscriber could not connect and subscribe")
+    disconnect_client(subscriber)
+
+    # Queue the backlog
+    publisher = create_client("drain-publisher")
+    publisher_tracker = CompletionTracker(f"drain-q{qos}-pub")
+    track_connection(publisher, publisher_tracker)
+    bulk = BulkPublisher(publisher, label=f"drain-q{qos}-pub")
+    if not connect_client(publisher, publisher_tracker, host, port):
+        raise RuntimeError("Publisher could not connect")
+    queue_start = time.perf_counter()
+    queued = bulk.publish_all(((topic, codec.encode(i), qos) for i in range(backlog)), timeout)
+    queue_seconds = time.perf_counter() - queue_start
+    disconnect_client(publisher)
+
+    # Per-sequence bookkeeping is allocated up front so it does not count as growth
+    seen = bytearray(backlog)
+    state = {"last_sequence": -1, "out_of_order": 0, "duplicates": 0, "unknown": 0,
+             "received": 0, "connack_at": 0.0, "last_at": 0.0, "peak_rss": 0}
+
+    def on_connect(client: mqtt.Client, userdata: Any, flags: Dict[str, bool], rc: int) -> None:
+        state["connack_at"] = time.perf_counter()
+        tracker.connack_received(rc, flags)
+
+    def on_message(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        sequence = codec.sequence(codec.decode(msg.payload))
+        if sequence >= backlog:
+            state["unknown"] += 1
+        elif seen[sequence]:
+            state["duplicates"] += 1
+        else:
+            seen[sequence] = 1
+        if sequence < state["last_sequence"]:
+            state["out_of_order"] += 1
+        state["last_sequence"] = sequence
+        state["received"] += 1
+        state["last_at"] = time.perf_counter()
+        if state["received"] % RSS_SAMPLE_INTERVAL == 0:
+            state["peak_rss"] = max(state["peak_rss"], rss_bytes())
+        tracker.message_received()
+
+    # Reconnect with the same client ID and drain
+    subscriber = create_client("drain-subscriber", clean_session=False, client_id=client_id)
+    subscriber.on_connect = on_connect
+    subscriber.on_message = on_message
+    tracker.reset_connection()
+    rss_before = rss_bytes()
+    subscriber.connect(host=host, port=port)
+    subscriber.loop_start()
+    try:
+        tracker.wait_connack()
+        session_present = tracker.session_present
+        complete = tracker.wait_messages(backlog, timeout)
+    finally:
+        rss_after = rss_bytes()
+        disconnect_client(subscriber)
+        # Give up the session so the broker does not keep it around
+        discard_session(host, port, client_id)
+
+    drain_seconds = state["last_at"] - state["connack_at"] if state["received"] else 0.0
+    unique = seen.count(1)
+    return {
+        "backlog": backlog,
+        "qos": qos,
+        "queued": queued.complete,
+        "queue_seconds": queue_seconds,
+        "session_present": session_present,
+        "received": state["received"],
+        "complete": complete and unique == backlog,
+        "missing": backlog - unique,
+        "duplicates": state["duplicates"],
+        "unexpected": state["unknown"],
+        "out_of_order": state["out_of_order"],
+        "in_order": state["out_of_order"] == 0,
+        "connack_to_last_seconds": drain_seconds,
+        "drain_msgs_per_sec": state["received"] / drain_seconds if drain_seconds else 0.0,
+        "rss_growth_bytes": max(rss_after, state["peak_rss"]) - rss_before,
+        "rss_growth_per_message": ((max(rss_after, state["peak_rss"]) - rss_before) / backlog
+                                   if backlog else 0.0),
+    }
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    """Print a human readable summary table to stderr."""
+    print(f"{'Backlog':>9} {'QoS':>3} {'Session':>7} {'Received':>9} {'Missing':>8} "
+          f"{'Dup':>5} {'Order':>5} {'Drain s':>8} {'msgs/s':>9} {'RSS +MiB':>9}",
+          file=sys.stderr)
+    for row in results:
+        print(f"{row['backlog']:>9} {row['qos']:>3} {str(row['session_present']):>7} "
+              f"{row['received']:>9} {row['missing']:>8} {row['duplicates']:>5} "
+              f"{'ok' if row['in_order'] else 'BAD':>5} "
+              f"{row['connack_to_last_seconds']:>8.3f} {row['drain_msgs_per_sec']:>9.0f} "
+              f"{row['rss_growth_bytes'] / 2**20:>9.1f}", file=sys.stderr)
+
+
+def main() -> None:
+    """Run the drain benchmark matrix and emit JSON."""
+    parser = argparse.ArgumentParser(description="Persistent-session drain benchmark")
+    add_broker_arguments(parser)
+    parser.add_argument("--backlog", type=int, nargs="+", default=[10, 1000, 10_000],
+                        help="Messages queued while offline (10 - 1,000,000)")
+    parser.add_argument("--qos", type=int, nargs="+", default=[1, 2], choices=[1, 2],
+                        help="QoS levels to benchmark")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Timeout in seconds for queueing and for draining "
+                             "(default: scaled to the backlog)")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    # A separate process keeps the broker's queues out of the memory figures
+    broker = start_broker(args, separate_process=True)
+    try:
+        results = []
+        for qos in args.qos:
+            for backlog in args.backlog:
+                results.append(run_drain_benchmark(args.host, args.port, backlog, qos,
+                                                   timeout=args.timeout))
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    print_results(results)
+    write_json({"benchmark": "drain", "metadata": run_metadata(args),
+                "config": {"backlog": args.backlog, "qos": args.qos},
+                "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
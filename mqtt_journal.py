@@ -0,0 +1,450 @@
+"""
+Append-only message journal with replay.
+
+A journal is a directory of memory-mapped segment files. JournalWriter
+appends (timestamp, topic, qos, payload) records to the current segment and
+starts a new one when it is full; recorder() turns it into an on_message
+handler. JournalReader maps one segment at a time and yields the records
+back, so a journal of many gigabytes is streamed through the page cache
+rather than loaded. replay() publishes a journal through a BulkPublisher at
+the recorded pace, a multiple of it, or as fast as the window allows.
+
+Usage:
+    python mqtt_journal.py record --journal traffic --topic 'Sensors/#' --duration 60
+    python mqtt_journal.py replay --journal traffic --speed 10
+    python mqtt_journal.py bench --embedded-broker --messages 1000000 --payload-size 256
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+import paho.mqtt.client as mqtt
+
+from mqtt_benchmark import (add_broker_arguments, make_payload, rss_bytes, run_metadata,
+                            start_broker, write_json)
+from mqtt_bulk_publisher import DEFAULT_WINDOW, BulkPublisher, PublishStats
+from mqtt_clients import connect_client, create_client, disconnect_client, track_connection
+from mqtt_waiters import DEFAULT_TIMEOUT, CompletionTracker, scaled_timeout
+
+# First bytes of every segment file
+SEGMENT_MAGIC = b"MQJ1"
+
+# Record header: receive time (ns since the epoch), QoS, topic length, payload length
+RECORD = struct.Struct("!QBHI")
+
+DEFAULT_SEGMENT_SIZE = 64 * 2**20
+
+SEGMENT_PATTERN = "segment-{:06d}.mqj"
+
+
+class JournalRecord(NamedTuple):
+    timestamp_ns: int
+    topic: str
+    qos: int
+    payload: bytes
+
+
+def segment_paths(path: str) -> List[str]:
+    """Segment files of the journal at `path`, oldest first."""
+    names = sorted(name for name in os.listdir(path)
+                   if name.startswith("segment-") and name.endswith(".mqj"))
+    return [os.path.join(path, name) for name in names]
+
+
+class JournalWriter:
+    """
+    Appends records to memory-mapped segments of `segment_size` bytes.
+
+    Each segment is created at full size, filled through its mapping and
+    truncated to the bytes actually written when it is closed. A segment that
+    was never closed (the process died) ends at the first all-zero header.
+    Appends are serialized, so one writer can be shared by several clients.
+    """
+
+    def __init__(self, path: str, segment_size: int = DEFAULT_SEGMENT_SIZE) -> None:
+        """
+        Args:
+            path: Journal directory; created if missing, appended to if not empty
+            segment_size: Size of each segment file in bytes
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.segment_size = segment_size
+        self.records = 0
+        self.bytes = 0
+        existing = segment_paths(path)
+        self._index = int(os.path.basename(existing[-1])[8:14]) + 1 if existing else 0
+        self._file: Optional[Any] = None
+        self._map: Optional[mmap.mmap] = None
+        self._position = 0
+        self._lock = threading.Lock()
+
+    def _open_segment(self, minimum: int) -> None:
+        """Start the next segment, large enough for a record of `minimum` bytes."""
+        size = max(self.segment_size, len(SEGMENT_MAGIC) + minimum)
+        segment = os.path.join(self.path, SEGMENT_PATTERN.format(self._index))
+        self._index += 1
+        self._file = open(segment, "w+b")
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._map[:len(SEGMENT_MAGIC)] = SEGMENT_MAGIC
+        self._position = len(SEGMENT_MAGIC)
+
+    def _close_segment(self) -> None:
+        if self._map is None:
+            return
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(self._position)
+        self._file.close()
+        self._map = self._file = None
+
+    def append(self, topic: str, payload: bytes, qos: int = 0,
+               timestamp: Optional[float] = None) -> None:
+        """
+        Append one record.
+
+        Args:
+            topic: Topic the message arrived on
+            payload: Raw payload bytes
+            qos: Delivery QoS
+            timestamp: Receive time in seconds since the epoch (default: now)
+        """
+        timestamp_ns = time.time_ns() if timestamp is None else int(timestamp * 1e9)
+        topic_bytes = topic.encode("utf-8")
+        size = RECORD.size + len(topic_bytes) + len(payload)
+        with self._lock:
+            if self._map is None or self._position + size > len(self._map):
+                self._close_segment()
+                self._open_segment(size)
+            position = self._position
+            RECORD.pack_into(self._map, position, timestamp_ns, qos, len(topic_bytes),
+                             len(payload))
+            position += RECORD.size
+            self._map[position:position + len(topic_bytes)] = topic_bytes
+            position += len(topic_bytes)
+            self._map[position:position + len(payload)] = payload
+            self._position = position + len(payload)
+            self.records += 1
+            self.bytes += size
+
+    def recorder(self, handler: Optional[Callable[..., None]] = None) -> Callable[..., None]:
+        """
+        An on_message callback that journals every message, then calls `handler`.
+
+        Args:
+            handler: Existing on_message handler to chain to, if any
+        """
+        def on_message(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+            self.append(msg.topic, msg.payload, msg.qos)
+            if handler is not None:
+                handler(client, userdata, msg)
+
+        return on_message
+
+    def flush(self) -> None:
+        """Write the current segment's dirty pages back to the file."""
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+
+    def close(self) -> None:
+        """Close and truncate the current segment."""
+        with self._lock:
+            self._close_segment()
+
+    def __enter__(self) -> "JournalWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class JournalReader:
+    """Streams the records of a journal, one mapped segment at a time."""
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path: Journal directory written by JournalWriter
+        """
+        self.path = path
+
+    def __iter__(self) -> Iterator[JournalRecord]:
+        for segment in segment_paths(self.path):
+            yield from self._read_segment(segment)
+
+    def _read_segment(self, segment: str) -> Iterator[JournalRecord]:
+        with open(segment, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= len(SEGMENT_MAGIC):
+                return
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mapped:
+                if mapped[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                    raise ValueError(f"{segment} is not a journal segment")
+                if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                topics: Dict[bytes, str] = {}
+                position = len(SEGMENT_MAGIC)
+                while position + RECORD.size <= size:
+                    timestamp_ns, qos, topic_length, payload_length = \
+                        RECORD.unpack_from(mapped, position)
+                    if timestamp_ns == 0:
+                        break       # Preallocated space of a segment that was never closed
+                    position += RECORD.size
+                    raw_topic = mapped[position:position + topic_length]
+                    topic = topics.get(raw_topic)
+                    if topic is None:
+                        topic = topics[raw_topic] = raw_topic.decode("utf-8")
+                    position += topic_length
+                    payload = mapped[position:position + payload_length]
+                    position += payload_length
+                    yield JournalRecord(timestamp_ns, topic, qos, payload)
+
+
+def paced(records: Iterator[JournalRecord],
+          speed: float,
+          qos: Optional[int] = None,
+          lag: Optional[List[float]] = None) -> Iterator[tuple]:
+    """
+    Turn journal records into (topic, payload, qos) tuples at the recorded pace.
+
+    Args:
+        records: Journal records, oldest first
+        speed: 1.0 replays at the recorded pace, 10.0 ten times faster, 0 without pauses
+        qos: Publish QoS; the recorded QoS if None
+        lag: If given, receives the largest delay behind schedule in seconds
+    """
+    start = time.perf_counter()
+    first_ns: Optional[int] = None
+    worst = 0.0
+    for record in records:
+        if speed > 0:
+            if first_ns is None:
+                first_ns = record.timestamp_ns
+            due = start + (record.timestamp_ns - first_ns) / 1e9 / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay > worst:
+                worst = -delay
+        yield record.topic, record.payload, record.qos if qos is None else qos
+    if lag is not None:
+        lag.append(worst)
+
+
+def replay(path: str,
+           client: mqtt.Client,
+           speed: float = 1.0,
+           qos: Optional[int] = None,
+           window: int = DEFAULT_WINDOW,
+           timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+    """
+    Publish every record of a journal through a connected client.
+
+    Args:
+        path: Journal directory
+        client: Connected client; its on_publish is wrapped while replaying
+        speed: Pace relative to the recording; 0 publishes as fast as possible
+        qos: Publish QoS; the recorded QoS if None
+        window: Unacknowledged messages allowed at a time
+        timeout: Longest wait for a window slot and for the final acknowledgements
+
+    Returns:
+        dict: Publish counters plus the largest lag behind the recorded schedule
+    """
+    bulk = BulkPublisher(client, window=window)
+    lag: List[float] = []
+    try:
+        stats: PublishStats = bulk.publish_all(paced(iter(JournalReader(path)), speed, qos, lag),
+                                               timeout)
+    finally:
+        bulk.close()
+    return dict(stats.as_dict(), speed=speed, max_lag_seconds=lag[0] if lag else 0.0)
+
+
+def _tracked_client(role: str, tracker: CompletionTracker,
+                    subscriptions: List[tuple] = ()) -> mqtt.Client:
+    client = create_client(role)
+    track_connection(client, tracker, subscriptions)
+    return client
+
+
+def record(args: argparse.Namespace) -> Dict[str, Any]:
+    """Journal the messages on `args.topic` for a duration or message count."""
+    tracker = CompletionTracker("journal-record")
+    with JournalWriter(args.journal, args.segment_size) as writer:
+        client = _tracked_client("journal-recorder", tracker, [(args.topic, args.qos)])
+        on_message = writer.recorder()
+
+        def counting(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+            on_message(client, userdata, msg)
+            tracker.message_received()
+
+        client.on_message = counting
+        if not connect_client(client, tracker, args.host, args.port, wait_suback=True):
+            raise RuntimeError("Recorder could not connect and subscribe")
+        print(f"Recording '{args.topic}' to {args.journal}", file=sys.stderr)
+        try:
+            if args.count:
+                tracker.wait_messages(args.count, args.duration or float("inf"))
+            else:
+                time.sleep(args.duration)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            disconnect_client(client)
+        return {"records": writer.records, "bytes": writer.bytes}
+
+
+def run_journal_benchmark(host: str,
+                          port: int,
+                          path: str,
+                          messages: int,
+                          payload_size: int,
+                          qos: int,
+                          segment_size: int = DEFAULT_SEGMENT_SIZE,
+                          topic: str = "Benchmark/Journal") -> Dict[str, Any]:
+    """
+    Write a synthetic journal, read it back and replay it at full speed.
+
+    Args:
+        host: Broker host
+        port: Broker port
+        path: Journal directory (must not hold another journal)
+        messages: Records to write and replay
+        payload_size: Payload size in bytes
+        qos: Publish and subscription QoS of the replay
+        segment_size: Segment file size in bytes
+        topic: Topic prefix; records cycle through 16 subtopics
+
+    Returns:
+        dict: Write, read and replay rates
+    """
+    timeout = scaled_timeout(messages)
+    topics = [f"{topic}/{index}" for index in range(16)]
+    payload = make_payload(0, payload_size)
+
+    begin = time.perf_counter()
+    with JournalWriter(path, segment_size) as writer:
+        for i in range(messages):
+            writer.append(topics[i % len(topics)], payload, qos)
+    write_seconds = time.perf_counter() - begin
+    journal_bytes = writer.bytes
+
+    rss_before = rss_bytes()
+    begin = time.perf_counter()
+    count = 0
+    for _ in JournalReader(path):
+        count += 1
+    read_seconds = time.perf_counter() - begin
+    rss_growth = rss_bytes() - rss_before
+
+    subscriber_tracker = CompletionTracker("journal-bench")
+    subscriber = _tracked_client("journal-subscriber", subscriber_tracker, [(f"{topic}/#", qos)])
+    subscriber.on_message = lambda *args: subscriber_tracker.message_received()
+    publisher_tracker = CompletionTracker("journal-bench-pub")
+    publisher = _tracked_client("journal-replayer", publisher_tracker)
+    try:
+        if not connect_client(subscriber, subscriber_tracker, host, port, wait_suback=True):
+            raise RuntimeError("Subscriber could not connect and subscribe")
+        if not connect_client(publisher, publisher_tracker, host, port):
+            raise RuntimeError("Publisher could not connect")
+        begin = time.perf_counter()
+        replayed = replay(path, publisher, speed=0, timeout=timeout)
+        complete = subscriber_tracker.wait_messages(messages, timeout)
+        replay_seconds = time.perf_counter() - begin
+    finally:
+        disconnect_client(publisher)
+        disconnect_client(subscriber)
+
+    return {
+        "messages": messages,
+        "payload_size": len(payload),
+        "qos": qos,
+        "segments": len(segment_paths(path)),
+        "journal_bytes": journal_bytes,
+        "write_msgs_per_sec": messages / write_seconds if write_seconds else 0.0,
+        "write_mb_per_sec": journal_bytes / write_seconds / 1e6 if write_seconds else 0.0,
+        "read_records": count,
+        "read_msgs_per_sec": count / read_seconds if read_seconds else 0.0,
+        "read_mb_per_sec": journal_bytes / read_seconds / 1e6 if read_seconds else 0.0,
+        "read_rss_growth_bytes": rss_growth,
+        "replay_acknowledged": replayed["acknowledged"],
+        "replay_delivered": subscriber_tracker.received,
+        "replay_complete": complete,
+        "replay_msgs_per_sec": subscriber_tracker.received / replay_seconds
+        if replay_seconds else 0.0,
+    }
+
+
+def main() -> None:
+    """Record, replay or benchmark a journal."""
+    parser = argparse.ArgumentParser(description="MQTT message journal")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="Journal the messages on a topic filter")
+    replay_parser = commands.add_parser("replay", help="Publish a journal back to a broker")
+    bench_parser = commands.add_parser("bench", help="Write, read and replay a synthetic journal")
+    for command in (record_parser, replay_parser, bench_parser):
+        add_broker_arguments(command)
+        command.add_argument("--journal", required=command is not bench_parser,
+                             help="Journal directory")
+        command.add_argument("--segment-size", type=int, default=DEFAULT_SEGMENT_SIZE,
+                             help="Segment file size in bytes")
+        command.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    record_parser.add_argument("--topic", default="#", help="Topic filter to record")
+    record_parser.add_argument("--qos", type=int, default=1, choices=[0, 1, 2],
+                               help="Subscription QoS")
+    record_parser.add_argument("--duration", type=float, default=60.0,
+                               help="Seconds to record (upper bound with --count)")
+    record_parser.add_argument("--count", type=int, default=0,
+                               help="Stop after this many messages")
+    replay_parser.add_argument("--speed", type=float, default=1.0,
+                               help="Pace relative to the recording; 0 = as fast as possible")
+    replay_parser.add_argument("--qos", type=int, default=None, choices=[0, 1, 2],
+                               help="Publish QoS (default: as recorded)")
+    replay_parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                               help="Unacknowledged messages allowed at a time")
+    bench_parser.add_argument("--messages", type=int, default=100_000, help="Records")
+    bench_parser.add_argument("--payload-size", type=int, default=64,
+                              help="Payload size in bytes")
+    bench_parser.add_argument("--qos", type=int, default=1, choices=[0, 1, 2],
+                              help="Replay QoS")
+    args = parser.parse_args()
+
+    broker = start_broker(args)
+    try:
+        if args.command == "record":
+            result = record(args)
+        elif args.command == "replay":
+            tracker = CompletionTracker("journal-replay")
+            client = _tracked_client("journal-replayer", tracker)
+            if not connect_client(client, tracker, args.host, args.port):
+                raise RuntimeError("Replayer could not connect")
+            try:
+                result = replay(args.journal, client, args.speed, args.qos, args.window)
+            finally:
+                disconnect_client(client)
+        else:
+            with tempfile.TemporaryDirectory(prefix="journal-", dir=args.journal) as path:
+                result = run_journal_benchmark(args.host, args.port, path, args.messages,
+                                               args.payload_size, args.qos, args.segment_size)
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    print("  ".join(f"{key}={value:.0f}" if isinstance(value, float) else f"{key}={value}"
+                    for key, value in result.items()), file=sys.stderr)
+    write_json({"benchmark": f"journal-{args.command}", "metadata": run_metadata(args),
+                "results": [result]}, args.output)
+
+
+if __name__ == "__main__":
+    main()
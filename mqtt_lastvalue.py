@@ -0,0 +1,259 @@
+"""
+Last-value cache: the latest payload per topic, queried by topic filter.
+
+The task 5 subscribers append every message to a ring, so "the latest
+temperature in every room" means scanning the whole ring and keeping the
+newest record per topic. LastValueCache keeps one (payload, timestamp)
+entry per topic instead, in a tree indexed level by level like TopicTrie.
+A wildcard query walks only the branches its filter can match:
+Sensors/+/Temperature visits the rooms under Sensors and one child of each,
+never the humidity readings or the Weather subtree.
+
+Memory is bounded by `capacity` topics. When a new topic would exceed it,
+the topic that has gone longest without an update is evicted, and with
+`max_age` set, topics not updated for that long expire as well. Like a
+retained message, an empty payload clears its topic.
+
+Run this module to benchmark wildcard queries against scanning every topic:
+    python mqtt_lastvalue.py --topics 100000 --capacity 50000
+"""
+import argparse
+import random
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import paho.mqtt.client as mqtt
+
+from mqtt_topics import topic_matches, validate_filter
+
+DEFAULT_CAPACITY = 100_000
+
+
+class LastValue(NamedTuple):
+    """Latest payload of one topic and when it arrived."""
+    topic: str
+    payload: bytes
+    timestamp: float
+
+
+class _Level:
+    __slots__ = ("children", "value")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_Level"] = {}
+        self.value: Optional[LastValue] = None
+
+
+class LastValueCache:
+    """
+    Latest value per topic with wildcard queries and bounded size.
+
+    update() is called from paho network threads and query() from anywhere;
+    a single lock guards the tree. An instance's on_message() is a valid
+    paho on_message callback.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, max_age: Optional[float] = None) -> None:
+        """
+        Args:
+            capacity: Maximum number of topics kept
+            max_age: Seconds after its last update at which a topic expires
+                     (None: topics only leave through capacity eviction)
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.max_age = max_age
+        self._root = _Level()
+        # Leaf level per topic, least recently updated first
+        self._leaves: "OrderedDict[str, _Level]" = OrderedDict()
+        self.updates = 0
+        self.evicted = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of cached topics."""
+        return len(self._leaves)
+
+    def __contains__(self, topic: str) -> bool:
+        return topic in self._leaves
+
+    def update(self, topic: str, payload: bytes, timestamp: Optional[float] = None) -> None:
+        """Record `payload` as the latest value of `topic`; an empty payload clears it."""
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            self.updates += 1
+            if not payload:
+                if topic in self._leaves:
+                    self._remove(topic)
+                return
+            leaf = self._leaves.get(topic)
+            if leaf is None:
+                self._expire(timestamp)
+                if len(self._leaves) >= self.capacity:
+                    self._remove(next(iter(self._leaves)))
+                    self.evicted += 1
+                leaf = self._root
+                for level in topic.split("/"):
+                    child = leaf.children.get(level)
+                    if child is None:
+                        child = leaf.children[level] = _Level()
+                    leaf = child
+                self._leaves[topic] = leaf
+            else:
+                self._leaves.move_to_end(topic)
+            leaf.value = LastValue(topic, payload, timestamp)
+
+    def on_message(self, client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        """Cache a received message (retained or live)."""
+        self.update(msg.topic, msg.payload)
+
+    def get(self, topic: str) -> Optional[LastValue]:
+        """Latest value of one topic, or None."""
+        with self._lock:
+            leaf = self._leaves.get(topic)
+            return None if leaf is None else leaf.value
+
+    def query(self, topic_filter: str) -> List[LastValue]:
+        """
+        Latest values of every cached topic matching `topic_filter`.
+
+        Only branches the filter can match are visited; '#' returns its
+        whole subtree. Topics starting with '$' are not matched by a
+        leading wildcard.
+        """
+        validate_filter(topic_filter)
+        levels = topic_filter.split("/")
+        found: List[LastValue] = []
+        with self._lock:
+            if self.max_age is not None:
+                self._expire(time.time())
+            stack = [(self._root, 0)]
+            while stack:
+                node, depth = stack.pop()
+                if depth == len(levels):
+                    if node.value is not None:
+                        found.append(node.value)
+                    continue
+                level = levels[depth]
+                if level == "#":
+                    # "a/#" also matches the parent level "a"
+                    if depth and node.value is not None:
+                        found.append(node.value)
+                    subtree = [child for name, child in node.children.items()
+                               if depth or not name.startswith("$")]
+                    while subtree:
+                        child = subtree.pop()
+                        if child.value is not None:
+                            found.append(child.value)
+                        subtree.extend(child.children.values())
+                elif level == "+":
+                    stack.extend((child, depth + 1) for name, child in node.children.items()
+                                 if depth or not name.startswith("$"))
+                else:
+                    child = node.children.get(level)
+                    if child is not None:
+                        stack.append((child, depth + 1))
+        return found
+
+    def stats(self) -> Dict[str, int]:
+        """Topic count and eviction counters, as a JSON-ready dict."""
+        with self._lock:
+            return {"topics": len(self._leaves), "capacity": self.capacity, "updates": self.updates,
+                    "evicted": self.evicted, "expired": self.expired}
+
+    def _expire(self, now: float) -> None:
+        """Drop topics not updated within max_age; called with the lock held."""
+        if self.max_age is None:
+            return
+        cutoff = now - self.max_age
+        while self._leaves:
+            topic, leaf = next(iter(self._leaves.items()))
+            if leaf.value.timestamp > cutoff:
+                break
+            self._remove(topic)
+            self.expired += 1
+
+    def _remove(self, topic: str) -> None:
+        """Forget one topic and prune its empty branch; called with the lock held."""
+        del self._leaves[topic]
+        levels = topic.split("/")
+        path = [self._root]
+        for level in levels:
+            path.append(path[-1].children[level])
+        path[-1].value = None
+        for depth in range(len(levels), 0, -1):
+            node = path[depth]
+            if node.value is not None or node.children:
+                break
+            del path[depth - 1].children[levels[depth - 1]]
+
+
+def run_benchmark(topic_count: int, capacity: int, queries: int, seed: int = 520) -> Dict[str, float]:
+    """Time cache updates and wildcard queries against a scan of a topic dict."""
+    rng = random.Random(seed)
+    topics = [f"Sensors/Site{rng.randrange(100)}/Room{rng.randrange(1000)}/Metric{rng.randrange(50)}"
+              for _ in range(topic_count)]
+    filters = [f"Sensors/Site{rng.randrange(100)}/+/Metric{rng.randrange(50)}" for _ in range(queries)]
+
+    tracemalloc.start()
+    cache = LastValueCache(capacity)
+    start = time.perf_counter()
+    for index, topic in enumerate(topics):
+        cache.update(topic, b"%d" % index)
+    update_seconds = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    cache_results = [sorted(value.topic for value in cache.query(topic_filter)) for topic_filter in filters]
+    query_seconds = time.perf_counter() - start
+
+    # The scan visits every cached topic per query; time it on a subset
+    latest = {value.topic: value for value in cache.query("#")}
+    scan_filters = filters[:max(1, min(queries, 20))]
+    start = time.perf_counter()
+    scan_results = [sorted(topic for topic in latest if topic_matches(topic_filter, topic))
+                    for topic_filter in scan_filters]
+    scan_seconds = time.perf_counter() - start
+
+    if scan_results != cache_results[:len(scan_results)]:
+        raise AssertionError("Cache query and scan disagree")
+
+    query_rate = queries / query_seconds
+    scan_rate = len(scan_filters) / scan_seconds
+    return {
+        "topics": len(cache),
+        "evicted": cache.evicted,
+        "updates_per_sec": topic_count / update_seconds,
+        "bytes_per_topic": memory / len(cache),
+        "query_per_sec": query_rate,
+        "scan_per_sec": scan_rate,
+        "speedup": query_rate / scan_rate,
+    }
+
+
+def main() -> None:
+    """Benchmark wildcard queries against a scan of every cached topic."""
+    parser = argparse.ArgumentParser(description="Last-value cache benchmark")
+    parser.add_argument("--topics", type=int, default=100_000, help="Updates on random topics")
+    parser.add_argument("--capacity", type=int, default=50_000, help="Cache capacity in topics")
+    parser.add_argument("--queries", type=int, default=1_000, help="Sensors/SiteN/+/MetricM queries")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.topics, args.capacity, args.queries)
+    print(f"Topics cached: {result['topics']} ({result['evicted']} evicted, "
+          f"{result['bytes_per_topic']:.0f} bytes per topic)")
+    print(f"Updates: {result['updates_per_sec']:>12.0f} /s")
+    print(f"Query:   {result['query_per_sec']:>12.0f} /s")
+    print(f"Scan:    {result['scan_per_sec']:>12.0f} /s")
+    print(f"Speedup: {result['speedup']:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Multi-process load generator.
+
+A single process publishes through one GIL. This spreads the load over
+worker processes: each worker connects its own task 1/2 style publisher
+clients plus one subscriber for its shard of rooms, publishes to
+Sensors/Room<n>/Temperature for those rooms and measures end-to-end latency.
+The coordinator waits until every worker is connected, starts them all at
+once, and aggregates their throughput and latency. Given several worker
+counts it reports how throughput scales with the number of processes.
+
+Usage:
+    python mqtt_loadgen.py --embedded-broker --workers 1 2 4 --messages 200000
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, NamedTuple
+
+import paho.mqtt.client as mqtt
+
+from mqtt_benchmark import (PAYLOAD_HEADER, add_broker_arguments, latency_summary, make_payload,
+                            run_metadata, start_broker, write_json)
+from mqtt_bulk_publisher import BulkPublisher
+from mqtt_clients import connect_client, create_client, disconnect_client, track_connection
+from mqtt_waiters import CompletionTracker
+
+
+class LoadConfig(NamedTuple):
+    host: str
+    port: int
+    workers: int
+    clients: int            # Publisher clients per worker
+    messages: int           # Messages in total, split over all clients
+    rooms: int              # Rooms in total, sharded over the workers
+    qos: int
+    payload_size: int
+    timeout: float
+
+
+def _shard(config: LoadConfig, worker: int) -> List[str]:
+    """Topics owned by `worker`: every workers-th room."""
+    rooms = range(worker, max(config.rooms, config.workers), config.workers)
+    return [f"Sensors/Room{room}/Temperature" for room in rooms]
+
+
+def _connect_worker(config: LoadConfig, worker: int) -> Dict[str, Any]:
+    """Connect a worker's subscriber and publishers and prepare its messages."""
+    topics = _shard(config, worker)
+    share = config.messages // config.workers + (worker < config.messages % config.workers)
+    latencies = array("q")
+
+    subscriber_tracker = CompletionTracker(f"load-{worker}")
+
+    def on_message(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        _, sent_ns = PAYLOAD_HEADER.unpack_from(msg.payload)
+        latencies.append(time.time_ns() - sent_ns)
+        subscriber_tracker.message_received()
+
+    subscriber = create_client(f"load-subscriber-{worker}")
+    track_connection(subscriber, subscriber_tracker, [(topic, config.qos) for topic in topics])
+    subscriber.on_message = on_message
+    if not connect_client(subscriber, subscriber_tracker, config.host, config.port,
+                          wait_suback=True):
+        raise RuntimeError("Subscriber could not connect and subscribe")
+
+    # Task 1/2: uniquely named publishers, connected and confirmed by CONNACK
+    publishers = []
+    for index in range(config.clients):
+        client = create_client(f"load-publisher-{worker}")
+        tracker = CompletionTracker(f"load-{worker}-{index}")
+        track_connection(client, tracker)
+        bulk = BulkPublisher(client)
+        if not connect_client(client, tracker, config.host, config.port):
+            raise RuntimeError("Publisher could not connect")
+        publishers.append(bulk)
+
+    def messages(index: int):
+        count = share // config.clients + (index < share % config.clients)
+        for i in range(count):
+            yield topics[i % len(topics)], make_payload(i, config.payload_size), config.qos
+
+    return {"subscriber": subscriber, "publishers": publishers, "share": share,
+            "latencies": latencies, "tracker": subscriber_tracker, "messages": messages}
+
+
+def worker_main(config: LoadConfig, worker: int, events: Any, start: Any) -> None:
+    """Entry point of a worker process; reports through the `events` queue."""
+    try:
+        setup = _connect_worker(config, worker)
+    except Exception as e:
+        events.put(("error", worker, f"{type(e).__name__}: {e}"))
+        return
+    events.put(("ready", worker, None))
+    start.wait()
+
+    begin = time.perf_counter()
+    cpu_begin = time.process_time()
+    threads = [threading.Thread(target=bulk.publish_all,
+                                args=(setup["messages"](index), config.timeout))
+               for index, bulk in enumerate(setup["publishers"])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    publish_seconds = time.perf_counter() - begin
+    delivered = setup["tracker"].wait_messages(setup["share"], config.timeout)
+    elapsed = time.perf_counter() - begin
+
+    for bulk in setup["publishers"]:
+        disconnect_client(bulk.client)
+    disconnect_client(setup["subscriber"])
+    events.put(("result", worker, {
+        "worker": worker,
+        "pid": os.getpid(),
+        "messages": setup["share"],
+        "acknowledged": sum(bulk.stats.acknowledged for bulk in setup["publishers"]),
+        "delivered": len(setup["latencies"]),
+        "complete": delivered,
+        "publish_seconds": publish_seconds,
+        "elapsed_seconds": elapsed,
+        "cpu_seconds": time.process_time() - cpu_begin,
+        "latencies": setup["latencies"].tobytes(),
+    }))
+
+
+def run_load_test(config: LoadConfig) -> Dict[str, Any]:
+    """
+    Start `config.workers` worker processes, release them together and
+    aggregate their results.
+    """
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    start = context.Event()
+    processes = [context.Process(target=worker_main, args=(config, worker, events, start),
+                                 name=f"load-worker-{worker}", daemon=True)
+                 for worker in range(config.workers)]
+    for process in processes:
+        process.start()
+
+    results: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    ready = 0
+    try:
+        # Everyone connects first, so connection setup is not measured
+        while ready + len(errors) < config.workers:
+            kind, worker, value = events.get(timeout=config.timeout)
+            if kind == "ready":
+                ready += 1
+            else:
+                errors.append(f"worker {worker}: {value}")
+        begin = time.perf_counter()
+        start.set()
+        while len(results) + len(errors) < config.workers:
+            kind, worker, value = events.get(timeout=config.timeout * 2)
+            if kind == "result":
+                results.append(value)
+            elif kind == "error":
+                errors.append(f"worker {worker}: {value}")
+        wall_seconds = time.perf_counter() - begin
+    except queue.Empty:
+        raise RuntimeError("Timed out waiting for the workers") from None
+    finally:
+        start.set()
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+    latencies = array("q")
+    for result in results:
+        latencies.frombytes(result.pop("latencies"))
+    acknowledged = sum(result["acknowledged"] for result in results)
+    delivered = sum(result["delivered"] for result in results)
+    publish_seconds = max((result["publish_seconds"] for result in results), default=0.0)
+    return {
+        "workers": config.workers,
+        "clients_per_worker": config.clients,
+        "qos": config.qos,
+        "payload_size": config.payload_size,
+        "messages": config.messages,
+        "acknowledged": acknowledged,
+        "delivered": delivered,
+        "errors": errors,
+        "wall_seconds": wall_seconds,
+        "publish_msgs_per_sec": acknowledged / publish_seconds if publish_seconds else 0.0,
+        "delivered_msgs_per_sec": delivered / wall_seconds if wall_seconds else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "per_worker": sorted(results, key=lambda result: result["worker"]),
+    }
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    """Print throughput per worker count and the speedup over the first run."""
+    print(f"CPU cores: {os.cpu_count()}", file=sys.stderr)
+    print(f"{'Workers':>7} {'Published/s':>12} {'Delivered/s':>12} {'Speedup':>8} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'Errors':>6}", file=sys.stderr)
+    baseline = results[0]["publish_msgs_per_sec"] if results else 0.0
+    for row in results:
+        speedup = row["publish_msgs_per_sec"] / baseline if baseline else 0.0
+        print(f"{row['workers']:>7} {row['publish_msgs_per_sec']:>12.0f} "
+              f"{row['delivered_msgs_per_sec']:>12.0f} {speedup:>7.2f}x "
+              f"{row['latency_ms']['p50']:>8.2f} {row['latency_ms']['p99']:>8.2f} "
+              f"{len(row['errors']):>6}", file=sys.stderr)
+
+
+def main() -> None:
+    """Run the load generator for each worker count and emit JSON."""
+    parser = argparse.ArgumentParser(description="Multi-process MQTT load generator")
+    add_broker_arguments(parser)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="Worker process counts to compare")
+    parser.add_argument("--clients", type=int, default=1, help="Publisher clients per worker")
+    parser.add_argument("--messages", type=int, default=100_000,
+                        help="Messages per run, split over all workers")
+    parser.add_argument("--rooms", type=int, default=64,
+                        help="Sensors/Room<n>/Temperature topics, sharded over the workers")
+    parser.add_argument("--qos", type=int, default=0, choices=[0, 1, 2], help="QoS level")
+    parser.add_argument("--payload-size", type=int, default=64, help="Payload size in bytes")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout in seconds")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    # The broker gets its own process so it does not share a core's GIL with the coordinator
+    broker = start_broker(args, separate_process=True)
+    try:
+        results = [run_load_test(LoadConfig(args.host, args.port, workers, args.clients,
+                                            args.messages, args.rooms, args.qos,
+                                            args.payload_size, args.timeout))
+                   for workers in args.workers]
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    print_results(results)
+    write_json({"benchmark": "loadgen", "metadata": dict(run_metadata(args),
+                                                          cpu_count=os.cpu_count()),
+                "config": {"workers": args.workers, "clients": args.clients,
+                           "messages": args.messages, "rooms": args.rooms, "qos": args.qos,
+                           "payload_size": args.payload_size},
+                "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
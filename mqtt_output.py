@@ -0,0 +1,185 @@
+"""
+Batched console output for code running on network threads.
+
+print() from a paho callback blocks the client's network loop on console
+I/O. Output instead appends each line to a queue and returns; a background
+writer thread drains the queue and writes everything pending with a single
+write() and flush(). Lines below the configured verbosity are dropped before
+any formatting is done, so per-message lines cost nearly nothing when
+turned off. Records can also be written as JSON lines.
+
+Usage:
+    import mqtt_output as out
+    out.configure(level=out.INFO, json_lines=True)
+    out.info("Connected with result code {}", rc)
+    out.message("Received '{}' on '{}'", text, topic, topic=topic)
+    out.flush()
+"""
+import atexit
+import json
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, TextIO, Tuple
+
+# Verbosity levels; a record is written if its level <= the configured level
+ERROR = 0     # Failures and timeouts
+INFO = 1      # Progress and results
+MESSAGE = 2   # One line per received message
+
+LEVELS: Dict[str, int] = {"error": ERROR, "info": INFO, "message": MESSAGE}
+_LEVEL_NAMES = {level: name for name, level in LEVELS.items()}
+
+# (time, level, thread name, text, args, fields), or a flush marker
+_Record = Tuple[float, int, str, str, Tuple[Any, ...], Dict[str, Any]]
+
+
+class Output:
+    """Queue of output records written by a background thread."""
+
+    def __init__(self,
+                 level: int = MESSAGE,
+                 json_lines: bool = False,
+                 stream: Optional[TextIO] = None) -> None:
+        """
+        Args:
+            level: Highest level written (ERROR, INFO or MESSAGE)
+            json_lines: Write one JSON object per record instead of plain text
+            stream: Destination; defaults to the current sys.stdout
+        """
+        self.level = level
+        self.json_lines = json_lines
+        self.stream = stream
+        self.written = 0
+        self.batches = 0
+        self._queue: Deque[Any] = deque()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def enabled(self, level: int) -> bool:
+        return level <= self.level
+
+    def emit(self, level: int, text: str, *args: Any, **fields: Any) -> None:
+        """
+        Queue a record; `text` is str.format()ted with `args` by the writer.
+
+        Keyword `fields` are added to JSON-lines records only.
+        """
+        if level > self.level:
+            return
+        if self._thread is None:
+            self._start()
+        self._queue.append((time.time(), level, threading.current_thread().name,
+                            text, args, fields))
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """Wait until everything queued so far has been written."""
+        if self._thread is None:
+            return True
+        marker = threading.Event()
+        self._queue.append(marker)
+        self._wakeup.set()
+        return marker.wait(timeout)
+
+    def close(self) -> None:
+        """Write what is pending and stop the writer thread."""
+        if self._thread is None:
+            return
+        self.flush()
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        self._closed = False
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mqtt-output",
+                                                daemon=True)
+                self._thread.start()
+
+    def _format(self, record: _Record) -> str:
+        timestamp, level, thread, text, args, fields = record
+        if args:
+            text = text.format(*args)
+        if not self.json_lines:
+            return text + "\n"
+        doc = {"time": timestamp, "level": _LEVEL_NAMES[level], "thread": thread, "text": text}
+        doc.update(fields)
+        return json.dumps(doc, default=str) + "\n"
+
+    def _run(self) -> None:
+        queue = self._queue
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            lines = []
+            markers = []
+            while queue:
+                record = queue.popleft()
+                if isinstance(record, threading.Event):
+                    markers.append(record)
+                else:
+                    lines.append(self._format(record))
+            if lines:
+                stream = self.stream if self.stream is not None else sys.stdout
+                try:
+                    stream.write("".join(lines))
+                    stream.flush()
+                except (OSError, ValueError):
+                    pass  # Console gone; keep draining so flush() never hangs
+                self.written += len(lines)
+                self.batches += 1
+            for marker in markers:
+                marker.set()
+            if self._closed and not queue:
+                return
+
+
+# Process-wide output used by the tasks and helper modules
+_output = Output()
+atexit.register(_output.close)
+
+
+def configure(level: Optional[int] = None,
+              json_lines: Optional[bool] = None,
+              stream: Optional[TextIO] = None) -> Output:
+    """Change the process-wide output settings; unset arguments are kept."""
+    _output.flush()
+    if level is not None:
+        _output.level = level
+    if json_lines is not None:
+        _output.json_lines = json_lines
+    if stream is not None:
+        _output.stream = stream
+    return _output
+
+
+def enabled(level: int) -> bool:
+    return _output.enabled(level)
+
+
+def error(text: str, *args: Any, **fields: Any) -> None:
+    _output.emit(ERROR, text, *args, **fields)
+
+
+def info(text: str, *args: Any, **fields: Any) -> None:
+    _output.emit(INFO, text, *args, **fields)
+
+
+def message(text: str, *args: Any, **fields: Any) -> None:
+    _output.emit(MESSAGE, text, *args, **fields)
+
+
+def flush(timeout: Optional[float] = 5.0) -> bool:
+    return _output.flush(timeout)
+
+
+def close() -> None:
+    _output.close()
@@ -0,0 +1,303 @@
+"""
+MQTT 3.1.1 / 5.0 packet constants and encoding helpers.
+
+Shared by the embedded broker and the tooling that has to look at raw MQTT
+bytes. Only the pieces of the wire format the repository needs are covered.
+"""
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# Control packet types (upper nibble of the fixed header)
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+PACKET_NAMES = {
+    CONNECT: "CONNECT",
+    CONNACK: "CONNACK",
+    PUBLISH: "PUBLISH",
+    PUBACK: "PUBACK",
+    PUBREC: "PUBREC",
+    PUBREL: "PUBREL",
+    PUBCOMP: "PUBCOMP",
+    SUBSCRIBE: "SUBSCRIBE",
+    SUBACK: "SUBACK",
+    UNSUBSCRIBE: "UNSUBSCRIBE",
+    UNSUBACK: "UNSUBACK",
+    PINGREQ: "PINGREQ",
+    PINGRESP: "PINGRESP",
+    DISCONNECT: "DISCONNECT",
+}
+
+# Protocol levels in CONNECT
+MQTT_V31 = 3
+MQTT_V311 = 4
+MQTT_V5 = 5
+
+# CONNACK return codes (MQTT 3.1.1, section 3.2.2.3)
+CONNACK_ACCEPTED = 0
+CONNACK_REFUSED_PROTOCOL_VERSION = 1
+CONNACK_REFUSED_IDENTIFIER_REJECTED = 2
+
+# MQTT 5 reason codes used by the broker
+REASON_SUCCESS = 0x00
+REASON_NO_SUBSCRIPTION_EXISTED = 0x11
+REASON_DISCONNECT_WITH_WILL = 0x04
+REASON_TOPIC_FILTER_INVALID = 0x8F
+
+# MQTT 5 property identifiers (section 2.2.2.2)
+PROP_SESSION_EXPIRY_INTERVAL = 0x11
+PROP_ASSIGNED_CLIENT_IDENTIFIER = 0x12
+PROP_RECEIVE_MAXIMUM = 0x21
+PROP_TOPIC_ALIAS_MAXIMUM = 0x22
+PROP_TOPIC_ALIAS = 0x23
+PROP_USER_PROPERTY = 0x26
+PROP_SHARED_SUBSCRIPTION_AVAILABLE = 0x2A
+
+# Value types of the properties
+_BYTE, _TWO, _FOUR, _VARINT, _STRING, _BINARY, _PAIR = range(7)
+
+PROPERTY_TYPES = {
+    0x01: _BYTE,        # Payload Format Indicator
+    0x02: _FOUR,        # Message Expiry Interval
+    0x03: _STRING,      # Content Type
+    0x08: _STRING,      # Response Topic
+    0x09: _BINARY,      # Correlation Data
+    0x0B: _VARINT,      # Subscription Identifier
+    0x11: _FOUR,        # Session Expiry Interval
+    0x12: _STRING,      # Assigned Client Identifier
+    0x13: _TWO,         # Server Keep Alive
+    0x15: _STRING,      # Authentication Method
+    0x16: _BINARY,      # Authentication Data
+    0x17: _BYTE,        # Request Problem Information
+    0x18: _FOUR,        # Will Delay Interval
+    0x19: _BYTE,        # Request Response Information
+    0x1A: _STRING,      # Response Information
+    0x1C: _STRING,      # Server Reference
+    0x1F: _STRING,      # Reason String
+    0x21: _TWO,         # Receive Maximum
+    0x22: _TWO,         # Topic Alias Maximum
+    0x23: _TWO,         # Topic Alias
+    0x24: _BYTE,        # Maximum QoS
+    0x25: _BYTE,        # Retain Available
+    0x26: _PAIR,        # User Property (may repeat)
+    0x27: _FOUR,        # Maximum Packet Size
+    0x28: _BYTE,        # Wildcard Subscription Available
+    0x29: _BYTE,        # Subscription Identifier Available
+    0x2A: _BYTE,        # Shared Subscription Available
+}
+
+# Prefix of MQTT 5 shared subscriptions: $share/<group>/<filter>
+SHARE_PREFIX = "$share/"
+
+# Largest value the variable-length "remaining length" field can hold
+MAX_REMAINING_LENGTH = 268_435_455
+
+
+def encode_remaining_length(length: int) -> bytes:
+    """Encode the variable-length remaining length field."""
+    if length > MAX_REMAINING_LENGTH:
+        raise ValueError(f"Packet too large: {length} bytes")
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length:
+            byte |= 0x80
+        encoded.append(byte)
+        if not length:
+            return bytes(encoded)
+
+
+def decode_varint(buffer: Union[bytes, memoryview], pos: int) -> Tuple[int, int]:
+    """Decode a variable byte integer, returning it and the next offset."""
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+        if shift > 21:
+            raise ValueError("Malformed variable byte integer")
+
+
+def decode_fixed_header(buffer: Union[bytes, bytearray, memoryview],
+                        pos: int = 0) -> Optional[Tuple[int, int, int]]:
+    """
+    Decode the fixed header starting at `pos`.
+
+    Returns:
+        tuple: (first_byte, remaining_length, body_start), or None if the
+        buffer does not yet hold the complete header
+    """
+    end = len(buffer)
+    if pos + 2 > end:
+        return None
+    first = buffer[pos]
+    length = 0
+    multiplier = 1
+    index = pos + 1
+    while True:
+        if index >= end:
+            return None
+        byte = buffer[index]
+        length += (byte & 0x7F) * multiplier
+        index += 1
+        if not byte & 0x80:
+            return first, length, index
+        multiplier *= 128
+        if multiplier > 128 ** 3:
+            raise ValueError("Malformed remaining length")
+
+
+def encode_string(value: Union[str, bytes]) -> bytes:
+    """Encode a UTF-8 string or binary field with its two-byte length prefix."""
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return len(value).to_bytes(2, "big") + value
+
+
+def decode_string(buffer: Union[bytes, memoryview], pos: int) -> Tuple[str, int]:
+    """Decode a length-prefixed UTF-8 string, returning it and the next offset."""
+    raw, pos = decode_binary(buffer, pos)
+    return raw.decode("utf-8"), pos
+
+
+def decode_binary(buffer: Union[bytes, memoryview], pos: int) -> Tuple[bytes, int]:
+    """Decode a length-prefixed binary field, returning it and the next offset."""
+    length = int.from_bytes(buffer[pos:pos + 2], "big")
+    start = pos + 2
+    return bytes(buffer[start:start + length]), start + length
+
+
+def decode_properties(buffer: Union[bytes, memoryview],
+                      pos: int) -> Tuple[Dict[int, Any], int]:
+    """
+    Decode an MQTT 5 property block, returning {identifier: value} and the next offset.
+
+    User properties are collected in a list of (name, value) pairs.
+    """
+    length, pos = decode_varint(buffer, pos)
+    end = pos + length
+    properties: Dict[int, Any] = {}
+    while pos < end:
+        identifier, pos = decode_varint(buffer, pos)
+        kind = PROPERTY_TYPES.get(identifier)
+        if kind == _BYTE:
+            value = buffer[pos]
+            pos += 1
+        elif kind == _TWO:
+            value = int.from_bytes(buffer[pos:pos + 2], "big")
+            pos += 2
+        elif kind == _FOUR:
+            value = int.from_bytes(buffer[pos:pos + 4], "big")
+            pos += 4
+        elif kind == _VARINT:
+            value, pos = decode_varint(buffer, pos)
+        elif kind == _STRING:
+            value, pos = decode_string(buffer, pos)
+        elif kind == _BINARY:
+            value, pos = decode_binary(buffer, pos)
+        elif kind == _PAIR:
+            name, pos = decode_string(buffer, pos)
+            text, pos = decode_string(buffer, pos)
+            properties.setdefault(identifier, []).append((name, text))
+            continue
+        else:
+            raise ValueError(f"Unknown property identifier: {identifier:#x}")
+        properties[identifier] = value
+    if pos != end:
+        raise ValueError("Malformed property block")
+    return properties, end
+
+
+def encode_properties(properties: Optional[Dict[int, Any]] = None) -> bytes:
+    """Encode an MQTT 5 property block (just the zero length if there are none)."""
+    if not properties:
+        return b"\x00"
+    encoded = bytearray()
+    for identifier, value in properties.items():
+        kind = PROPERTY_TYPES[identifier]
+        values: List[Any] = value if kind == _PAIR else [value]
+        for item in values:
+            encoded += encode_remaining_length(identifier)
+            if kind == _BYTE:
+                encoded.append(item)
+            elif kind == _TWO:
+                encoded += item.to_bytes(2, "big")
+            elif kind == _FOUR:
+                encoded += item.to_bytes(4, "big")
+            elif kind == _VARINT:
+                encoded += encode_remaining_length(item)
+            elif kind == _PAIR:
+                encoded += encode_string(item[0]) + encode_string(item[1])
+            else:
+                encoded += encode_string(item)
+    return encode_remaining_length(len(encoded)) + bytes(encoded)
+
+
+def split_shared(topic_filter: str) -> Optional[Tuple[str, str]]:
+    """Split $share/<group>/<filter> into (group, filter); None for other filters."""
+    if not topic_filter.startswith(SHARE_PREFIX):
+        return None
+    group, _, shared_filter = topic_filter[len(SHARE_PREFIX):].partition("/")
+    if not group or not shared_filter or "+" in group or "#" in group:
+        raise ValueError(f"Malformed shared subscription: {topic_filter!r}")
+    return group, shared_filter
+
+
+def packet(first_byte: int, body: bytes = b"") -> bytes:
+    """Frame `body` with a fixed header."""
+    return bytes((first_byte,)) + encode_remaining_length(len(body)) + body
+
+
+def ack_packet(packet_type: int, mid: int) -> bytes:
+    """Build a PUBACK/PUBREC/PUBREL/PUBCOMP/UNSUBACK for packet id `mid`."""
+    # PUBREL must have the reserved flag bits set to 0b0010
+    flags = 0x02 if packet_type == PUBREL else 0x00
+    return bytes((packet_type << 4 | flags, 2)) + mid.to_bytes(2, "big")
+
+
+def publish_packet(topic: bytes,
+                   payload: bytes,
+                   qos: int,
+                   mid: Optional[int] = None,
+                   retain: bool = False,
+                   dup: bool = False,
+                   properties: Optional[bytes] = None) -> bytes:
+    """
+    Build a PUBLISH packet.
+
+    Args:
+        topic: Topic name, already UTF-8 encoded
+        payload: Application message
+        qos: Delivery QoS (the packet id is only written for QoS > 0)
+        mid: Packet identifier for QoS 1/2
+        retain: Retain flag
+        dup: Duplicate delivery flag
+        properties: Encoded MQTT 5 property block; None for MQTT 3.1.1
+    """
+    first = PUBLISH << 4 | qos << 1 | (0x08 if dup else 0) | (0x01 if retain else 0)
+    topic_field = len(topic).to_bytes(2, "big") + topic
+    if qos:
+        header_rest = topic_field + mid.to_bytes(2, "big")
+    else:
+        header_rest = topic_field
+    if properties is not None:
+        header_rest += properties
+    length = len(header_rest) + len(payload)
+    return b"".join((bytes((first,)), encode_remaining_length(length),
+                     header_rest, payload))
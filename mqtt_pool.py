@@ -0,0 +1,259 @@
+"""
+A pool of connected publisher clients.
+
+Tasks 6-8 each built, connected and tore down their own publisher, paying
+a TCP and CONNECT/CONNACK round trip per task for a client that only
+publishes. A ClientPool keeps connected clients per configuration (broker
+host and port, protocol and clean session flag) and lends them out: borrow()
+returns an idle client with that configuration, or connects a new one, and
+release() hands it back for the next borrower.
+
+Idle clients stay connected with a short keepalive, so paho pings the
+broker in the background and closes the connection if no PINGRESP comes
+back. A client idle for longer than `probe_after` seconds is additionally
+probed before it is lent out: an empty QoS 1 publish to `probe_topic` must
+be acknowledged within `probe_timeout`, or the client is replaced by a fresh
+connection. The pool counts the handshakes it made and the ones reuse
+avoided.
+
+Borrowers may set on_publish and on_message (reset on release) and publish
+freely, but must not subscribe, set a will or disconnect the client; a
+client returned disconnected is discarded.
+
+Usage:
+    pool = ClientPool(factory=lambda key: create_client("publisher", key.clean_session,
+                                                        protocol=key.protocol))
+    publisher = pool.borrow(host, port)
+    try:
+        publisher.publish("Sensor/Temp", "21.5", qos=1)
+    finally:
+        pool.release(publisher)
+    ...
+    pool.print_report()
+    pool.close()
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import paho.mqtt.client as mqtt
+
+import mqtt_output as out
+from mqtt_clients import connect_client, create_client, disconnect_client, track_connection
+from mqtt_waiters import DEFAULT_TIMEOUT, CompletionTracker
+
+# Keepalive of pooled connections, in seconds; paho pings idle ones this often
+POOL_KEEPALIVE = 30
+
+# Callbacks a borrower may have set, cleared when the client comes back
+_BORROWER_CALLBACKS = ("on_publish", "on_message")
+
+# Topic of the health probes; nobody needs to subscribe to it
+PROBE_TOPIC = "pool/probe"
+
+
+class PoolKey(NamedTuple):
+    """Configuration shared by interchangeable pooled clients."""
+    host: str
+    port: int
+    protocol: int = mqtt.MQTTv311
+    clean_session: bool = True
+
+
+class PoolStats:
+    """Pool counters; handshakes_avoided is the number of borrows served by reuse."""
+    __slots__ = ("borrows", "handshakes", "handshakes_avoided", "probes", "unhealthy", "discarded")
+
+    def __init__(self) -> None:
+        self.borrows = 0
+        self.handshakes = 0
+        self.handshakes_avoided = 0
+        self.probes = 0
+        self.unhealthy = 0
+        self.discarded = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _default_factory(key: PoolKey) -> mqtt.Client:
+    return create_client("pooled", clean_session=key.clean_session, protocol=key.protocol)
+
+
+class ClientPool:
+    """Connected clients lent out by configuration and reused after release()."""
+
+    def __init__(self,
+                 factory: Optional[Callable[[PoolKey], mqtt.Client]] = None,
+                 max_idle: int = 4,
+                 keepalive: int = POOL_KEEPALIVE,
+                 probe_after: float = 1.0,
+                 probe_timeout: float = 2.0,
+                 probe_topic: str = PROBE_TOPIC,
+                 timeout: float = DEFAULT_TIMEOUT) -> None:
+        """
+        Args:
+            factory: Builds an unconnected client for a key (protocol and
+                     clean session must match it); create_client() by default
+            max_idle: Idle clients kept per key; further released ones are disconnected
+            keepalive: Keepalive of the pooled connections, in seconds
+            probe_after: Idle time after which a client is probed with a
+                         QoS 1 publish before it is lent out, in seconds
+            probe_timeout: Longest wait for the probe's PUBACK
+            probe_topic: Topic the probes are published to
+            timeout: Longest wait for a new client's CONNACK
+        """
+        self.factory = factory or _default_factory
+        self.max_idle = max_idle
+        self.keepalive = keepalive
+        self.probe_after = probe_after
+        self.probe_timeout = probe_timeout
+        self.probe_topic = probe_topic
+        self.timeout = timeout
+        self.stats = PoolStats()
+        self._lock = threading.Lock()
+        # Idle clients per key with the time they were released, most recent last
+        self._idle: Dict[PoolKey, List[Tuple[mqtt.Client, float]]] = {}
+        self._keys: Dict[mqtt.Client, PoolKey] = {}
+        self._borrowed: Set[mqtt.Client] = set()
+        self._closed = False
+
+    def borrow(self,
+               host: str,
+               port: int,
+               protocol: int = mqtt.MQTTv311,
+               clean_session: bool = True) -> mqtt.Client:
+        """
+        Lend out a connected client for this configuration.
+
+        Args:
+            host: Broker host
+            port: Broker port
+            protocol: mqtt.MQTTv311 or mqtt.MQTTv5
+            clean_session: Session flag the client connected with
+
+        Returns:
+            mqtt.Client: A connected client; give it back with release()
+
+        Raises:
+            RuntimeError: If the pool is closed or a new client could not connect
+        """
+        key = PoolKey(host, port, protocol, clean_session)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Client pool is closed")
+            self.stats.borrows += 1
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                client, released_at = idle.pop()
+                self._borrowed.add(client)
+            if self._healthy(client, time.monotonic() - released_at):
+                with self._lock:
+                    self.stats.handshakes_avoided += 1
+                return client
+            # Dead or unresponsive: drop it and try the next idle one
+            with self._lock:
+                self.stats.unhealthy += 1
+            self._discard(client)
+        return self._connect(key)
+
+    def release(self, client: mqtt.Client) -> None:
+        """Give a borrowed client back; it is disconnected if it can't be reused."""
+        with self._lock:
+            key = self._keys.get(client)
+            if key is None or client not in self._borrowed:
+                raise ValueError("Client was not borrowed from this pool")
+            for callback in _BORROWER_CALLBACKS:
+                setattr(client, callback, None)
+            self._borrowed.discard(client)
+            idle = self._idle.setdefault(key, [])
+            if not self._closed and client.is_connected() and len(idle) < self.max_idle:
+                idle.append((client, time.monotonic()))
+                return
+        self._discard(client)
+
+    @contextmanager
+    def client(self,
+               host: str,
+               port: int,
+               protocol: int = mqtt.MQTTv311,
+               clean_session: bool = True) -> Iterator[mqtt.Client]:
+        """borrow() for the duration of a with block."""
+        client = self.borrow(host, port, protocol, clean_session)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def _connect(self, key: PoolKey) -> mqtt.Client:
+        """Connect a new client for `key` and mark it borrowed."""
+        client = self.factory(key)
+        tracker = CompletionTracker(f"pool-{client._client_id.decode()}")
+        track_connection(client, tracker)
+        with self._lock:
+            self._keys[client] = key
+            self._borrowed.add(client)
+            self.stats.handshakes += 1
+        try:
+            connected = connect_client(client, tracker, key.host, key.port,
+                                       keepalive=self.keepalive, timeout=self.timeout)
+        except OSError:
+            connected = False
+        if not connected:
+            self._discard(client)
+            raise RuntimeError(f"Pooled client could not connect to {key.host}:{key.port}")
+        return client
+
+    def _healthy(self, client: mqtt.Client, idle_for: float) -> bool:
+        """Whether an idle client is still connected, probing it if it idled long."""
+        if not client.is_connected():
+            return False
+        if idle_for < self.probe_after:
+            return True
+        with self._lock:
+            self.stats.probes += 1
+        # A full round trip through the broker; the PUBACK proves the connection
+        info = client.publish(self.probe_topic, b"", qos=1)
+        try:
+            info.wait_for_publish(self.probe_timeout)
+        except (RuntimeError, ValueError):
+            return False  # Not queued: the connection is gone
+        return info.is_published() and client.is_connected()
+
+    def _discard(self, client: mqtt.Client) -> None:
+        """Disconnect a client and forget it."""
+        with self._lock:
+            self._keys.pop(client, None)
+            self._borrowed.discard(client)
+            self.stats.discarded += 1
+        disconnect_client(client)
+
+    def close(self) -> None:
+        """Disconnect every pooled client, idle or still borrowed."""
+        with self._lock:
+            self._closed = True
+            clients = list(self._keys)
+            self._idle.clear()
+        for client in clients:
+            self._discard(client)
+
+    def report(self) -> Dict[str, int]:
+        """Counters plus the number of idle and borrowed clients, as a JSON-ready dict."""
+        with self._lock:
+            return dict(self.stats.as_dict(),
+                        idle=sum(len(idle) for idle in self._idle.values()),
+                        borrowed=len(self._borrowed))
+
+    def print_report(self) -> None:
+        """Print how many handshakes the pool made and how many reuse avoided."""
+        report = self.report()
+        if not report["borrows"]:
+            return
+        out.info("\n--- Client Pool ---")
+        out.info(f"{report['borrows']} borrows, {report['handshakes']} handshakes, "
+                 f"{report['handshakes_avoided']} avoided by reuse "
+                 f"({report['probes']} health probes, {report['unhealthy']} unhealthy clients replaced)")
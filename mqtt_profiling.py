@@ -0,0 +1,279 @@
+"""
+Callback profiling for paho clients.
+
+The on_connect/on_subscribe/on_message handlers of every task run on paho's
+network thread, so a slow handler caps how fast that client can receive.
+instrument() makes every callback assigned to a client (before or after the
+call) report its execution time into a log2-bucketed histogram per task,
+callback and handler. On top of that, every Nth callback can be run under
+cProfile (set_sampling(), or SIGUSR1 from the command line) to see where
+inside the handler the time goes. Profiling is off until enable() is called,
+so uninstrumented runs pay nothing.
+
+Usage:
+    mqtt_profiling.enable()
+    client = mqtt_profiling.instrument(create_client("subscriber"), "task3")
+    client.on_message = on_message
+    ...
+    mqtt_profiling.print_profile_report()
+"""
+import cProfile
+import io
+import pstats
+import threading
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import paho.mqtt.client as mqtt
+
+import mqtt_output as out
+
+# Callbacks that are timed; on_message is the receive path
+CALLBACKS = ("on_connect", "on_disconnect", "on_subscribe", "on_publish", "on_message")
+
+# Histogram buckets: bucket b counts durations of [2**(b-1), 2**b) nanoseconds,
+# enough for any duration below 2**64 ns
+BUCKETS = 65
+
+_enabled = False
+_sample_every = 0           # Run every Nth call of each handler under cProfile; 0 = never
+_profiler = cProfile.Profile()
+_profiler_lock = threading.Lock()
+_profiled_calls = 0
+
+
+def enable(enabled: bool = True) -> None:
+    """Turn instrumentation of newly created clients on or off."""
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def set_sampling(every: int) -> None:
+    """Profile every `every`-th call of each handler with cProfile (0 stops sampling)."""
+    global _sample_every
+    _sample_every = max(every, 0)
+
+
+def sampling() -> int:
+    return _sample_every
+
+
+class LatencyHistogram:
+    """Execution times of one handler, in power-of-two nanosecond buckets."""
+    __slots__ = ("calls", "total_ns", "max_ns", "sampled", "buckets")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.sampled = 0        # Calls run under cProfile; counted but not timed
+        self.buckets = [0] * BUCKETS
+
+    def record(self, elapsed_ns: int) -> None:
+        self.calls += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        self.buckets[elapsed_ns.bit_length()] += 1
+
+    def add(self, other: "LatencyHistogram") -> None:
+        self.calls += other.calls
+        self.total_ns += other.total_ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+        self.sampled += other.sampled
+        for bucket in range(BUCKETS):
+            self.buckets[bucket] += other.buckets[bucket]
+
+    @property
+    def mean_ns(self) -> float:
+        return self.total_ns / self.calls if self.calls else 0.0
+
+    def percentile_ns(self, fraction: float) -> int:
+        """Upper bound of the bucket holding the given fraction of calls."""
+        rank = fraction * self.calls
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(1 << bucket, self.max_ns)
+        return self.max_ns
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "sampled": self.sampled, "total_ns": self.total_ns,
+                "mean_ns": self.mean_ns, "p50_ns": self.percentile_ns(0.5),
+                "p99_ns": self.percentile_ns(0.99), "max_ns": self.max_ns,
+                "buckets": {1 << bucket: count for bucket, count in enumerate(self.buckets)
+                            if count}}
+
+
+# (scenario, callback, handler name)
+HistogramKey = Tuple[str, str, str]
+
+# One histogram per wrapped callback and scenario. A client's callbacks all run
+# on its network thread, so recording needs no lock; the report merges
+# histograms with the same key (e.g. task 5's handler shared by two clients).
+_histograms: List[Tuple[HistogramKey, LatencyHistogram]] = []
+_histograms_lock = threading.Lock()
+
+
+def _new_histogram(key: HistogramKey) -> LatencyHistogram:
+    histogram = LatencyHistogram()
+    with _histograms_lock:
+        _histograms.append((key, histogram))
+    return histogram
+
+
+def histograms() -> Dict[HistogramKey, LatencyHistogram]:
+    """Merged histograms by (scenario, callback, handler name)."""
+    merged: Dict[HistogramKey, LatencyHistogram] = {}
+    with _histograms_lock:
+        registered = list(_histograms)
+    for key, histogram in registered:
+        merged.setdefault(key, LatencyHistogram()).add(histogram)
+    return merged
+
+
+def handler_name(func: Callable[..., Any]) -> str:
+    """Readable name of a callback: task3.on_message, task6.<lambda>, TopicDispatcher."""
+    name = getattr(func, "__qualname__", None) or type(func).__name__
+    return name.replace(".<locals>", "")
+
+
+def _run_sampled(func: Callable[..., Any], args: Tuple[Any, ...]) -> Any:
+    """Call `func` under the shared profiler; the caller holds _profiler_lock."""
+    global _profiled_calls
+    try:
+        _profiled_calls += 1
+        _profiler.enable()
+        try:
+            return func(*args)
+        finally:
+            _profiler.disable()
+    finally:
+        _profiler_lock.release()
+
+
+def _timed(client: mqtt.Client, callback: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap `func` so each call is recorded under the client's current scenario."""
+    name = handler_name(func)
+    cached: List[Any] = [None, None]    # Scenario and its histogram, refreshed on change
+    calls = [0]
+
+    def timed_callback(*args: Any) -> Any:
+        scenario = client._profile_scenario
+        if cached[0] != scenario:
+            cached[0], cached[1] = scenario, _new_histogram((scenario, callback, name))
+        histogram = cached[1]
+        every = _sample_every
+        if every:
+            calls[0] += 1
+            # Only one thread can be profiled at a time; others just get timed
+            if calls[0] % every == 0 and _profiler_lock.acquire(blocking=False):
+                histogram.sampled += 1
+                return _run_sampled(func, args)
+        begin = perf_counter_ns()
+        try:
+            return func(*args)
+        finally:
+            histogram.record(perf_counter_ns() - begin)
+
+    timed_callback.profiled = func
+    return timed_callback
+
+
+def _profiled_property(callback: str) -> property:
+    base = getattr(mqtt.Client, callback)
+
+    def set_callback(self: mqtt.Client, func: Optional[Callable[..., Any]]) -> None:
+        if func is not None and not hasattr(func, "profiled"):
+            func = _timed(self, callback, func)
+        base.fset(self, func)
+
+    return property(base.fget, set_callback, doc=base.__doc__)
+
+
+class ProfiledClient(mqtt.Client):
+    """mqtt.Client whose callback setters wrap the handler with a timer."""
+    _profile_scenario = ""
+
+
+for _callback in CALLBACKS:
+    setattr(ProfiledClient, _callback, _profiled_property(_callback))
+
+
+def instrument(client: mqtt.Client, scenario: str) -> mqtt.Client:
+    """Time `client`'s callbacks under `scenario` if profiling is enabled."""
+    if not _enabled:
+        return client
+    # paho reads its callbacks back through these properties, so swapping in
+    # the subclass catches every later assignment; rewrap the existing ones
+    client.__class__ = ProfiledClient
+    client._profile_scenario = scenario
+    for callback in CALLBACKS:
+        func = getattr(client, callback)
+        if func is not None:
+            setattr(client, callback, func)
+    return client
+
+
+def set_scenario(client: mqtt.Client, scenario: str) -> None:
+    """Attribute `client`'s further callbacks to `scenario` (no-op if not instrumented)."""
+    if isinstance(client, ProfiledClient):
+        client._profile_scenario = scenario
+
+
+def profile_report() -> Dict[str, Any]:
+    """Histograms and the dominant receive-path handler, as a JSON-ready dict."""
+    items = sorted(histograms().items())
+    receive = [(key, histogram) for key, histogram in items if key[1] == "on_message"]
+    receive_ns = sum(histogram.total_ns for _, histogram in receive)
+    dominant = max(receive, key=lambda item: item[1].total_ns, default=None)
+    return {
+        "handlers": [dict(histogram.as_dict(), scenario=scenario, callback=callback,
+                          handler=name)
+                     for (scenario, callback, name), histogram in items],
+        "receive_path": None if dominant is None else {
+            "scenario": dominant[0][0], "handler": dominant[0][2],
+            "total_ns": dominant[1].total_ns,
+            "share": dominant[1].total_ns / receive_ns if receive_ns else 0.0,
+        },
+        "profiled_calls": _profiled_calls,
+    }
+
+
+def write_profile_stats(path: str) -> None:
+    """Dump the sampled cProfile data for pstats or snakeviz."""
+    with _profiler_lock:
+        _profiler.dump_stats(path)
+
+
+def print_profile_report(top: int = 10) -> None:
+    """Print the handler histograms, the dominant receive handler and sampled hot spots."""
+    report = profile_report()
+    if not report["handlers"]:
+        return
+    out.info("\n--- Callback Profile ---")
+    out.info(f"{'Scenario':<13} {'Callback':<13} {'Handler':<26} {'Calls':>7} "
+             f"{'Total ms':>9} {'Mean us':>8} {'p50 us':>8} {'p99 us':>8} {'Max us':>8}")
+    for row in report["handlers"]:
+        out.info(f"{row['scenario']:<13} {row['callback']:<13} {row['handler']:<26} "
+                 f"{row['calls']:>7} {row['total_ns'] / 1e6:>9.3f} {row['mean_ns'] / 1e3:>8.1f} "
+                 f"{row['p50_ns'] / 1e3:>8.1f} {row['p99_ns'] / 1e3:>8.1f} "
+                 f"{row['max_ns'] / 1e3:>8.1f}")
+    dominant = report["receive_path"]
+    if dominant is not None:
+        out.info(f"Receive path: {dominant['handler']} in {dominant['scenario']} takes "
+                 f"{dominant['share']:.0%} of all on_message time "
+                 f"({dominant['total_ns'] / 1e6:.3f} ms)")
+    if report["profiled_calls"]:
+        buffer = io.StringIO()
+        with _profiler_lock:
+            stats = pstats.Stats(_profiler, stream=buffer)
+        stats.sort_stats("cumulative").print_stats(top)
+        out.info(f"cProfile of {report['profiled_calls']} sampled callbacks "
+                 f"(top {top} by cumulative time):")
+        out.info(buffer.getvalue().rstrip())
@@ -0,0 +1,345 @@
+"""
+Reconnect management with jittered exponential backoff.
+
+Tasks 6-8 used to throw their subscriber away and build a new mqtt.Client
+to reconnect. ReconnectManager instead keeps the client object (with its
+callbacks and instrumentation) and takes over paho's reconnect timing:
+paho's loop thread waits min_delay * 2^n between attempts, the same for
+every client, so a fleet that lost the broker at the same moment retries in
+lock step and hits the restarted broker all at once. The manager spreads
+the attempts out with jitter (full jitter by default: a uniform delay
+between 0 and the exponential ceiling) and records, per reconnect, the
+time from connection loss to CONNACK, the attempts it took and whether the
+broker still had the session.
+
+The storm simulation connects N persistent subscribers to a broker in a
+child process, kills and restarts it on the same port, and measures how
+long the fleet takes to be connected again and how hard it hits the broker
+(peak CONNACKs per 100 ms) for each jitter mode. Clients run one
+loop_start() thread each, which select() limits to a few hundred per
+process.
+
+Usage:
+    reconnects = ReconnectManager(Backoff(base=0.1, cap=10))
+    reconnects.manage(subscriber)
+    ...
+    reconnects.reconnect(subscriber)    # after a deliberate disconnect()
+
+    python mqtt_reconnect.py --clients 200 --jitter none full equal --downtime 1
+"""
+import argparse
+import gc
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import paho.mqtt.client as mqtt
+
+import mqtt_output as out
+from mqtt_benchmark import latency_summary, run_metadata, write_json
+from mqtt_broker import BrokerProcess
+from mqtt_clients import (connect_client, create_client, disconnect_client, require_paho,
+                          track_connection)
+from mqtt_waiters import DEFAULT_TIMEOUT, CompletionTracker
+
+# The manager hooks paho's private reconnect wait, CONNACK handler and connection state
+require_paho(__name__)
+
+# Jitter applied to the exponential delay ceiling (see Backoff.delay)
+JITTER_MODES = ("full", "equal", "none")
+
+# Longest single sleep while waiting, so loop_stop()/disconnect() are noticed
+_POLL_INTERVAL = 0.05
+
+# paho connection states in which its loop stops retrying
+_STOPPING = (mqtt._ConnectionState.MQTT_CS_DISCONNECTING, mqtt._ConnectionState.MQTT_CS_DISCONNECTED)
+
+
+class Backoff:
+    """Exponential backoff delays with jitter."""
+
+    def __init__(self, base: float = 0.1, cap: float = 30.0, jitter: str = "full",
+                 rng: Optional[random.Random] = None) -> None:
+        """
+        Args:
+            base: Delay ceiling of the first retry, in seconds
+            cap: Largest delay ceiling, in seconds
+            jitter: "full" (uniform in [0, ceiling]), "equal" (uniform in
+                    [ceiling / 2, ceiling]) or "none" (the ceiling itself)
+            rng: Random source, for reproducible runs
+        """
+        if jitter not in JITTER_MODES:
+            raise ValueError(f"Unknown jitter mode: {jitter!r}")
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+        self._rng = rng or random.Random()
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before retry number `attempt` (0 for the first)."""
+        ceiling = min(self.cap, self.base * 2 ** min(attempt, 32))
+        if self.jitter == "full":
+            return self._rng.uniform(0, ceiling)
+        if self.jitter == "equal":
+            return ceiling / 2 + self._rng.uniform(0, ceiling / 2)
+        return ceiling
+
+
+class ReconnectRecord(NamedTuple):
+    """One completed reconnect."""
+    client_id: str
+    outage: float           # Seconds from connection loss (or reconnect()) to CONNACK
+    attempts: int           # Connection attempts, including the successful one
+    session_present: bool
+    connected_at: float     # perf_counter() at CONNACK
+
+
+class _ClientState:
+    """Reconnect bookkeeping of one managed client."""
+    __slots__ = ("client_id", "lost_at", "attempts")
+
+    def __init__(self, client_id: str) -> None:
+        self.client_id = client_id
+        self.lost_at: Optional[float] = None
+        self.attempts = 0
+
+
+class ReconnectManager:
+    """Reconnects paho clients in place with jittered backoff and records each reconnect."""
+
+    def __init__(self, backoff: Optional[Backoff] = None) -> None:
+        self.backoff = backoff or Backoff()
+        self.records: List[ReconnectRecord] = []
+        self.refused = 0        # CONNACKs with a non-zero return code
+        self._condition = threading.Condition()
+
+    def manage(self, client: mqtt.Client) -> mqtt.Client:
+        """
+        Take over `client`'s reconnect timing and record its reconnects.
+
+        Works before or after connect(). paho's loop thread still does the
+        reconnecting; the manager only decides how long it waits.
+        """
+        if getattr(client, "_reconnect_state", None) is not None:
+            return client
+        state = _ClientState(client._client_id.decode())
+        handle_connack = client._handle_connack
+
+        def reconnect_wait() -> None:
+            # Called by paho's loop after a lost connection or a failed attempt
+            if state.lost_at is None:
+                state.lost_at = time.perf_counter()
+            deadline = time.perf_counter() + self.backoff.delay(state.attempts)
+            state.attempts += 1
+            while not client._thread_terminate and client._state not in _STOPPING:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                time.sleep(min(remaining, _POLL_INTERVAL))
+
+        def on_connack() -> Any:
+            packet = client._in_packet["packet"]
+            self._connack_received(state, bool(packet[0] & 0x01), packet[1])
+            return handle_connack()
+
+        # paho has no reconnect or CONNACK hooks; like mqtt_wire, override the
+        # per-instance methods its loop calls
+        client._reconnect_wait = reconnect_wait
+        client._handle_connack = on_connack
+        client._reconnect_state = state
+        return client
+
+    def _connack_received(self, state: _ClientState, session_present: bool, rc: int) -> None:
+        now = time.perf_counter()
+        with self._condition:
+            if rc:
+                self.refused += 1
+                return
+            if state.lost_at is not None:
+                self.records.append(ReconnectRecord(state.client_id, now - state.lost_at,
+                                                    state.attempts + 1, session_present, now))
+                self._condition.notify_all()
+            state.lost_at = None
+            state.attempts = 0
+
+    def reconnect(self, client: mqtt.Client, timeout: float = DEFAULT_TIMEOUT) -> bool:
+        """
+        Reconnect a client that was disconnected on purpose, reusing the object.
+
+        Retries refused TCP connections with backoff, then restarts the
+        network loop; the caller waits for CONNACK as after connect().
+
+        Returns:
+            bool: True if the connection was opened within `timeout`
+        """
+        state = self.manage(client)._reconnect_state
+        state.lost_at = time.perf_counter()
+        deadline = state.lost_at + timeout
+        while True:
+            try:
+                client.reconnect()
+                break
+            except OSError:
+                delay = self.backoff.delay(state.attempts)
+                state.attempts += 1
+                if time.perf_counter() + delay > deadline:
+                    return False
+                time.sleep(delay)
+        client.loop_start()
+        return True
+
+    def wait_reconnects(self, count: int, timeout: float) -> bool:
+        """Wait until `count` reconnects have been recorded in total."""
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.records) >= count, timeout)
+
+    def summary(self, since: int = 0) -> Dict[str, Any]:
+        """Outage latency, attempts and session-present counts of records[since:]."""
+        with self._condition:
+            records = self.records[since:]
+        attempts = [record.attempts for record in records]
+        return {
+            "reconnects": len(records),
+            "outage_ms": latency_summary([int(record.outage * 1e9) for record in records]),
+            "attempts_mean": sum(attempts) / len(attempts) if attempts else 0.0,
+            "attempts_max": max(attempts, default=0),
+            "session_present": sum(record.session_present for record in records),
+            "refused": self.refused,
+        }
+
+    def print_report(self) -> None:
+        """Print one line per reconnect and the latency summary."""
+        with self._condition:
+            records = list(self.records)
+        if not records:
+            return
+        out.info("\n--- Reconnects ---")
+        out.info(f"{'Client':<40} {'Outage (ms)':>11} {'Attempts':>8}  Session present")
+        for record in records:
+            out.info(f"{record.client_id:<40} {record.outage * 1000:>11.1f} "
+                     f"{record.attempts:>8}  {record.session_present}")
+        summary = self.summary()
+        out.info(f"{summary['reconnects']} reconnects, p50 {summary['outage_ms']['p50']:.1f} ms, "
+                 f"max {summary['outage_ms']['max']:.1f} ms, session present "
+                 f"{summary['session_present']}/{summary['reconnects']}")
+
+
+def peak_rate(times: List[float], window: float = 0.1) -> float:
+    """Highest number of events in any `window` seconds, per second."""
+    times = sorted(times)
+    peak = start = 0
+    for end, at in enumerate(times):
+        while at - times[start] > window:
+            start += 1
+        peak = max(peak, end - start + 1)
+    return peak / window
+
+
+def run_storm(clients: int,
+              backoff: Backoff,
+              downtime: float,
+              timeout: float) -> Dict[str, Any]:
+    """
+    Connect a fleet, restart its broker and time the way back.
+
+    Args:
+        clients: Persistent subscribers in the fleet
+        backoff: Reconnect backoff of every client
+        downtime: Seconds the broker stays down
+        timeout: Longest wait for the fleet to be back
+
+    Returns:
+        dict: One result row
+    """
+    broker = BrokerProcess()
+    host, port = broker.start()
+    manager = ReconnectManager(backoff)
+    fleet: List[mqtt.Client] = []
+    try:
+        for index in range(clients):
+            client = create_client("storm", clean_session=False,
+                                   client_id=f"storm-{backoff.jitter}-{index}")
+            tracker = CompletionTracker(f"storm-{index}")
+            track_connection(client, tracker, [(f"Storm/{index}/#", 1)])
+            manager.manage(client)
+            fleet.append(client)
+            if not connect_client(client, tracker, host, port):
+                raise RuntimeError(f"Storm client {index} could not connect")
+
+        broker.stop()
+        down_at = time.perf_counter()
+        time.sleep(downtime)
+        broker.start()
+        restarted_at = time.perf_counter()
+        complete = manager.wait_reconnects(clients, timeout)
+        summary = manager.summary()
+        connected = [record.connected_at for record in manager.records]
+    finally:
+        for client in fleet:
+            disconnect_client(client)
+        broker.stop()
+        # paho closes a client's wakeup socket pair only when the client is
+        # collected, and the manager's hooks put every client in a cycle;
+        # leftover descriptors would push the next fleet past select()'s limit
+        fleet.clear()
+        gc.collect()
+
+    return dict(summary, **{
+        "clients": clients,
+        "jitter": backoff.jitter,
+        "base_seconds": backoff.base,
+        "cap_seconds": backoff.cap,
+        "downtime_seconds": downtime,
+        "complete": complete,
+        "fleet_back_seconds": max(connected) - restarted_at if connected else None,
+        "outage_seconds": max(connected) - down_at if connected else None,
+        "peak_connacks_per_sec": peak_rate(connected),
+    })
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    """Print how quickly and how evenly each jitter mode brought the fleet back."""
+    print(f"{'Jitter':<7} {'Clients':>7} {'Back':>5} {'Fleet back (s)':>14} {'p50 (ms)':>9} "
+          f"{'p99 (ms)':>9} {'Attempts':>8} {'Peak CONNACK/s':>14} {'Sess.':>5}", file=sys.stderr)
+    for row in results:
+        back = row["fleet_back_seconds"]
+        print(f"{row['jitter']:<7} {row['clients']:>7} {row['reconnects']:>5} "
+              f"{back if back is not None else float('nan'):>14.2f} "
+              f"{row['outage_ms']['p50']:>9.0f} {row['outage_ms']['p99']:>9.0f} "
+              f"{row['attempts_mean']:>8.1f} {row['peak_connacks_per_sec']:>14.0f} "
+              f"{row['session_present']:>5}", file=sys.stderr)
+
+
+def main() -> None:
+    """Run the reconnect storm for each jitter mode and emit JSON."""
+    parser = argparse.ArgumentParser(description="Reconnect storm simulation")
+    parser.add_argument("--clients", type=int, default=200, help="Clients in the fleet")
+    parser.add_argument("--jitter", nargs="+", choices=JITTER_MODES, default=list(JITTER_MODES),
+                        help="Jitter modes to compare")
+    parser.add_argument("--base", type=float, default=0.1, help="First backoff ceiling in seconds")
+    parser.add_argument("--cap", type=float, default=5.0, help="Largest backoff ceiling in seconds")
+    parser.add_argument("--downtime", type=float, default=1.0,
+                        help="Seconds the broker stays down")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="Longest wait for the fleet to reconnect")
+    parser.add_argument("--seed", type=int, default=None, help="Seed the jitter for repeatable runs")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+    # The broker always runs in a child process here, so it can be restarted
+    args.embedded_broker = True
+
+    results = [run_storm(args.clients, Backoff(args.base, args.cap, jitter, random.Random(args.seed)),
+                         args.downtime, args.timeout)
+               for jitter in args.jitter]
+
+    print_results(results)
+    write_json({"benchmark": "reconnect", "metadata": run_metadata(args),
+                "config": {"clients": args.clients, "jitter": args.jitter, "base": args.base,
+                           "cap": args.cap, "downtime": args.downtime},
+                "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
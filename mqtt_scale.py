@@ -0,0 +1,201 @@
+"""
+Subscriber fleet scale harness.
+
+Connects N wildcard subscribers like task 5's (alternating Sensors/+/Temperature
+and Sensors/#) and reports connect time, memory per client and delivery
+throughput. The clients are driven either by a few shared selector loops
+(--mode selector, the default) or by one loop_start() thread each
+(--mode threads) for comparison. Note that loop_start() threads use select()
+and stop working once file descriptors exceed FD_SETSIZE (1024), i.e. at a
+few hundred clients per process.
+
+Usage:
+    python mqtt_scale.py --embedded-broker --subscribers 10000 --threads 2
+"""
+import argparse
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+import paho.mqtt.client as mqtt
+
+from mqtt_benchmark import add_broker_arguments, rss_bytes, run_metadata, start_broker, write_json
+from mqtt_bulk_publisher import BulkPublisher
+from mqtt_clients import connect_client, create_client, track_connection
+from mqtt_selector_loop import SelectorLoopGroup
+from mqtt_waiters import CompletionTracker, record_wait
+
+# The two wildcard filters from task 5
+WILDCARD_FILTERS = ("Sensors/+/Temperature", "Sensors/#")
+
+
+class _Counter:
+    """Thread-safe counter that can be waited on until it reaches a target."""
+
+    def __init__(self) -> None:
+        self.value = 0
+        self._target = 0
+        self._condition = threading.Condition()
+
+    def increment(self, *args: Any) -> None:
+        """Add one; usable directly as a paho callback."""
+        with self._condition:
+            self.value += 1
+            if self.value >= self._target:
+                self._condition.notify_all()
+
+    def wait_for(self, target: int, timeout: float) -> bool:
+        with self._condition:
+            self._target = target
+            return self._condition.wait_for(lambda: self.value >= target, timeout)
+
+
+def run_scale_test(host: str,
+                   port: int,
+                   subscribers: int,
+                   mode: str = "selector",
+                   threads: int = 1,
+                   messages: int = 100,
+                   rooms: int = 10,
+                   qos: int = 0,
+                   timeout: float = 120.0) -> Dict[str, Any]:
+    """
+    Connect a fleet of wildcard subscribers and measure it.
+
+    Args:
+        host: Broker host
+        port: Broker port
+        subscribers: Number of subscriber clients
+        mode: "selector" for shared loops, "threads" for loop_start() per client
+        threads: Number of selector loop threads (selector mode)
+        messages: Messages to publish to Sensors/<room>/Temperature
+        rooms: Number of distinct rooms in the published topics
+        qos: Subscription and publish QoS
+        timeout: Upper bound for connecting and for delivery
+
+    Returns:
+        dict: Measurements for this run
+    """
+    subscribed = _Counter()
+    delivered = _Counter()
+    loops = SelectorLoopGroup(threads) if mode == "selector" else None
+    clients: List[mqtt.Client] = []
+
+    def on_connect(client: mqtt.Client, userdata: Any, flags: Dict[str, bool], rc: int) -> None:
+        if rc == 0:
+            client.subscribe(userdata, qos=qos)
+
+    rss_before = rss_bytes()
+    threads_before = threading.active_count()
+    if loops is not None:
+        loops.start()
+
+    start = time.perf_counter()
+    for i in range(subscribers):
+        client = create_client("scale-subscriber")
+        client.user_data_set(WILDCARD_FILTERS[i % len(WILDCARD_FILTERS)])
+        client.on_connect = on_connect
+        client.on_subscribe = subscribed.increment
+        client.on_message = delivered.increment
+        if loops is not None:
+            loops.attach(client)
+        client.connect(host=host, port=port, keepalive=60)
+        if loops is None:
+            client.loop_start()
+        clients.append(client)
+    connected = subscribed.wait_for(subscribers, timeout)
+    connect_seconds = time.perf_counter() - start
+    record_wait("scale", f"{subscribers} SUBACK(s)", start, connected)
+
+    rss_after = rss_bytes()
+    fleet_threads = threading.active_count() - threads_before
+
+    # Every published topic matches both filters, so each message fans out
+    # to every subscriber
+    publisher = create_client("scale-publisher")
+    publisher_tracker = CompletionTracker("scale-pub")
+    track_connection(publisher, publisher_tracker)
+    bulk = BulkPublisher(publisher, label="scale-pub")
+    if loops is not None:
+        # loop_start() uses select(), which cannot watch fds above FD_SETSIZE
+        # (1024) - a limit a large fleet passes easily
+        loops.attach(publisher)
+        publisher.connect(host=host, port=port)
+        publisher_tracker.wait_connack()
+    else:
+        connect_client(publisher, publisher_tracker, host, port)
+    expected = messages * subscribers
+    start = time.perf_counter()
+    bulk.publish_all(((f"Sensors/Room{i % rooms}/Temperature", b"21.5", qos)
+                      for i in range(messages)), timeout)
+    complete = delivered.wait_for(expected, timeout)
+    delivery_seconds = time.perf_counter() - start
+    record_wait("scale", f"{expected} deliveries", start, complete)
+
+    publisher.disconnect()
+    if loops is None:
+        publisher.loop_stop()
+    for client in clients:
+        client.disconnect()
+        if loops is None:
+            client.loop_stop()
+    if loops is not None:
+        time.sleep(0.1)  # Let the loops flush the DISCONNECT packets
+        loops.close()
+
+    return {
+        "mode": mode,
+        "loop_threads": threads if loops is not None else subscribers,
+        "subscribers": subscribers,
+        "subscribed": subscribed.value,
+        "connect_seconds": connect_seconds,
+        "connects_per_sec": subscribed.value / connect_seconds if connect_seconds else 0.0,
+        "fleet_threads": fleet_threads,
+        "rss_delta_bytes": rss_after - rss_before,
+        "bytes_per_client": (rss_after - rss_before) / subscribers if subscribers else 0.0,
+        "messages": messages,
+        "expected_deliveries": expected,
+        "deliveries": delivered.value,
+        "delivery_seconds": delivery_seconds,
+        "deliveries_per_sec": delivered.value / delivery_seconds if delivery_seconds else 0.0,
+    }
+
+
+def main() -> None:
+    """Run the scale harness and emit JSON."""
+    parser = argparse.ArgumentParser(description="Wildcard subscriber fleet scale test")
+    add_broker_arguments(parser)
+    parser.add_argument("--subscribers", type=int, default=1000, help="Number of subscribers")
+    parser.add_argument("--mode", choices=["selector", "threads"], default="selector",
+                        help="Shared selector loops or one loop_start() thread per client")
+    parser.add_argument("--threads", type=int, default=1, help="Selector loop threads")
+    parser.add_argument("--messages", type=int, default=100, help="Messages to publish")
+    parser.add_argument("--rooms", type=int, default=10, help="Distinct Sensors/<room> topics")
+    parser.add_argument("--qos", type=int, default=0, choices=[0, 1, 2], help="QoS level")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout in seconds")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    # A separate process keeps the broker's memory out of the per-client figure
+    broker = start_broker(args, separate_process=True)
+    try:
+        result = run_scale_test(args.host, args.port, args.subscribers, args.mode,
+                                args.threads, args.messages, args.rooms, args.qos,
+                                args.timeout)
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    print(f"{result['subscribed']}/{result['subscribers']} subscribers ready in "
+          f"{result['connect_seconds']:.2f}s using {result['fleet_threads']} extra thread(s)",
+          file=sys.stderr)
+    print(f"Memory: {result['bytes_per_client'] / 1024:.1f} KiB per client", file=sys.stderr)
+    print(f"Delivered {result['deliveries']}/{result['expected_deliveries']} messages at "
+          f"{result['deliveries_per_sec']:.0f} msgs/s", file=sys.stderr)
+    write_json({"benchmark": "scale", "metadata": run_metadata(args),
+                "results": [result]}, args.output)
+
+
+if __name__ == "__main__":
+    main()
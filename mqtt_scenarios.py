@@ -0,0 +1,183 @@
+"""
+Dependency-aware scenario runner.
+
+Each scenario is a callable with a list of scenarios it depends on. Scenarios
+whose dependencies have finished are started on a thread pool, so
+independent ones run concurrently and the wall-clock time approaches that of
+the longest dependency chain. RunScope gives a run its own topic and client
+ID prefix, so concurrent scenarios (or concurrent runs against one broker)
+cannot see each other's messages or take over each other's sessions.
+
+Usage:
+    runner = ScenarioRunner(jobs=3)
+    runner.add("connect", connect)
+    runner.add("publish", lambda: publish(runner.result("connect")), depends=["connect"])
+    runner.run()
+    print_scenario_report(runner.results)
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from uuid import uuid4
+
+import mqtt_output as out
+
+
+class RunScope:
+    """Prefixes topics and client IDs with a per-run namespace."""
+
+    def __init__(self, prefix: str = "") -> None:
+        """
+        Args:
+            prefix: Namespace for this run; "" leaves names unchanged
+        """
+        self.prefix = prefix
+
+    @classmethod
+    def unique(cls, label: str = "run") -> "RunScope":
+        """A scope with a random prefix such as run-1a2b3c4d."""
+        return cls(f"{label}-{uuid4().hex[:8]}")
+
+    def scenario(self, name: str) -> "RunScope":
+        """
+        Sub-scope for one scenario, so scenarios of the same run running
+        concurrently are kept apart too. Unprefixed scopes are returned as is.
+        """
+        return RunScope(f"{self.prefix}/{name}") if self.prefix else self
+
+    def topic(self, topic: str) -> str:
+        """Topic name or filter inside this run's namespace."""
+        return f"{self.prefix}/{topic}" if self.prefix else topic
+
+    def client_id(self, client_id: str) -> str:
+        """Client ID inside this run's namespace."""
+        return f"{self.prefix}-{client_id}" if self.prefix else client_id
+
+
+class ScenarioResult(NamedTuple):
+    name: str
+    started: float          # Seconds after the run started
+    elapsed: float
+    completed: bool
+    error: Optional[str]
+
+
+class _Scenario(NamedTuple):
+    name: str
+    func: Callable[[], Any]
+    depends: Tuple[str, ...]
+
+
+class ScenarioRunner:
+    """Runs scenarios on a thread pool in dependency order."""
+
+    def __init__(self, jobs: int = 1) -> None:
+        """
+        Args:
+            jobs: Maximum number of scenarios running at once
+        """
+        if jobs < 1:
+            raise ValueError("jobs must be at least 1")
+        self.jobs = jobs
+        self.results: List[ScenarioResult] = []
+        self._scenarios: Dict[str, _Scenario] = {}
+        self._values: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, func: Callable[[], Any], depends: Iterable[str] = ()) -> None:
+        """
+        Register a scenario.
+
+        Args:
+            name: Unique scenario name
+            func: Called without arguments; its return value is kept for result()
+            depends: Scenarios that must complete successfully first
+        """
+        if name in self._scenarios:
+            raise ValueError(f"Duplicate scenario: {name!r}")
+        depends = tuple(depends)
+        for dependency in depends:
+            if dependency not in self._scenarios:
+                # Requiring dependencies to be added first also rules out cycles
+                raise ValueError(f"Scenario {name!r} depends on unknown {dependency!r}")
+        self._scenarios[name] = _Scenario(name, func, depends)
+
+    def result(self, name: str) -> Any:
+        """Return value of a finished scenario."""
+        with self._lock:
+            return self._values[name]
+
+    def run(self) -> bool:
+        """
+        Run every scenario; a failed scenario causes its dependents to be skipped.
+
+        Returns:
+            bool: True if every scenario completed
+        """
+        run_start = time.perf_counter()
+        pending = dict(self._scenarios)
+        finished: Dict[str, bool] = {}
+        running: Dict[Future, str] = {}
+
+        def execute(scenario: _Scenario) -> Any:
+            start = time.perf_counter()
+            try:
+                value = scenario.func()
+            except Exception as e:
+                self._record(scenario.name, run_start, start, False, f"{type(e).__name__}: {e}")
+                raise
+            with self._lock:
+                self._values[scenario.name] = value
+            self._record(scenario.name, run_start, start, True, None)
+            return value
+
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="scenario") as pool:
+            while pending or running:
+                # Start ready scenarios in the order they were added, only as
+                # many as there are free workers, so jobs=1 runs them in order
+                for name, scenario in list(pending.items()):
+                    if any(finished.get(dependency) is False for dependency in scenario.depends):
+                        del pending[name]
+                        finished[name] = False
+                        now = time.perf_counter()
+                        self._record(name, run_start, now, False, "skipped: dependency failed")
+                    elif (len(running) < self.jobs
+                          and all(finished.get(dependency) for dependency in scenario.depends)):
+                        del pending[name]
+                        running[pool.submit(execute, scenario)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished[running.pop(future)] = future.exception() is None
+        return all(finished.values())
+
+    def _record(self, name: str, run_start: float, start: float,
+                completed: bool, error: Optional[str]) -> None:
+        result = ScenarioResult(name, start - run_start, time.perf_counter() - start,
+                                completed, error)
+        with self._lock:
+            self.results.append(result)
+        if error is not None:
+            out.error(f"[{name}] {error}")
+
+
+def print_scenario_report(results: List[ScenarioResult]) -> None:
+    """Print when each scenario started and how long it ran."""
+    if not results:
+        return
+    out.info("\n--- Scenario Timings ---")
+    out.info(f"{'Scenario':<13} {'Start (ms)':>10} {'Elapsed (ms)':>12}  Status")
+    for result in sorted(results, key=lambda result: result.started):
+        if result.completed:
+            status = "ok"
+        elif result.error and result.error.startswith("skipped"):
+            status = "skipped"
+        else:
+            status = "FAILED"
+        out.info(f"{result.name:<13} {result.started * 1000:>10.1f} "
+                 f"{result.elapsed * 1000:>12.1f}  {status}")
+    wall_clock = max(result.started + result.elapsed for result in results)
+    total = sum(result.elapsed for result in results)
+    out.info(f"Wall clock: {wall_clock:.3f}s (scenarios ran for {total:.3f}s in total)")
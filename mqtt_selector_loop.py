@@ -0,0 +1,234 @@
+"""
+Shared network loop for many paho clients.
+
+loop_start() gives every mqtt.Client its own network thread (plus a socket
+pair to wake it). SelectorLoop instead drives any number of clients from one
+thread: it registers each client's socket with a selector through paho's
+on_socket_* hooks, calls loop_read()/loop_write() when the socket is ready
+and loop_misc() periodically for keepalive. SelectorLoopGroup spreads clients
+over a small pool of such loops.
+
+Usage:
+    loop = SelectorLoop()
+    loop.start()
+    loop.attach(client)          # instead of client.loop_start()
+    client.connect(host, port)
+    ...
+    loop.stop()
+"""
+import itertools
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional, Set
+
+import paho.mqtt.client as mqtt
+
+import mqtt_output as out
+
+# How often loop_misc() runs for every client (keepalive and timeouts)
+MISC_INTERVAL = 1.0
+
+
+class SelectorLoop:
+    """Runs the network I/O of many clients on a single thread."""
+
+    def __init__(self, name: str = "mqtt-selector-loop",
+                 misc_interval: float = MISC_INTERVAL) -> None:
+        """
+        Args:
+            name: Name of the loop thread
+            misc_interval: Seconds between loop_misc() passes
+        """
+        self.name = name
+        self.misc_interval = misc_interval
+        self._selector = selectors.DefaultSelector()
+        self._clients: Set[mqtt.Client] = set()
+        self._ops: Deque[Callable[[], None]] = deque()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_id: Optional[int] = None
+        self._running = False
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    # --- Lifecycle ---
+
+    def start(self) -> None:
+        """Start the loop thread."""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the loop thread; attached clients are left as they are."""
+        if self._thread is None:
+            return
+        self._running = False
+        self._wake()
+        self._thread.join()
+        self._thread = None
+
+    def close(self) -> None:
+        """Stop the loop and release its selector and wake-up sockets."""
+        self.stop()
+        self._selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    # --- Client registration ---
+
+    def attach(self, client: mqtt.Client) -> None:
+        """
+        Let this loop drive `client`'s network I/O.
+
+        Must be called before client.connect(), and instead of loop_start().
+        """
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_register_write
+        client.on_socket_unregister_write = self._on_unregister_write
+        self._call(lambda: self._clients.add(client))
+
+    def detach(self, client: mqtt.Client) -> None:
+        """Stop driving `client`; its socket (if any) is unregistered."""
+        sock = client.socket()
+
+        def op() -> None:
+            self._clients.discard(client)
+            if sock is not None:
+                self._unregister(sock)
+        self._call(op)
+        client.on_socket_open = None
+        client.on_socket_close = None
+        client.on_socket_register_write = None
+        client.on_socket_unregister_write = None
+
+    # --- paho socket hooks (may run on any thread) ---
+
+    def _on_socket_open(self, client: mqtt.Client, userdata: Any, sock: socket.socket) -> None:
+        self._call(lambda: self._register(sock, selectors.EVENT_READ, client))
+
+    def _on_socket_close(self, client: mqtt.Client, userdata: Any, sock: socket.socket) -> None:
+        self._call(lambda: self._unregister(sock))
+
+    def _on_register_write(self, client: mqtt.Client, userdata: Any, sock: socket.socket) -> None:
+        self._call(lambda: self._modify(
+            sock, selectors.EVENT_READ | selectors.EVENT_WRITE, client))
+
+    def _on_unregister_write(self, client: mqtt.Client, userdata: Any, sock: socket.socket) -> None:
+        self._call(lambda: self._modify(sock, selectors.EVENT_READ, client))
+
+    # --- Selector operations (loop thread only) ---
+
+    def _call(self, op: Callable[[], None]) -> None:
+        """Run `op` on the loop thread: now if we are on it, else queued."""
+        if threading.get_ident() == self._thread_id:
+            op()
+        else:
+            self._ops.append(op)
+            self._wake()
+
+    def _wake(self) -> None:
+        try:
+            self._wake_w.send(b"\x00")
+        except (BlockingIOError, OSError):
+            pass  # Already signalled, or shutting down
+
+    def _register(self, sock: socket.socket, events: int, client: mqtt.Client) -> None:
+        # A stale entry can hold the same fd number if a socket was closed
+        # before its unregister op ran
+        stale = self._selector.get_map().get(sock.fileno())
+        if stale is not None:
+            self._selector.unregister(stale.fileobj)
+        self._selector.register(sock, events, client)
+
+    def _unregister(self, sock: socket.socket) -> None:
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def _modify(self, sock: socket.socket, events: int, client: mqtt.Client) -> None:
+        try:
+            self._selector.modify(sock, events, client)
+        except (KeyError, ValueError):
+            pass  # Socket already closed
+
+    def _run(self) -> None:
+        self._thread_id = threading.get_ident()
+        next_misc = time.monotonic() + self.misc_interval
+        ops = self._ops
+        while self._running:
+            while ops:
+                ops.popleft()()
+            timeout = max(next_misc - time.monotonic(), 0)
+            for key, mask in self._selector.select(timeout):
+                client = key.data
+                if client is None:
+                    try:
+                        self._wake_r.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                try:
+                    if mask & selectors.EVENT_READ:
+                        client.loop_read()
+                    if mask & selectors.EVENT_WRITE and client.want_write():
+                        client.loop_write()
+                except Exception as e:
+                    # A failing callback must not stop I/O for every other client
+                    out.error("Error in network loop for {}: {}", client._client_id.decode(), e)
+            if time.monotonic() >= next_misc:
+                for client in list(self._clients):
+                    client.loop_misc()
+                next_misc = time.monotonic() + self.misc_interval
+        self._thread_id = None
+
+
+class SelectorLoopGroup:
+    """A small pool of SelectorLoops; clients are assigned round robin."""
+
+    def __init__(self, threads: int = 1, misc_interval: float = MISC_INTERVAL) -> None:
+        """
+        Args:
+            threads: Number of loop threads
+            misc_interval: Seconds between loop_misc() passes in each loop
+        """
+        self.loops: List[SelectorLoop] = [
+            SelectorLoop(f"mqtt-selector-loop-{i}", misc_interval) for i in range(threads)
+        ]
+        self._next = itertools.cycle(self.loops)
+
+    def start(self) -> None:
+        for loop in self.loops:
+            loop.start()
+
+    def stop(self) -> None:
+        for loop in self.loops:
+            loop.stop()
+
+    def close(self) -> None:
+        for loop in self.loops:
+            loop.close()
+
+    def attach(self, client: mqtt.Client) -> SelectorLoop:
+        """Attach `client` to the next loop and return that loop."""
+        loop = next(self._next)
+        loop.attach(client)
+        return loop
+
+    def __enter__(self) -> "SelectorLoopGroup":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
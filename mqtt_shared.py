@@ -0,0 +1,249 @@
+"""
+Consumer groups on MQTT 5 shared subscriptions.
+
+One subscriber on Sensor/Temp (task 6-8) has to process every reading on a
+single network thread. A ConsumerGroup connects N task 3 style subscribers
+that all subscribe to $share/<group>/<filter>, so the broker hands each
+message to just one of them and the members split the load. The group keeps
+per-member counts and rates and reports how evenly the broker spread the
+messages (Jain's fairness index: 1.0 is perfectly even, 1/N means one
+member got everything).
+
+The benchmark publishes a fixed number of messages to groups of increasing
+size and reports the aggregate consume rate. --work-ms simulates per-message
+processing that blocks (e.g. a database write), which is where extra
+members pay off; pure in-process Python handlers share one GIL.
+
+Usage:
+    python mqtt_shared.py --embedded-broker --members 1 2 4 8 --messages 20000 --work-ms 0.5
+"""
+import argparse
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import paho.mqtt.client as mqtt
+
+from mqtt_benchmark import (PAYLOAD_HEADER, add_broker_arguments, make_payload, run_metadata,
+                            start_broker, write_json)
+from mqtt_bulk_publisher import BulkPublisher
+from mqtt_clients import connect_client, create_client, disconnect_client, track_connection
+from mqtt_packets import SHARE_PREFIX
+from mqtt_waiters import DEFAULT_TIMEOUT, CompletionTracker, scaled_timeout
+
+
+def fairness_index(counts: List[int]) -> float:
+    """Jain's fairness index of per-member message counts."""
+    total = sum(counts)
+    squares = sum(count * count for count in counts)
+    return total * total / (len(counts) * squares) if squares else 0.0
+
+
+class MemberStats:
+    """Messages one group member received."""
+    __slots__ = ("client_id", "received", "first_at", "last_at")
+
+    def __init__(self, client_id: str) -> None:
+        self.client_id = client_id
+        self.received = 0
+        self.first_at = 0.0
+        self.last_at = 0.0
+
+    @property
+    def rate(self) -> float:
+        """Messages per second between this member's first and last message."""
+        elapsed = self.last_at - self.first_at
+        return self.received / elapsed if elapsed > 0 else 0.0
+
+
+class ConsumerGroup:
+    """N subscribers sharing one subscription through $share/<group>/<filter>."""
+
+    def __init__(self,
+                 group: str,
+                 topic_filter: str,
+                 members: int,
+                 qos: int = 1,
+                 handler: Optional[Callable[..., None]] = None) -> None:
+        """
+        Args:
+            group: Share name; groups with different names each get every message
+            topic_filter: Filter the group consumes
+            members: Number of subscriber clients
+            qos: Subscription QoS
+            handler: on_message handler run by whichever member gets a message
+        """
+        self.group = group
+        self.topic_filter = topic_filter
+        self.share = f"{SHARE_PREFIX}{group}/{topic_filter}"
+        self.qos = qos
+        self.handler = handler
+        self.tracker = CompletionTracker(f"group-{group}")
+        self.stats: List[MemberStats] = []
+        self.clients: List[mqtt.Client] = []
+        self._size = members
+
+    def _on_message(self, stats: MemberStats) -> Callable[..., None]:
+        def on_message(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+            now = time.perf_counter()
+            if not stats.received:
+                stats.first_at = now
+            stats.received += 1
+            stats.last_at = now
+            if self.handler is not None:
+                self.handler(client, userdata, msg)
+            self.tracker.message_received()
+
+        return on_message
+
+    def start(self, host: str, port: int, timeout: float = DEFAULT_TIMEOUT) -> None:
+        """Connect and subscribe every member (task 3, with MQTT 5 clients)."""
+        for index in range(self._size):
+            client = create_client(f"{self.group}-member", protocol=mqtt.MQTTv5)
+            tracker = CompletionTracker(f"group-{self.group}-{index}")
+            track_connection(client, tracker, [(self.share, self.qos)])
+            stats = MemberStats(client._client_id.decode())
+            client.on_message = self._on_message(stats)
+            self.clients.append(client)
+            self.stats.append(stats)
+            if not connect_client(client, tracker, host, port, wait_suback=True, timeout=timeout):
+                raise RuntimeError(f"Group member {index} could not connect and subscribe")
+
+    def stop(self) -> None:
+        for client in self.clients:
+            disconnect_client(client)
+
+    def wait(self, count: int, timeout: float) -> bool:
+        """Wait until the members received `count` messages between them."""
+        return self.tracker.wait_messages(count, timeout)
+
+    def report(self) -> Dict[str, Any]:
+        """Per-member counts and rates, and how evenly the load was spread."""
+        counts = [stats.received for stats in self.stats]
+        total = sum(counts)
+        return {
+            "members": [{"client_id": stats.client_id, "received": stats.received,
+                         "share": stats.received / total if total else 0.0,
+                         "msgs_per_sec": stats.rate} for stats in self.stats],
+            "received": total,
+            "fairness": fairness_index(counts),
+            "min_max_ratio": min(counts) / max(counts) if counts and max(counts) else 0.0,
+        }
+
+
+def run_group_benchmark(host: str,
+                        port: int,
+                        members: int,
+                        messages: int,
+                        qos: int,
+                        payload_size: int,
+                        work_seconds: float,
+                        topic: str = "Sensor/Temp") -> Dict[str, Any]:
+    """
+    Publish `messages` messages to a group of `members` and time their consumption.
+
+    Args:
+        host: Broker host
+        port: Broker port
+        members: Group size
+        messages: Messages to publish
+        qos: Publish and subscription QoS
+        payload_size: Payload size in bytes
+        work_seconds: Blocking per-message work in the handler
+        topic: Topic to publish on
+
+    Returns:
+        dict: One result row
+    """
+    timeout = scaled_timeout(messages) + messages * work_seconds / members
+    seen = bytearray(messages)
+    counters = {"duplicates": 0}
+    lock = threading.Lock()
+
+    def handler(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        sequence, _ = PAYLOAD_HEADER.unpack_from(msg.payload)
+        with lock:
+            if seen[sequence]:
+                counters["duplicates"] += 1
+            seen[sequence] = 1
+        if work_seconds:
+            time.sleep(work_seconds)
+
+    group = ConsumerGroup(f"bench{members}", topic, members, qos, handler)
+    group.start(host, port)
+    publisher = create_client("group-publisher")
+    publisher_tracker = CompletionTracker("group-publisher")
+    track_connection(publisher, publisher_tracker)
+    bulk = BulkPublisher(publisher)
+    try:
+        if not connect_client(publisher, publisher_tracker, host, port):
+            raise RuntimeError("Publisher could not connect")
+        begin = time.perf_counter()
+        bulk.publish_all(((topic, make_payload(i, payload_size), qos) for i in range(messages)),
+                         timeout)
+        complete = group.wait(messages, timeout)
+        elapsed = time.perf_counter() - begin
+    finally:
+        disconnect_client(publisher)
+        group.stop()
+
+    report = group.report()
+    return dict(report, **{
+        "group_size": members,
+        "messages": messages,
+        "qos": qos,
+        "work_ms": work_seconds * 1000,
+        "complete": complete,
+        "missing": messages - seen.count(1),
+        "duplicates": counters["duplicates"],
+        "elapsed_seconds": elapsed,
+        "msgs_per_sec": report["received"] / elapsed if elapsed else 0.0,
+    })
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    """Print the aggregate rate per group size and the spread over members."""
+    print(f"{'Members':>7} {'Received':>9} {'Missing':>8} {'Dup':>5} {'msgs/s':>9} "
+          f"{'Speedup':>8} {'Fairness':>9} {'Min/Max':>8}", file=sys.stderr)
+    baseline = results[0]["msgs_per_sec"] if results else 0.0
+    for row in results:
+        speedup = row["msgs_per_sec"] / baseline if baseline else 0.0
+        print(f"{row['group_size']:>7} {row['received']:>9} {row['missing']:>8} "
+              f"{row['duplicates']:>5} {row['msgs_per_sec']:>9.0f} {speedup:>7.2f}x "
+              f"{row['fairness']:>9.3f} {row['min_max_ratio']:>8.2f}", file=sys.stderr)
+
+
+def main() -> None:
+    """Run the consumer group scaling benchmark and emit JSON."""
+    parser = argparse.ArgumentParser(description="Shared subscription consumer group benchmark")
+    add_broker_arguments(parser)
+    parser.add_argument("--members", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Group sizes to compare")
+    parser.add_argument("--messages", type=int, default=10_000, help="Messages per run")
+    parser.add_argument("--qos", type=int, default=1, choices=[0, 1, 2], help="QoS level")
+    parser.add_argument("--payload-size", type=int, default=64, help="Payload size in bytes")
+    parser.add_argument("--work-ms", type=float, default=0.0,
+                        help="Blocking work per message in the handler, in milliseconds")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    # Keep the broker's routing off the members' GIL
+    broker = start_broker(args, separate_process=True)
+    try:
+        results = [run_group_benchmark(args.host, args.port, members, args.messages, args.qos,
+                                       args.payload_size, args.work_ms / 1000)
+                   for members in args.members]
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    print_results(results)
+    write_json({"benchmark": "shared", "metadata": run_metadata(args),
+                "config": {"members": args.members, "messages": args.messages, "qos": args.qos,
+                           "payload_size": args.payload_size, "work_ms": args.work_ms},
+                "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Bounded, thread-safe store for received messages.
+
+Replaces a dict of ever-growing lists of decoded strings. Each MessageRing
+keeps a fixed number of records in array-backed columns (topic id, QoS,
+receive timestamp) plus a payload slot list, so a long soak run stays at
+constant memory. Payloads are stored as the bytes paho hands over and only
+decoded when someone reads them. Topic strings are interned once per store
+and reference counted by the records holding them, so a topic is forgotten
+once its last record is overwritten or cleared.
+"""
+import threading
+import time
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+# Eviction policies when a ring is full
+DROP_OLDEST = "drop-oldest"   # Overwrite the oldest record (keep the latest N)
+DROP_NEWEST = "drop-newest"   # Reject incoming records (keep the first N)
+
+DEFAULT_CAPACITY = 10_000
+
+# Called with (topic, payload, qos, timestamp) for every offered message
+MessageSink = Callable[[str, bytes, int, float], None]
+
+
+class ReceivedMessage:
+    """One stored message, materialised on read."""
+    __slots__ = ("topic", "payload", "qos", "timestamp")
+
+    def __init__(self, topic: str, payload: bytes, qos: int, timestamp: float) -> None:
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.timestamp = timestamp
+
+    def text(self) -> str:
+        """Payload decoded as UTF-8 (replacing invalid bytes)."""
+        return self.payload.decode("utf-8", "replace")
+
+    def __repr__(self) -> str:
+        return f"ReceivedMessage({self.topic!r}, {self.payload!r}, qos={self.qos})"
+
+
+class TopicTable:
+    """
+    Interns topic strings as small integer ids, counting references.
+
+    Every stored record holds one reference to its topic's id; when the
+    last one is released the id is freed and reused for the next new
+    topic, so the table only holds topics that are still stored somewhere.
+    """
+
+    def __init__(self) -> None:
+        self._ids: Dict[str, int] = {}
+        self._topics: List[Optional[str]] = []
+        self._refs: List[int] = []
+        self._free: List[int] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of topics currently referenced."""
+        return len(self._ids)
+
+    def acquire(self, topic: str) -> int:
+        """Id of `topic`, interning it if needed; add one reference."""
+        with self._lock:
+            topic_id = self._ids.get(topic)
+            if topic_id is None:
+                if self._free:
+                    topic_id = self._free.pop()
+                    self._topics[topic_id] = topic
+                else:
+                    topic_id = len(self._topics)
+                    self._topics.append(topic)
+                    self._refs.append(0)
+                self._ids[topic] = topic_id
+            self._refs[topic_id] += 1
+        return topic_id
+
+    def release(self, topic_id: int) -> None:
+        """Drop one reference; the topic is forgotten with its last one."""
+        with self._lock:
+            self._refs[topic_id] -= 1
+            if not self._refs[topic_id]:
+                del self._ids[self._topics[topic_id]]
+                self._topics[topic_id] = None
+                self._free.append(topic_id)
+
+    def topic(self, topic_id: int) -> str:
+        return self._topics[topic_id]
+
+
+class MessageRing:
+    """
+    Fixed-capacity ring buffer of received messages.
+
+    append() is called from paho network threads, reads from the main
+    thread; a single short critical section keeps the columns consistent.
+    All counters are O(1).
+    """
+
+    def __init__(self,
+                 capacity: int = DEFAULT_CAPACITY,
+                 eviction: str = DROP_OLDEST,
+                 topics: Optional[TopicTable] = None) -> None:
+        """
+        Args:
+            capacity: Maximum number of records kept
+            eviction: DROP_OLDEST or DROP_NEWEST
+            topics: Topic table to share with other rings
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        if eviction not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown eviction policy: {eviction!r}")
+        self.capacity = capacity
+        self.eviction = eviction
+        self.topics = topics if topics is not None else TopicTable()
+        self._topic_ids = array("I", bytes(4 * capacity))
+        self._qos = array("B", bytes(capacity))
+        self._timestamps = array("d", bytes(8 * capacity))
+        self._payloads: List[Optional[bytes]] = [None] * capacity
+        self._start = 0          # Index of the oldest record
+        self._count = 0          # Records currently stored
+        self.total = 0           # Records ever offered
+        self.evicted = 0         # Old records overwritten (DROP_OLDEST)
+        self.dropped = 0         # New records rejected (DROP_NEWEST)
+        self.sink: Optional[MessageSink] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of records currently stored."""
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+    def append(self, topic: str, payload: bytes, qos: int = 0,
+               timestamp: Optional[float] = None) -> bool:
+        """
+        Store one message.
+
+        Returns:
+            bool: False if the record was rejected because the ring is full
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        # Outside the lock: the sink sees every message, evicted or not
+        if self.sink is not None:
+            self.sink(topic, payload, qos, timestamp)
+        with self._lock:
+            self.total += 1
+            if self._count == self.capacity:
+                if self.eviction == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                index = self._start
+                self._start = (self._start + 1) % self.capacity
+                self.evicted += 1
+                self.topics.release(self._topic_ids[index])
+            else:
+                index = (self._start + self._count) % self.capacity
+                self._count += 1
+            self._topic_ids[index] = self.topics.acquire(topic)
+            self._qos[index] = qos
+            self._timestamps[index] = timestamp
+            self._payloads[index] = payload
+        return True
+
+    def __iter__(self) -> Iterator[ReceivedMessage]:
+        """Iterate over a snapshot of the stored records, oldest first."""
+        return iter(self.snapshot())
+
+    def snapshot(self) -> List[ReceivedMessage]:
+        """Copy the stored records, oldest first."""
+        with self._lock:
+            indices = [(self._start + i) % self.capacity for i in range(self._count)]
+            # Topics are resolved under the lock, before an overwrite can free their id
+            rows = [(self.topics.topic(self._topic_ids[i]), self._payloads[i], self._qos[i],
+                     self._timestamps[i]) for i in indices]
+        return [ReceivedMessage(topic, payload, qos, timestamp)
+                for topic, payload, qos, timestamp in rows]
+
+    def clear(self) -> None:
+        """Drop all records and reset the counters."""
+        with self._lock:
+            for i in range(self._count):
+                self.topics.release(self._topic_ids[(self._start + i) % self.capacity])
+            self._payloads = [None] * self.capacity
+            self._start = self._count = 0
+            self.total = self.evicted = self.dropped = 0
+
+
+class ReceiveStore:
+    """A named set of MessageRings sharing one topic table."""
+
+    def __init__(self,
+                 names: Iterable[str] = (),
+                 capacity: int = DEFAULT_CAPACITY,
+                 eviction: str = DROP_OLDEST) -> None:
+        """
+        Args:
+            names: Rings to create up front
+            capacity: Capacity of every ring
+            eviction: Eviction policy of every ring
+        """
+        self.capacity = capacity
+        self.eviction = eviction
+        self.topics = TopicTable()
+        self._rings: Dict[str, MessageRing] = {}
+        self._sink: Optional[MessageSink] = None
+        self._lock = threading.Lock()
+        for name in names:
+            self.ring(name)
+
+    def ring(self, name: str) -> MessageRing:
+        """Return the ring called `name`, creating it if needed."""
+        ring = self._rings.get(name)
+        if ring is None:
+            with self._lock:
+                ring = self._rings.get(name)
+                if ring is None:
+                    ring = self._rings[name] = MessageRing(self.capacity, self.eviction,
+                                                           self.topics)
+                    ring.sink = self._sink
+        return ring
+
+    def set_sink(self, sink: Optional[MessageSink]) -> None:
+        """Also pass every message offered to any ring to `sink` (e.g. a journal)."""
+        with self._lock:
+            self._sink = sink
+            for ring in self._rings.values():
+                ring.sink = sink
+
+    __getitem__ = ring
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._rings
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._rings))
+
+    def counts(self) -> Dict[str, int]:
+        """Total messages offered to each ring."""
+        return {name: ring.total for name, ring in self._rings.items()}
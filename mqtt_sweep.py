@@ -0,0 +1,231 @@
+"""
+QoS / session / payload sweep.
+
+Tasks 6-8 each try one combination of subscription QoS, publish QoS and
+clean_session and describe the outcome in prose. This runs the same
+subscribe / disconnect / publish / reconnect scenario for every combination
+of subscription QoS, publish QoS, clean_session and payload size, and
+records what each one delivers and costs: messages delivered after the
+reconnect, publish and delivery rates, delivery latency after CONNACK and
+the bytes that crossed the wire. Wire bytes are read from the broker's
+counters, so they are only available with --embedded-broker.
+
+Usage:
+    python mqtt_sweep.py --embedded-broker --messages 1000 --format csv --output sweep.csv
+"""
+import argparse
+import csv
+import io
+import itertools
+import sys
+import time
+from array import array
+from typing import Any, Callable, Dict, List, Optional
+from uuid import uuid4
+
+import paho.mqtt.client as mqtt
+
+from mqtt_benchmark import (add_broker_arguments, latency_summary, make_payload, run_metadata,
+                            start_broker, write_json)
+from mqtt_bulk_publisher import BulkPublisher
+from mqtt_clients import (connect_client, create_client, disconnect_client, discard_session,
+                          track_connection)
+from mqtt_waiters import CompletionTracker, scaled_timeout
+
+# Columns of the CSV output, in order
+CSV_COLUMNS = (
+    "sub_qos", "pub_qos", "clean_session", "payload_size", "messages", "session_present",
+    "delivered", "publish_msgs_per_sec", "delivery_msgs_per_sec", "latency_p50_ms",
+    "latency_p99_ms", "wire_bytes", "wire_bytes_per_message",
+)
+
+
+def run_sweep_point(host: str,
+                    port: int,
+                    sub_qos: int,
+                    pub_qos: int,
+                    clean_session: bool,
+                    payload_size: int,
+                    messages: int,
+                    wire_bytes: Optional[Callable[[], int]] = None,
+                    topic: str = "Benchmark/Sweep",
+                    timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Run the task 6-8 scenario once for one combination.
+
+    Args:
+        host: Broker host
+        port: Broker port
+        sub_qos: Subscription QoS
+        pub_qos: Publish QoS
+        clean_session: Session type of the subscriber
+        payload_size: Payload size in bytes (at least the benchmark header)
+        messages: Messages published while the subscriber is offline
+        wire_bytes: Returns the broker's total bytes in + out, if available
+        topic: Topic to publish on
+        timeout: Upper bound for each phase (scaled to `messages` by default)
+
+    Returns:
+        dict: One result row
+    """
+    if timeout is None:
+        timeout = scaled_timeout(messages)
+    label = f"sweep-s{sub_qos}p{pub_qos}{'c' if clean_session else 'p'}"
+    client_id = f"sweep-subscriber-{uuid4().hex[:8]}"
+    tracker = CompletionTracker(label)
+    delivery_ns = array("q")
+    connack_ns = [0]
+    bytes_before = wire_bytes() if wire_bytes is not None else 0
+
+    def on_connect(client: mqtt.Client, userdata: Any, flags: Dict[str, bool], rc: int) -> None:
+        connack_ns[0] = time.perf_counter_ns()
+        tracker.connack_received(rc, flags)
+        # Like tasks 6-8: only subscribe if the broker has no session for us
+        if rc == 0 and not tracker.session_present:
+            client.subscribe(topic, qos=sub_qos)
+
+    def on_message(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        if tracker.is_fence(msg.payload):
+            return
+        delivery_ns.append(time.perf_counter_ns() - connack_ns[0])
+        tracker.message_received()
+
+    def new_subscriber() -> mqtt.Client:
+        client = create_client("sweep-subscriber", clean_session=clean_session,
+                               client_id=client_id)
+        client.on_connect = on_connect
+        client.on_subscribe = lambda *args: tracker.suback_received()
+        client.on_message = on_message
+        return client
+
+    subscriber = new_subscriber()
+    if not connect_client(subscriber, tracker, host, port, wait_suback=True):
+        raise RuntimeError("Subscriber could not connect and subscribe")
+    disconnect_client(subscriber)
+
+    publisher = create_client("sweep-publisher")
+    publisher_tracker = CompletionTracker(f"{label}-pub")
+    track_connection(publisher, publisher_tracker)
+    bulk = BulkPublisher(publisher, label=f"{label}-pub")
+    if not connect_client(publisher, publisher_tracker, host, port):
+        raise RuntimeError("Publisher could not connect")
+    try:
+        stats = bulk.publish_all(((topic, make_payload(i, payload_size), pub_qos)
+                                  for i in range(messages)), timeout)
+        if pub_qos == 0:
+            # QoS 0 completes once written; a PUBACK on another topic shows
+            # the broker has routed everything before it
+            publisher_tracker.wait_published([publisher.publish(f"{topic}/barrier", qos=1)],
+                                             timeout)
+
+        subscriber = new_subscriber()
+        tracker.reset_connection()
+        subscriber.connect(host=host, port=port)
+        subscriber.loop_start()
+        if tracker.wait_connack() and not tracker.session_present:
+            tracker.wait_suback()
+        session_present = tracker.session_present
+        # Whatever was queued arrives before the fence
+        tracker.drain(publisher, topic, qos=max(pub_qos, 1), timeout=timeout)
+        disconnect_client(subscriber)
+    finally:
+        disconnect_client(publisher)
+    if not clean_session:
+        discard_session(host, port, client_id)
+
+    delivered = len(delivery_ns)
+    drain_seconds = delivery_ns[-1] / 1e9 if delivered else 0.0
+    latency = latency_summary(delivery_ns)
+    total_bytes = wire_bytes() - bytes_before if wire_bytes is not None else None
+    return {
+        "sub_qos": sub_qos,
+        "pub_qos": pub_qos,
+        "clean_session": clean_session,
+        "payload_size": max(payload_size, len(make_payload(0, 0))),
+        "messages": messages,
+        "session_present": session_present,
+        "delivered": delivered,
+        "publish_msgs_per_sec": stats.messages_per_second,
+        "delivery_msgs_per_sec": delivered / drain_seconds if drain_seconds else 0.0,
+        "latency_p50_ms": latency["p50"],
+        "latency_p99_ms": latency["p99"],
+        "wire_bytes": total_bytes,
+        "wire_bytes_per_message": total_bytes / messages if total_bytes is not None else None,
+    }
+
+
+def to_csv(results: List[Dict[str, Any]]) -> str:
+    """Render result rows as CSV with CSV_COLUMNS as the header."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, lineterminator="\n")
+    writer.writeheader()
+    for row in results:
+        writer.writerow({column: row[column] for column in CSV_COLUMNS})
+    return buffer.getvalue()
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    """Print a human readable summary table to stderr."""
+    print(f"{'Sub':>3} {'Pub':>3} {'Clean':>5} {'Size':>6} {'Delivered':>9} "
+          f"{'pub/s':>8} {'dlv/s':>8} {'p50 ms':>7} {'B/msg':>7}", file=sys.stderr)
+    for row in results:
+        per_message = row["wire_bytes_per_message"]
+        print(f"{row['sub_qos']:>3} {row['pub_qos']:>3} {str(row['clean_session']):>5} "
+              f"{row['payload_size']:>6} {row['delivered']:>9} "
+              f"{row['publish_msgs_per_sec']:>8.0f} {row['delivery_msgs_per_sec']:>8.0f} "
+              f"{row['latency_p50_ms']:>7.2f} "
+              f"{'n/a' if per_message is None else f'{per_message:.0f}':>7}", file=sys.stderr)
+
+
+def main() -> None:
+    """Run the sweep and emit a CSV or JSON matrix."""
+    parser = argparse.ArgumentParser(description="QoS / clean_session / payload size sweep")
+    add_broker_arguments(parser)
+    parser.add_argument("--messages", type=int, default=1000,
+                        help="Messages published while the subscriber is offline")
+    parser.add_argument("--sub-qos", type=int, nargs="+", default=[0, 1, 2], choices=[0, 1, 2],
+                        help="Subscription QoS levels")
+    parser.add_argument("--pub-qos", type=int, nargs="+", default=[0, 1, 2], choices=[0, 1, 2],
+                        help="Publish QoS levels")
+    parser.add_argument("--payload-size", type=int, nargs="+", default=[64, 1024],
+                        help="Payload sizes in bytes")
+    parser.add_argument("--format", choices=["json", "csv"], default="json",
+                        help="Output format")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Timeout in seconds for each phase (default: scaled)")
+    parser.add_argument("--output", help="Write results to this file instead of stdout")
+    args = parser.parse_args()
+
+    # In-process, so the sweep can read the broker's byte counters
+    broker = start_broker(args)
+    wire_bytes = None
+    if broker is not None:
+        wire_bytes = lambda: broker.broker.bytes_in + broker.broker.bytes_out
+    try:
+        results = []
+        for sub_qos, pub_qos, clean_session, size in itertools.product(
+                args.sub_qos, args.pub_qos, (True, False), args.payload_size):
+            results.append(run_sweep_point(args.host, args.port, sub_qos, pub_qos,
+                                           clean_session, size, args.messages, wire_bytes,
+                                           timeout=args.timeout))
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    print_results(results)
+    if args.format == "csv":
+        text = to_csv(results)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text)
+        else:
+            sys.stdout.write(text)
+    else:
+        write_json({"benchmark": "sweep", "metadata": run_metadata(args),
+                    "config": {"messages": args.messages, "sub_qos": args.sub_qos,
+                               "pub_qos": args.pub_qos, "payload_size": args.payload_size},
+                    "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
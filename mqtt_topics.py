@@ -0,0 +1,273 @@
+"""
+Topic-filter trie for client-side wildcard matching.
+
+TopicTrie stores MQTT topic filters (with + and # wildcards) level by level,
+so matching a topic costs time proportional to the topic depth instead of
+the number of registered filters. TopicDispatcher builds on it to route
+incoming messages to per-filter handlers.
+
+Run this module to benchmark the trie against naive per-filter matching:
+    python mqtt_topics.py --filters 100000
+"""
+import argparse
+import random
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+import paho.mqtt.client as mqtt
+
+
+def validate_filter(topic_filter: str) -> None:
+    """Raise ValueError if `topic_filter` is not a valid MQTT topic filter."""
+    if not topic_filter:
+        raise ValueError("Topic filter must not be empty")
+    levels = topic_filter.split("/")
+    for index, level in enumerate(levels):
+        if "#" in level and (level != "#" or index != len(levels) - 1):
+            raise ValueError(f"'#' must be the last, whole level: {topic_filter!r}")
+        if "+" in level and level != "+":
+            raise ValueError(f"'+' must occupy a whole level: {topic_filter!r}")
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """
+    Match one filter against one topic by comparing level by level.
+
+    Topics starting with '$' are not matched by a leading wildcard.
+    """
+    if topic_filter == topic:
+        return True
+    if topic.startswith("$") and topic_filter[:1] in ("+", "#"):
+        return False
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for index, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[index]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class _Node:
+    __slots__ = ("children", "values")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_Node"] = {}
+        # Used as an insertion-ordered set
+        self.values: Dict[Hashable, None] = {}
+
+
+class TopicTrie:
+    """
+    Maps topic filters to values and finds all values matching a topic.
+
+    Each filter can hold several values (e.g. one per subscriber), and a
+    value can be registered under several filters.
+    """
+
+    def __init__(self) -> None:
+        self._root = _Node()
+        self._filters: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        """Number of distinct filters."""
+        return len(self._filters)
+
+    def __contains__(self, topic_filter: str) -> bool:
+        return topic_filter in self._filters
+
+    def add(self, topic_filter: str, value: Hashable) -> None:
+        """Register `value` under `topic_filter`."""
+        validate_filter(topic_filter)
+        node = self._root
+        for level in topic_filter.split("/"):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _Node()
+            node = child
+        if value not in node.values:
+            node.values[value] = None
+            self._filters[topic_filter] = self._filters.get(topic_filter, 0) + 1
+
+    def remove(self, topic_filter: str, value: Hashable) -> bool:
+        """
+        Unregister `value` from `topic_filter`, pruning empty branches.
+
+        Returns:
+            bool: False if the value was not registered under the filter
+        """
+        path = [self._root]
+        for level in topic_filter.split("/"):
+            node = path[-1].children.get(level)
+            if node is None:
+                return False
+            path.append(node)
+        if value not in path[-1].values:
+            return False
+        del path[-1].values[value]
+        remaining = self._filters[topic_filter] - 1
+        if remaining:
+            self._filters[topic_filter] = remaining
+        else:
+            del self._filters[topic_filter]
+        levels = topic_filter.split("/")
+        for depth in range(len(levels), 0, -1):
+            node = path[depth]
+            if node.values or node.children:
+                break
+            del path[depth - 1].children[levels[depth - 1]]
+        return True
+
+    def match(self, topic: str) -> List[Any]:
+        """
+        Return every value whose filter matches `topic`, without duplicates.
+
+        Topics starting with '$' are not matched by a leading wildcard.
+        """
+        found: Dict[Hashable, None] = {}
+        nodes = [self._root]
+        skip_wildcards = topic.startswith("$")
+        for level in topic.split("/"):
+            next_nodes = []
+            for node in nodes:
+                children = node.children
+                if not skip_wildcards:
+                    multi = children.get("#")
+                    if multi is not None:
+                        found.update(multi.values)
+                    single = children.get("+")
+                    if single is not None:
+                        next_nodes.append(single)
+                child = children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+            if not next_nodes:
+                return list(found)
+            nodes = next_nodes
+            skip_wildcards = False
+        for node in nodes:
+            found.update(node.values)
+            # "a/#" also matches the parent level "a"
+            multi = node.children.get("#")
+            if multi is not None:
+                found.update(multi.values)
+        return list(found)
+
+    def filters(self) -> List[str]:
+        """All registered filters."""
+        return list(self._filters)
+
+
+class TopicDispatcher:
+    """
+    Routes incoming messages to handlers registered per topic filter.
+
+    An instance is a valid paho on_message callback. Unlike paho's
+    message_callback_add(), lookup cost does not grow with the number of
+    registered filters.
+    """
+
+    def __init__(self, default: Optional[Callable[..., None]] = None) -> None:
+        """
+        Args:
+            default: Handler for messages that match no registered filter
+        """
+        self._trie = TopicTrie()
+        self.default = default
+
+    def add(self, topic_filter: str, handler: Callable[..., None]) -> None:
+        """Call `handler(client, userdata, msg)` for messages matching the filter."""
+        self._trie.add(topic_filter, handler)
+
+    def remove(self, topic_filter: str, handler: Callable[..., None]) -> bool:
+        return self._trie.remove(topic_filter, handler)
+
+    def __call__(self, client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        handlers = self._trie.match(msg.topic)
+        if not handlers and self.default is not None:
+            self.default(client, userdata, msg)
+        for handler in handlers:
+            handler(client, userdata, msg)
+
+
+def expected_recipients(trie: TopicTrie, topics: Iterable[str]) -> Dict[str, List[str]]:
+    """Map each recipient in `trie` to the topics it should receive, in order."""
+    expected: Dict[str, List[str]] = {}
+    for topic in topics:
+        for recipient in trie.match(topic):
+            expected.setdefault(recipient, []).append(topic)
+    return expected
+
+
+def _random_filters(count: int, rng: random.Random) -> List[str]:
+    """Sensor-style filters: mostly exact, some with + or # wildcards."""
+    filters = []
+    for i in range(count):
+        site, room, kind = f"Site{i % 100}", f"Room{i % 1000}", f"Metric{i % 50}"
+        roll = rng.random()
+        if roll < 0.10:
+            room = "+"
+        elif roll < 0.15:
+            filters.append(f"Sensors/{site}/{room}/#")
+            continue
+        filters.append(f"Sensors/{site}/{room}/{kind}")
+    return filters
+
+
+def run_benchmark(filter_count: int, topic_count: int, seed: int = 520) -> Dict[str, float]:
+    """Time trie matching against naive matching over the same filters."""
+    rng = random.Random(seed)
+    filters = _random_filters(filter_count, rng)
+    topics = [f"Sensors/Site{rng.randrange(100)}/Room{rng.randrange(1000)}/Metric{rng.randrange(50)}"
+              for _ in range(topic_count)]
+
+    start = time.perf_counter()
+    trie = TopicTrie()
+    for index, topic_filter in enumerate(filters):
+        trie.add(topic_filter, index)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    trie_results = [set(trie.match(topic)) for topic in topics]
+    trie_seconds = time.perf_counter() - start
+
+    # The naive matcher is far slower; time it on a subset
+    naive_topics = topics[:max(1, min(topic_count, 200))]
+    start = time.perf_counter()
+    naive_results = [{index for index, topic_filter in enumerate(filters)
+                      if topic_matches(topic_filter, topic)} for topic in naive_topics]
+    naive_seconds = time.perf_counter() - start
+
+    if naive_results != trie_results[:len(naive_results)]:
+        raise AssertionError("Trie and naive matching disagree")
+
+    trie_rate = topic_count / trie_seconds
+    naive_rate = len(naive_topics) / naive_seconds
+    return {
+        "filters": filter_count,
+        "build_seconds": build_seconds,
+        "trie_matches_per_sec": trie_rate,
+        "naive_matches_per_sec": naive_rate,
+        "speedup": trie_rate / naive_rate,
+    }
+
+
+def main() -> None:
+    """Benchmark the trie against naive per-filter matching."""
+    parser = argparse.ArgumentParser(description="Topic-filter trie benchmark")
+    parser.add_argument("--filters", type=int, default=100_000, help="Registered filters")
+    parser.add_argument("--topics", type=int, default=10_000, help="Topics to match")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.filters, args.topics)
+    print(f"Filters: {result['filters']} (trie built in {result['build_seconds']:.2f}s)")
+    print(f"Trie:  {result['trie_matches_per_sec']:>12.0f} topics/s")
+    print(f"Naive: {result['naive_matches_per_sec']:>12.0f} topics/s")
+    print(f"Speedup: {result['speedup']:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
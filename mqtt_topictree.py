@@ -0,0 +1,356 @@
+"""
+Synthetic topic-tree wildcard correctness harness.
+
+Task 5 checks its two wildcard subscribers against six hand-written topics.
+This harness streams a generated hierarchy instead: every leaf of a tree
+with `depth` levels below the root and `fanout` children per level, i.e.
+fanout ** depth topics (32 ** 4 is just over a million). Topic number i is
+computed from i's digits in base fanout, so the topic list never exists in
+memory; the generator yields one topic at a time straight into the
+publisher.
+
+One subscriber per filter (+ and # filters across the tree) counts what it
+receives. While the generator runs, each topic is matched against the
+filters with the TopicTrie from mqtt_topics, and the expected deliveries are
+recorded in one bitmap per filter (a bit per topic number, 128 KiB per
+filter at a million topics). Each payload carries its topic number, so the
+received deliveries go into a second bitmap per filter. Comparing the two
+gives exact missing, unexpected and duplicate deliveries. Progress lines
+report publish and delivery rates and the process RSS while the run goes on.
+
+Usage:
+    python mqtt_topictree.py --embedded-broker --depth 3 --fanout 20
+    python mqtt_topictree.py --embedded-broker --depth 4 --fanout 32 --qos 0 --progress 5
+"""
+import argparse
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import paho.mqtt.client as mqtt
+
+from mqtt_benchmark import (PAYLOAD_HEADER, add_broker_arguments, make_payload, rss_bytes,
+                            run_metadata, start_broker, write_json)
+from mqtt_bulk_publisher import BulkPublisher
+from mqtt_clients import connect_client, create_client, disconnect_client, track_connection
+from mqtt_scenarios import RunScope
+from mqtt_topics import TopicTrie, validate_filter
+from mqtt_waiters import CompletionTracker, scaled_timeout
+
+# Missing or unexpected topics listed per filter in the report
+EXAMPLES = 5
+
+
+class TopicTree:
+    """The leaves of a tree of `depth` levels with `fanout` children each, by number."""
+
+    def __init__(self, root: str, depth: int, fanout: int) -> None:
+        if depth < 1 or fanout < 1:
+            raise ValueError("depth and fanout must be at least 1")
+        self.root = root
+        self.depth = depth
+        self.fanout = fanout
+        self.size = fanout ** depth
+        self._names = [f"N{digit}" for digit in range(fanout)]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def topic(self, number: int) -> str:
+        """Topic number `number`: its base-fanout digits, most significant first."""
+        levels = [""] * self.depth
+        for position in range(self.depth - 1, -1, -1):
+            number, digit = divmod(number, self.fanout)
+            levels[position] = self._names[digit]
+        return f"{self.root}/{'/'.join(levels)}"
+
+    def topics(self) -> Iterator[str]:
+        """Every topic in number order, generated one at a time."""
+        for number in range(self.size):
+            yield self.topic(number)
+
+    def default_filters(self) -> List[str]:
+        """
+        Wildcard filters covering the tree in different ways.
+
+        All topics (#), one subtree (N1/#), one name at the last level under
+        + (+/.../+/N0), + with a fixed middle level, a filter matching
+        nothing, and '+' at every level (all topics again).
+        """
+        pluses = ["+"] * self.depth
+        filters = ["#", "N1/#", "/".join(pluses[:-1] + ["N0"]), "/".join(pluses)]
+        if self.depth >= 2:
+            filters.append("/".join(["+", f"N{min(2, self.fanout - 1)}"] + pluses[2:]))
+        filters.append("/".join(pluses + ["Nothing"]))
+        return [f"{self.root}/{topic_filter}" for topic_filter in filters]
+
+
+class FilterCheck:
+    """Expected and received topic numbers of one subscriber filter."""
+
+    def __init__(self, topic_filter: str, size: int) -> None:
+        self.topic_filter = topic_filter
+        self.expected = bytearray((size + 7) // 8)
+        self.received = bytearray((size + 7) // 8)
+        self.expected_count = 0
+        self.received_count = 0
+        self.duplicates = 0
+        self.misrouted = 0
+
+    def expect(self, number: int) -> None:
+        self.expected[number >> 3] |= 1 << (number & 7)
+        self.expected_count += 1
+
+    def receive(self, number: int) -> None:
+        """Record one delivery; called from the subscriber's network thread only."""
+        mask = 1 << (number & 7)
+        if self.received[number >> 3] & mask:
+            self.duplicates += 1
+            return
+        self.received[number >> 3] |= mask
+        self.received_count += 1
+
+    def compare(self, tree: TopicTree) -> Dict[str, Any]:
+        """Missing and unexpected topic numbers, with a few example topics each."""
+        expected = int.from_bytes(self.expected, "little")
+        received = int.from_bytes(self.received, "little")
+        missing = expected & ~received
+        unexpected = received & ~expected
+        return {
+            "filter": self.topic_filter,
+            "expected": self.expected_count,
+            "received": self.received_count,
+            "missing": missing.bit_count(),
+            "unexpected": unexpected.bit_count(),
+            "duplicates": self.duplicates,
+            "misrouted": self.misrouted,
+            "missing_examples": [tree.topic(number) for number in _first_bits(missing, EXAMPLES)],
+            "unexpected_examples": [tree.topic(number) for number in _first_bits(unexpected, EXAMPLES)],
+            "ok": (self.expected_count == self.received_count and not missing and not unexpected
+                   and not self.duplicates and not self.misrouted),
+        }
+
+
+def _first_bits(bits: int, limit: int) -> List[int]:
+    """Positions of the lowest `limit` set bits."""
+    positions = []
+    while bits and len(positions) < limit:
+        low = bits & -bits
+        positions.append(low.bit_length() - 1)
+        bits ^= low
+    return positions
+
+
+def expected_stream(tree: TopicTree,
+                    trie: TopicTrie,
+                    checks: Sequence[FilterCheck],
+                    qos: int) -> Iterator[Tuple[str, bytes, int]]:
+    """Yield (topic, payload, qos) for every topic, recording who should get it."""
+    for number, topic in enumerate(tree.topics()):
+        for index in trie.match(topic):
+            checks[index].expect(number)
+        yield topic, make_payload(number, PAYLOAD_HEADER.size), qos
+
+
+class _Progress(threading.Thread):
+    """Prints publish and delivery rates and RSS every `interval` seconds."""
+
+    def __init__(self, bulk: BulkPublisher, tracker: CompletionTracker, interval: float) -> None:
+        super().__init__(name="topictree-progress", daemon=True)
+        self.bulk = bulk
+        self.tracker = tracker
+        self.interval = interval
+        self.samples: List[Dict[str, float]] = []
+        self.peak_rss = rss_bytes()
+        self._done = threading.Event()
+        self._began = 0.0
+
+    def run(self) -> None:
+        self._began = time.perf_counter()
+        published = delivered = 0
+        last = self._began
+        while not self._done.wait(self.interval):
+            now = time.perf_counter()
+            sample = {
+                "elapsed_seconds": now - self._began,
+                "published": self.bulk.stats.published,
+                "delivered": self.tracker.received,
+                "publish_per_sec": (self.bulk.stats.published - published) / (now - last),
+                "deliver_per_sec": (self.tracker.received - delivered) / (now - last),
+                "rss_bytes": rss_bytes(),
+            }
+            published, delivered, last = sample["published"], sample["delivered"], now
+            self.peak_rss = max(self.peak_rss, sample["rss_bytes"])
+            self.samples.append(sample)
+            print(f"[{sample['elapsed_seconds']:7.1f}s] published {published:>9} "
+                  f"({sample['publish_per_sec']:>7.0f}/s)  delivered {delivered:>9} "
+                  f"({sample['deliver_per_sec']:>7.0f}/s)  RSS {sample['rss_bytes'] / 2**20:7.1f} MiB",
+                  file=sys.stderr)
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+        self.peak_rss = max(self.peak_rss, rss_bytes())
+
+
+def run_tree_check(host: str,
+                   port: int,
+                   tree: TopicTree,
+                   filters: Sequence[str],
+                   qos: int = 1,
+                   progress: float = 2.0,
+                   settle: float = 0.5,
+                   timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Publish every topic of `tree` and check each filter's deliveries.
+
+    Args:
+        host: Broker host
+        port: Broker port
+        tree: Topic hierarchy to publish, one message per topic
+        filters: Subscriber filters, one subscriber each
+        qos: Subscription and publish QoS
+        progress: Seconds between progress lines
+        settle: Extra wait after the expected deliveries, to catch unexpected ones
+        timeout: Upper bound for publishing and for delivery (scaled to the tree by default)
+
+    Returns:
+        dict: Rates, memory and the per-filter comparison
+    """
+    timeout = timeout or scaled_timeout(tree.size)
+    trie = TopicTrie()
+    for index, topic_filter in enumerate(filters):
+        validate_filter(topic_filter)
+        trie.add(topic_filter, index)
+    rss_start = rss_bytes()
+    checks = [FilterCheck(topic_filter, tree.size) for topic_filter in filters]
+    tracker = CompletionTracker("topictree")
+    subscribers: List[mqtt.Client] = []
+
+    def on_message(check: FilterCheck) -> Any:
+        def handler(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+            number, _ = PAYLOAD_HEADER.unpack_from(msg.payload)
+            if number >= tree.size or msg.topic != tree.topic(number):
+                check.misrouted += 1
+            else:
+                check.receive(number)
+            tracker.message_received()
+        return handler
+
+    publisher = create_client("topictree-publisher")
+    publisher_tracker = CompletionTracker("topictree-pub")
+    track_connection(publisher, publisher_tracker)
+    bulk = BulkPublisher(publisher, label="topictree-pub")
+    reporter = _Progress(bulk, tracker, progress)
+    try:
+        for check in checks:
+            subscriber = create_client("topictree-subscriber")
+            subscriber_tracker = CompletionTracker(f"topictree-{len(subscribers)}")
+            track_connection(subscriber, subscriber_tracker, [(check.topic_filter, qos)])
+            subscriber.on_message = on_message(check)
+            subscribers.append(subscriber)
+            if not connect_client(subscriber, subscriber_tracker, host, port, wait_suback=True):
+                raise RuntimeError(f"Subscriber for {check.topic_filter} could not connect")
+        if not connect_client(publisher, publisher_tracker, host, port):
+            raise RuntimeError("Publisher could not connect")
+
+        reporter.start()
+        begin = time.perf_counter()
+        stats = bulk.publish_all(expected_stream(tree, trie, checks, qos), timeout)
+        publish_seconds = time.perf_counter() - begin
+        # The stream is exhausted, so the expected counts are final
+        expected = sum(check.expected_count for check in checks)
+        complete = tracker.wait_messages(expected, timeout)
+        deliver_seconds = time.perf_counter() - begin
+        time.sleep(settle)
+    finally:
+        if reporter.is_alive():
+            reporter.stop()
+        disconnect_client(publisher)
+        for subscriber in subscribers:
+            disconnect_client(subscriber)
+
+    comparisons = [check.compare(tree) for check in checks]
+    return {
+        "topics": tree.size,
+        "depth": tree.depth,
+        "fanout": tree.fanout,
+        "qos": qos,
+        "published": stats.published,
+        "expected_deliveries": expected,
+        "deliveries": tracker.received,
+        "complete": complete,
+        "ok": complete and all(row["ok"] for row in comparisons),
+        "publish_seconds": publish_seconds,
+        "publish_per_sec": stats.published / publish_seconds if publish_seconds else 0.0,
+        "deliver_seconds": deliver_seconds,
+        "deliver_per_sec": tracker.received / deliver_seconds if deliver_seconds else 0.0,
+        "rss_start_bytes": rss_start,
+        "rss_peak_bytes": reporter.peak_rss,
+        "bitmap_bytes": sum(len(check.expected) + len(check.received) for check in checks),
+        "filters": comparisons,
+        "progress": reporter.samples,
+    }
+
+
+def print_results(result: Dict[str, Any]) -> None:
+    """Print the per-filter comparison and the overall rates."""
+    print(f"{'Filter':<40} {'Expected':>9} {'Received':>9} {'Missing':>8} {'Unexp':>6} "
+          f"{'Dup':>5}  Status", file=sys.stderr)
+    for row in result["filters"]:
+        print(f"{row['filter']:<40} {row['expected']:>9} {row['received']:>9} {row['missing']:>8} "
+              f"{row['unexpected']:>6} {row['duplicates']:>5}  {'PASS' if row['ok'] else 'FAIL'}",
+              file=sys.stderr)
+        for topic in row["missing_examples"]:
+            print(f"    missing: {topic}", file=sys.stderr)
+        for topic in row["unexpected_examples"]:
+            print(f"    unexpected: {topic}", file=sys.stderr)
+    print(f"{result['topics']} topics (depth {result['depth']}, fanout {result['fanout']}): "
+          f"published at {result['publish_per_sec']:.0f}/s, {result['deliveries']}/"
+          f"{result['expected_deliveries']} deliveries at {result['deliver_per_sec']:.0f}/s", file=sys.stderr)
+    print(f"RSS {result['rss_start_bytes'] / 2**20:.1f} MiB at start, "
+          f"{result['rss_peak_bytes'] / 2**20:.1f} MiB peak "
+          f"({result['bitmap_bytes'] / 2**10:.0f} KiB of bitmaps)", file=sys.stderr)
+
+
+def main() -> None:
+    """Stream a synthetic topic tree through the broker and check wildcard delivery."""
+    parser = argparse.ArgumentParser(description="Synthetic topic-tree wildcard correctness harness")
+    add_broker_arguments(parser)
+    parser.add_argument("--depth", type=int, default=3, help="Levels below the root")
+    parser.add_argument("--fanout", type=int, default=20, help="Children per level")
+    parser.add_argument("--filters", nargs="+",
+                        help="Subscriber filters below the root, e.g. '+/N1/#' "
+                             "(default: a set of + and # filters across the tree)")
+    parser.add_argument("--qos", type=int, default=1, choices=[0, 1, 2], help="QoS level")
+    parser.add_argument("--progress", type=float, default=2.0, help="Seconds between progress lines")
+    parser.add_argument("--settle", type=float, default=0.5,
+                        help="Seconds to keep listening for unexpected deliveries at the end")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    root = RunScope.unique().scenario("tree").topic("Sensors")
+    tree = TopicTree(root, args.depth, args.fanout)
+    filters = ([f"{root}/{topic_filter}" for topic_filter in args.filters] if args.filters
+               else tree.default_filters())
+    # A separate process keeps the broker's memory out of the RSS figures
+    broker = start_broker(args, separate_process=True)
+    try:
+        result = run_tree_check(args.host, args.port, tree, filters, args.qos, args.progress,
+                                args.settle)
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    print_results(result)
+    write_json({"benchmark": "topictree", "metadata": run_metadata(args),
+                "config": {"depth": args.depth, "fanout": args.fanout, "filters": filters,
+                           "qos": args.qos},
+                "results": [result]}, args.output)
+    if not result["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Event-driven waiting helpers for the MQTT assignment tasks.
+
+Instead of sleeping for a fixed amount of time, the paho callbacks of a task
+signal protocol milestones (CONNACK, SUBACK, PUBACK/PUBCOMP and "N messages
+received") and the task blocks on them with a timeout. Every wait is timed so
+the run can report how long each exchange actually took.
+"""
+import threading
+import time
+from typing import Any, Iterable, List, NamedTuple, Optional
+from uuid import uuid4
+
+import paho.mqtt.client as mqtt
+
+import mqtt_output as out
+
+# Upper bound for any single protocol exchange against a local broker
+DEFAULT_TIMEOUT = 5.0
+
+# Assumed minimum delivery rate when scaling timeouts with message counts
+MIN_MESSAGES_PER_SECOND = 1000
+
+# Prefix used for drain fences so on_message handlers can recognise them
+FENCE_PREFIX = b"__fence__"
+
+
+class WaitRecord(NamedTuple):
+    """Outcome of a single timed wait."""
+    task: str
+    milestone: str
+    elapsed: float
+    completed: bool
+
+
+# All waits performed during the run, in the order they finished
+wait_records: List[WaitRecord] = []
+_records_lock = threading.Lock()
+
+
+def record_wait(task: str, milestone: str, start: float, completed: bool) -> bool:
+    """Store the duration of a wait that started at `start` (a perf_counter value)."""
+    elapsed = time.perf_counter() - start
+    with _records_lock:
+        wait_records.append(WaitRecord(task, milestone, elapsed, completed))
+    if not completed:
+        out.error(f"[{task}] Timed out after {elapsed:.3f}s waiting for {milestone}")
+    return completed
+
+
+def scaled_timeout(count: int, timeout: float = DEFAULT_TIMEOUT) -> float:
+    """Timeout for an exchange involving `count` messages."""
+    return timeout + count / MIN_MESSAGES_PER_SECOND
+
+
+def session_present(flags: Any) -> bool:
+    """The CONNACK session present flag as on_connect receives it."""
+    # Callback API v1 passes a dict keyed 'session present' (accept both
+    # spellings), v2 a ConnectFlags
+    if isinstance(flags, dict):
+        return bool(flags.get('session present', flags.get('session_present', False)))
+    return bool(flags.session_present)
+
+
+class CompletionTracker:
+    """
+    Collects protocol milestones for one client in one task.
+
+    The on_connect/on_subscribe/on_message callbacks report into the tracker
+    from paho's network thread; the task thread waits on it.
+    """
+
+    def __init__(self, task: str) -> None:
+        """
+        Args:
+            task: Name used when recording and reporting waits
+        """
+        self.task = task
+        self.rc: Optional[int] = None
+        self.session_present = False
+        self._connack = threading.Event()
+        self._suback = threading.Event()
+        self._messages = threading.Condition()
+        self._received = 0
+        self._fence: Optional[bytes] = None
+        self._fence_seen = threading.Event()
+
+    @property
+    def received(self) -> int:
+        """Number of (non-fence) messages seen since the tracker was created."""
+        with self._messages:
+            return self._received
+
+    def reset_connection(self) -> None:
+        """Forget CONNACK/SUBACK so a reconnect can be waited for again."""
+        self.rc = None
+        self.session_present = False
+        self._connack.clear()
+        self._suback.clear()
+
+    # --- Signals, called from paho callbacks ---
+
+    def connack_received(self, rc: Any, flags: Any) -> None:
+        """Record the CONNACK return code and session present flag."""
+        # Callback API v2 passes a ReasonCode, which compares equal to its value
+        self.rc = rc if isinstance(rc, int) else rc.value
+        self.session_present = session_present(flags)
+        self._connack.set()
+
+    def suback_received(self) -> None:
+        """Record that the broker confirmed a subscription."""
+        self._suback.set()
+
+    def is_fence(self, payload: bytes) -> bool:
+        """
+        Check whether an incoming payload is a drain fence.
+
+        Signals a pending drain() if it is the fence being waited for. Fences
+        are not readings, so on_message handlers should ignore them.
+        """
+        if not payload.startswith(FENCE_PREFIX):
+            return False
+        with self._messages:
+            if payload == self._fence:
+                self._fence_seen.set()
+        return True
+
+    def message_received(self) -> None:
+        """Count an incoming message, after the handler has stored it."""
+        with self._messages:
+            self._received += 1
+            self._messages.notify_all()
+
+    # --- Waits, called from the task thread ---
+
+    def wait_connack(self, timeout: float = DEFAULT_TIMEOUT) -> bool:
+        """Block until CONNACK arrives and was successful."""
+        start = time.perf_counter()
+        done = self._connack.wait(timeout) and self.rc == 0
+        return record_wait(self.task, "CONNACK", start, done)
+
+    def wait_suback(self, timeout: float = DEFAULT_TIMEOUT) -> bool:
+        """Block until the broker has acknowledged the subscription."""
+        start = time.perf_counter()
+        return record_wait(self.task, "SUBACK", start, self._suback.wait(timeout))
+
+    def wait_messages(self, count: int, timeout: float = DEFAULT_TIMEOUT) -> bool:
+        """Block until at least `count` messages were received in total."""
+        start = time.perf_counter()
+        with self._messages:
+            done = self._messages.wait_for(lambda: self._received >= count, timeout)
+        return record_wait(self.task, f"{count} message(s)", start, done)
+
+    def wait_published(self,
+                       infos: Iterable[mqtt.MQTTMessageInfo],
+                       timeout: float = DEFAULT_TIMEOUT) -> bool:
+        """
+        Block until every publish has completed its QoS flow.
+
+        For QoS 1 this is the PUBACK, for QoS 2 the PUBCOMP and for QoS 0 the
+        moment the packet was written to the socket.
+        """
+        start = time.perf_counter()
+        deadline = start + timeout
+        infos = list(infos)
+        done = True
+        for info in infos:
+            remaining = deadline - time.perf_counter()
+            try:
+                info.wait_for_publish(timeout=max(remaining, 0))
+            except (RuntimeError, ValueError):
+                pass
+            if not info.is_published():
+                done = False
+                break
+        return record_wait(self.task, f"{len(infos)} publish ack(s)", start, done)
+
+    def drain(self,
+              publisher: mqtt.Client,
+              topic: str,
+              qos: int = 1,
+              timeout: float = DEFAULT_TIMEOUT) -> bool:
+        """
+        Wait until everything queued for this subscriber has been delivered.
+
+        Publishes a unique fence message on `topic` and waits for it to come
+        back. The broker delivers a session's queued messages before newer
+        ones, so seeing the fence means the backlog (if any) is complete.
+        """
+        start = time.perf_counter()
+        with self._messages:
+            self._fence = FENCE_PREFIX + uuid4().hex.encode()
+            self._fence_seen.clear()
+        publisher.publish(topic, self._fence, qos=qos)
+        return record_wait(self.task, "drain fence", start, self._fence_seen.wait(timeout))
+
+
+def print_wait_report() -> None:
+    """Print how long every recorded wait actually took."""
+    with _records_lock:
+        records = list(wait_records)
+    if not records:
+        return
+
+    # Labels such as "aliases-5+aliases-pub" outgrow a fixed column
+    task_width = max(13, max(len(record.task) for record in records))
+    milestone_width = max(22, max(len(record.milestone) for record in records))
+    out.info("\n--- Wait Timings ---")
+    out.info(f"{'Task':<{task_width}} {'Milestone':<{milestone_width}} {'Elapsed (ms)':>12}  Status")
+    for record in records:
+        status = "ok" if record.completed else "TIMEOUT"
+        out.info(f"{record.task:<{task_width}} {record.milestone:<{milestone_width}} "
+                 f"{record.elapsed * 1000:>12.1f}  {status}")
+    total = sum(record.elapsed for record in records)
+    out.info(f"Total time spent waiting: {total:.3f}s")
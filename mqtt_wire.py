@@ -0,0 +1,231 @@
+"""
+Wire-level byte and packet accounting for paho clients.
+
+instrument() wraps a client's socket reads and writes and parses the byte
+streams just far enough to find packet boundaries (fixed header and
+remaining length), counting packets and bytes per MQTT packet type in each
+direction. Counts are kept per client ID and per scenario (task); a client
+shared by several tasks can be moved to the current one with
+set_scenario(). Instrumentation is off until enable() is called, so
+uninstrumented runs pay nothing.
+
+Usage:
+    mqtt_wire.enable()
+    client = mqtt_wire.instrument(create_client("publisher"), "task2")
+    ...
+    mqtt_wire.print_wire_report()
+    mqtt_wire.write_wire_report("wire.json")
+"""
+import json
+import threading
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+import paho.mqtt.client as mqtt
+
+import mqtt_output as out
+from mqtt_clients import require_paho
+from mqtt_packets import PACKET_NAMES
+
+# Meters wrap paho's private socket send and receive methods
+require_paho(__name__)
+
+_enabled = False
+
+
+def enable(enabled: bool = True) -> None:
+    """Turn instrumentation of newly created clients on or off."""
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class PacketCounts:
+    """Packets and bytes per packet type (indexed by the type number)."""
+    __slots__ = ("packets", "bytes")
+
+    def __init__(self) -> None:
+        self.packets = [0] * 16
+        self.bytes = [0] * 16
+
+    def add(self, other: "PacketCounts") -> None:
+        for packet_type in range(16):
+            self.packets[packet_type] += other.packets[packet_type]
+            self.bytes[packet_type] += other.bytes[packet_type]
+
+    @property
+    def total_packets(self) -> int:
+        return sum(self.packets)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self.bytes)
+
+    def as_dict(self) -> Dict[str, Dict[str, int]]:
+        return {PACKET_NAMES.get(packet_type, str(packet_type)):
+                {"packets": self.packets[packet_type], "bytes": self.bytes[packet_type]}
+                for packet_type in range(16) if self.packets[packet_type]}
+
+
+class _StreamParser:
+    """Finds packet boundaries in one direction of an MQTT byte stream."""
+    __slots__ = ("counts", "_type", "_header", "_length", "_shift", "_skip", "_in_length")
+
+    def __init__(self) -> None:
+        self.counts: Optional[PacketCounts] = None
+        self._type = 0
+        self._header = 0        # Fixed header bytes seen so far
+        self._length = 0
+        self._shift = 0
+        self._skip = 0          # Body bytes of the current packet still to come
+        self._in_length = False
+
+    def feed(self, data: Any) -> None:
+        pos, end = 0, len(data)
+        while pos < end:
+            if self._skip:
+                take = min(self._skip, end - pos)
+                self._skip -= take
+                pos += take
+            elif not self._in_length:
+                self._type = data[pos] >> 4
+                self._header, self._length, self._shift = 1, 0, 0
+                self._in_length = True
+                pos += 1
+            else:
+                byte = data[pos]
+                pos += 1
+                self._header += 1
+                self._length |= (byte & 0x7F) << self._shift
+                self._shift += 7
+                if not byte & 0x80:
+                    self._in_length = False
+                    self._skip = self._length
+                    counts = self.counts
+                    counts.packets[self._type] += 1
+                    counts.bytes[self._type] += self._header + self._length
+
+
+class WireMeter:
+    """Byte and packet counts of one client, split by scenario."""
+
+    def __init__(self, client_id: str, scenario: str) -> None:
+        self.client_id = client_id
+        self.counts: Dict[str, Tuple[PacketCounts, PacketCounts]] = {}
+        self._sent = _StreamParser()
+        self._received = _StreamParser()
+        self._send_lock = threading.Lock()
+        self.scenario = scenario
+
+    @property
+    def scenario(self) -> str:
+        return self._scenario
+
+    @scenario.setter
+    def scenario(self, scenario: str) -> None:
+        """Count traffic from now on under `scenario`."""
+        self._scenario = scenario
+        sent, received = self.counts.setdefault(scenario, (PacketCounts(), PacketCounts()))
+        self._sent.counts = sent
+        self._received.counts = received
+
+    def attach(self, client: mqtt.Client) -> None:
+        """Wrap the client's socket I/O; works before or after connect()."""
+        recv, send = client._sock_recv, client._sock_send
+
+        def counting_recv(bufsize: int) -> bytes:
+            data = recv(bufsize)
+            self._received.feed(data)
+            return data
+
+        def counting_send(buf: bytes) -> int:
+            sent = send(buf)
+            # publish() can write from the caller's thread as well as the loop's
+            with self._send_lock:
+                self._sent.feed(memoryview(buf)[:sent])
+            return sent
+
+        # paho has no public I/O hook; these per-instance overrides are the
+        # two methods all socket traffic goes through
+        client._sock_recv = counting_recv
+        client._sock_send = counting_send
+
+
+# All meters in creation order, and the meter of each instrumented client
+wire_meters: List[WireMeter] = []
+_client_meters: "weakref.WeakKeyDictionary[mqtt.Client, WireMeter]" = weakref.WeakKeyDictionary()
+_meters_lock = threading.Lock()
+
+
+def instrument(client: mqtt.Client, scenario: str) -> mqtt.Client:
+    """Count `client`'s traffic under `scenario` if instrumentation is enabled."""
+    if not _enabled:
+        return client
+    meter = WireMeter(client._client_id.decode(), scenario)
+    meter.attach(client)
+    with _meters_lock:
+        wire_meters.append(meter)
+        _client_meters[client] = meter
+    return client
+
+
+def set_scenario(client: mqtt.Client, scenario: str) -> None:
+    """Attribute `client`'s further traffic to `scenario` (no-op if not instrumented)."""
+    meter = _client_meters.get(client)
+    if meter is not None:
+        meter.scenario = scenario
+
+
+def _totals(key: str) -> Dict[str, Tuple[PacketCounts, PacketCounts]]:
+    """Sum the counts of every meter by scenario or by client ID."""
+    totals: Dict[str, Tuple[PacketCounts, PacketCounts]] = {}
+    with _meters_lock:
+        meters = list(wire_meters)
+    for meter in meters:
+        for scenario, (sent, received) in list(meter.counts.items()):
+            name = scenario if key == "scenario" else meter.client_id
+            total = totals.setdefault(name, (PacketCounts(), PacketCounts()))
+            total[0].add(sent)
+            total[1].add(received)
+    return totals
+
+
+def wire_report() -> Dict[str, Any]:
+    """Counts by scenario and by client, as a JSON-ready dict."""
+    return {
+        key + "s": {name: {"sent": sent.as_dict(), "received": received.as_dict(),
+                           "bytes": sent.total_bytes + received.total_bytes}
+                    for name, (sent, received) in _totals(key).items()}
+        for key in ("scenario", "client")
+    }
+
+
+def write_wire_report(path: str) -> None:
+    """Export wire_report() as JSON."""
+    with open(path, "w") as f:
+        json.dump(wire_report(), f, indent=2)
+        f.write("\n")
+
+
+def print_wire_report() -> None:
+    """Print packets and bytes per packet type for every scenario."""
+    totals = _totals("scenario")
+    if not totals:
+        return
+    out.info("\n--- Wire Traffic (client side) ---")
+    out.info(f"{'Scenario':<13} {'Packet':<11} {'Sent':>7} {'Bytes':>9} "
+             f"{'Received':>9} {'Bytes':>9}")
+    for scenario, (sent, received) in sorted(totals.items()):
+        if not sent.total_packets and not received.total_packets:
+            continue
+        for packet_type in range(16):
+            if not sent.packets[packet_type] and not received.packets[packet_type]:
+                continue
+            out.info(f"{scenario:<13} {PACKET_NAMES.get(packet_type, str(packet_type)):<11} "
+                     f"{sent.packets[packet_type]:>7} {sent.bytes[packet_type]:>9} "
+                     f"{received.packets[packet_type]:>9} {received.bytes[packet_type]:>9}")
+        out.info(f"{scenario:<13} {'total':<11} {sent.total_packets:>7} {sent.total_bytes:>9} "
+                 f"{received.total_packets:>9} {received.total_bytes:>9}")